@@ -0,0 +1,97 @@
+"""Pivot benchmarks: NumPy aggregation kernel vs the pandas groupby path, the
+dense crosstab vs pandas.pivot_table, the process-pool pivot vs serial, and
+sketched (approximate) Distinct Count / Median vs exact.
+
+    python benchmarks/bench_pivot.py [rows]
+
+Builds a synthetic master shaped like a UDISE extract (string District /
+Block / Management keys, int8-downcast enrollment columns), checks that both
+paths agree and prints the best of three timings for each pivot.
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from udise_workers import load_helpers  # noqa: E402
+
+
+def make_master(app, n_rows):
+    rng = np.random.default_rng(0)
+    data = {
+        "District": rng.choice([f"District {i:02d}" for i in range(38)], n_rows),
+        "Block": rng.choice([f"Block {i:03d}" for i in range(413)], n_rows),
+        "Management": rng.choice(["Government", "Aided", "Private", "Central"], n_rows),
+    }
+    data["UDISE"] = rng.integers(0, n_rows // 2, n_rows).astype(str)
+    for i in range(1, 13):
+        data[f"Class{i}_Boys"] = rng.integers(0, 120, n_rows).astype(str)
+        data[f"Class{i}_Girls"] = rng.integers(0, 120, n_rows).astype(str)
+    return app.prepare_master(pd.DataFrame(data))
+
+
+def best_of(fn, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    app = load_helpers()
+    master = make_master(app, n_rows)
+    # Text keys, as in an ad hoc view that was not typed at load
+    master = master.astype({"District": object, "Block": object, "Management": object})
+
+    cases = {
+        "Sum x24 by District": (["District"], {c: "Sum" for c in master.columns[4:]}),
+        "Sum/Avg/Min/Max by District, Block": (["District", "Block"], {
+            "Class1_Boys": "Sum", "Class1_Girls": "Average", "Class2_Boys": "Min", "Class2_Girls": "Max"}),
+        "Count + Distinct by Block, Management": (["Block", "Management"], {
+            "Class1_Boys": "Count", "Class3_Girls": "Distinct Count"}),
+    }
+    print(f"{n_rows:,} rows")
+    for name, (rows, agg_map) in cases.items():
+        pd.testing.assert_frame_equal(app.pivot_scan(master, rows, agg_map),
+                                      app.pivot_scan(master, rows, agg_map, use_kernel=False))
+        kernel = best_of(lambda: app.pivot_scan(master, rows, agg_map))
+        pandas = best_of(lambda: app.pivot_scan(master, rows, agg_map, use_kernel=False))
+        print(f"  {name:<40} kernel {kernel * 1000:8.1f} ms   pandas {pandas * 1000:8.1f} ms   "
+              f"x{pandas / kernel:.1f}")
+
+    # District x Management x 12 classes, with row and column totals
+    agg_map = {f"Class{i}_Boys": "Sum" for i in range(1, 13)}
+    crosstab = best_of(lambda: app.pivot_crosstab(master, ["District"], "Management", agg_map))
+    pivot_table = best_of(lambda: pd.pivot_table(master, index="District", columns="Management", values=list(agg_map),
+                                                 aggfunc="sum", margins=True))
+    print(f"  {'Crosstab District x Management x 12':<40} dense  {crosstab * 1000:8.1f} ms   "
+          f"pivot_table {pivot_table * 1000:8.1f} ms   x{pivot_table / crosstab:.1f}")
+
+    # Every aggregation over the master as typed at load, serial vs row shards
+    # on one process per core
+    master = make_master(app, n_rows)
+    workers = os.cpu_count() or 1
+    agg_map = dict(zip(master.columns[4:], ["Sum", "Count", "Distinct Count", "Average", "Min", "Max",
+                                            "Median", "Std Dev", "First", "Last"]))
+    with app.worker_pool(workers) as pool:
+        parallel = best_of(lambda: app.pivot_parallel(master, ["District", "Block"], agg_map, pool, workers))
+    serial = best_of(lambda: app.pivot_scan(master, ["District", "Block"], agg_map))
+    print(f"  {f'All aggregations, {workers} workers':<40} shards {parallel * 1000:8.1f} ms   "
+          f"serial {serial * 1000:8.1f} ms   x{serial / parallel:.1f}")
+
+    # Distinct UDISE codes and median enrollment per Block, sketched vs exact
+    agg_map = {"UDISE": "Distinct Count", "Class1_Boys": "Median"}
+    sketched = best_of(lambda: app.pivot_sketched(master, ["Block"], agg_map))
+    exact = best_of(lambda: app.pivot_scan(master, ["Block"], agg_map))
+    print(f"  {'Distinct + Median by Block':<40} sketch {sketched * 1000:8.1f} ms   "
+          f"exact {exact * 1000:8.1f} ms   x{exact / sketched:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,12 +4,41 @@ import pandas as pd
 import numpy as np
 import os
 import re
+import ast
+import functools
+import graphlib
+import itertools
+import json
+import pickle
+import time
+import hashlib
+import threading
+import zipfile
 import requests
+import udise_workers
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
 from io import BytesIO
-from typing import List
+from typing import Dict, List
 from openpyxl import Workbook
 from openpyxl.styles import Font, PatternFill, Border, Side, Alignment
-from openpyxl.utils.dataframe import dataframe_to_rows
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.formatting.rule import FormulaRule
+from openpyxl.utils import get_column_letter
+from pandas.api.types import is_bool_dtype, is_float_dtype, is_integer_dtype, is_numeric_dtype
+
+try:
+    import pyarrow.feather as feather
+except ImportError:  # snapshots are skipped without pyarrow
+    feather = None
+
+# Masters are shared read-only between sessions; with Copy-on-Write a session's
+# working frame shares their column buffers until it writes to them (always on
+# from pandas 3).
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # PAGE CONFIG & CUSTOM STYLING
@@ -379,26 +408,38 @@ st.markdown("""
 # HELPER FUNCTIONS
 # ═══════════════════════════════════════════════════════════════════════════════
 
+def as_numeric(series: pd.Series) -> pd.Series:
+    """Numeric values of a column with gaps as 0.
+
+    Columns typed at load are only widened to 64 bits (so arithmetic on the
+    downcast storage cannot overflow); text columns are parsed.
+    """
+    if is_bool_dtype(series) or is_integer_dtype(series):
+        return (series.fillna(0) if series.hasnans else series).astype("int64")
+    if is_float_dtype(series):
+        return series.astype("float64").fillna(0)
+    return pd.to_numeric(series, errors="coerce").fillna(0)
+
 def safe_numeric_sum(df: pd.DataFrame, cols: List[str]) -> pd.Series:
     """Sum columns coercing missing / non-numeric to 0."""
-    series_list = []
+    total = pd.Series(0, index=df.index, dtype="int64")
     for c in cols:
         if c in df.columns:
-            series_list.append(pd.to_numeric(df[c], errors="coerce").fillna(0))
-        else:
-            series_list.append(pd.Series([0] * len(df), index=df.index))
-    if not series_list:
-        return pd.Series([0] * len(df), index=df.index)
-    return sum(series_list)
+            total = total + as_numeric(df[c])
+    return total
+
+EXCEL_CHUNK_ROWS = 10_000
 
 def to_excel_bytes_styled(df: pd.DataFrame, header_fill_color="6366f1") -> bytes:
-    """Write df to an excel file in-memory with header styling."""
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "UDISE_Extract"
+    """Write df to an excel file in-memory with header styling.
 
-    for r in dataframe_to_rows(df, index=False, header=True):
-        ws.append(r)
+    Uses openpyxl's write-only (streaming) mode: rows are converted and
+    written in chunks, data borders come from a single conditional format
+    over the data range, and column widths are sized from vectorized string
+    lengths - so cost stays linear and memory bounded for large exports.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("UDISE_Extract")
 
     thin = Side(border_style="thin", color="000000")
     border = Border(left=thin, right=thin, top=thin, bottom=thin)
@@ -406,32 +447,84 @@ def to_excel_bytes_styled(df: pd.DataFrame, header_fill_color="6366f1") -> bytes
     header_fill = PatternFill(start_color=header_fill_color, end_color=header_fill_color, fill_type="solid")
     center = Alignment(horizontal="center", vertical="center", wrap_text=True)
 
-    for cell in ws[1]:
+    # Column widths must be set before any row is streamed out
+    for idx, col in enumerate(df.columns, start=1):
+        values = df.iloc[:, idx - 1]
+        max_length = len(str(col))
+        lengths = values.astype(str).where(values.notna(), "").str.len()
+        if len(lengths) and pd.notna(lengths.max()):
+            max_length = max(max_length, int(lengths.max()))
+        ws.column_dimensions[get_column_letter(idx)].width = min(50, max(10, max_length + 2))
+
+    header = []
+    for col in df.columns:
+        cell = WriteOnlyCell(ws, value=str(col))
         cell.font = header_font
         cell.fill = header_fill
         cell.border = border
         cell.alignment = center
-
-    for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=1, max_col=ws.max_column):
-        for cell in row:
-            cell.border = border
-
-    for col in ws.columns:
-        max_length = 0
-        column = col[0].column_letter
-        for cell in col:
-            try:
-                val = str(cell.value) if cell.value else ""
-            except:
-                val = ""
-            max_length = max(max_length, len(val))
-        ws.column_dimensions[column].width = min(50, max(10, max_length + 2))
+        header.append(cell)
+    ws.append(header)
+
+    for start in range(0, len(df), EXCEL_CHUNK_ROWS):
+        chunk = df.iloc[start:start + EXCEL_CHUNK_ROWS]
+        columns = [chunk.iloc[:, i].astype(object).where(chunk.iloc[:, i].notna(), None).tolist()
+                   for i in range(chunk.shape[1])]
+        for row in zip(*columns):
+            ws.append(row)
+
+    if len(df) and len(df.columns):
+        data_range = f"A2:{get_column_letter(len(df.columns))}{len(df) + 1}"
+        if SUBTOTAL_COLUMN in df.columns:
+            # Subtotal / grand-total rows of a grouping-sets pivot are highlighted
+            marker = get_column_letter(df.columns.get_loc(SUBTOTAL_COLUMN) + 1)
+            ws.conditional_formatting.add(data_range, FormulaRule(
+                formula=[f'${marker}2<>"Detail"'], font=Font(bold=True), border=border,
+                fill=PatternFill(start_color="E0E7FF", end_color="E0E7FF", fill_type="solid"), stopIfTrue=True))
+        ws.conditional_formatting.add(data_range, FormulaRule(formula=["TRUE"], border=border))
 
     stream = BytesIO()
     wb.save(stream)
     stream.seek(0)
     return stream.read()
 
+def to_csv_bytes(df: pd.DataFrame) -> bytes:
+    """Encode df as a UTF-8 CSV without the index."""
+    return df.to_csv(index=False).encode("utf-8")
+
+DOWNLOAD_BUILDERS = {"xlsx": to_excel_bytes_styled, "csv": to_csv_bytes}
+
+def download_store(state, slot: str, result) -> dict:
+    """Return the payload store of a result slot, resetting it when the result changes.
+
+    result is a frame or a dict of frames; its fingerprint is taken from
+    attrs (set when the result is built) so reruns never re-hash it.
+    """
+    frames = result.values() if isinstance(result, dict) else [result]
+    fingerprint = "|".join(f.attrs.get("fingerprint") or dataset_fingerprint(f) for f in frames)
+    store = state.get(slot)
+    if store is None or store["fingerprint"] != fingerprint:
+        store = {"fingerprint": fingerprint, "payloads": {}, "lock": threading.Lock()}
+        state[slot] = store
+    return store
+
+def lazy_payload(store: dict, df: pd.DataFrame, fmt: str, key: str = ""):
+    """Return a zero-argument builder for df's download payload, memoized in store.
+
+    Passed as ``data=`` to st.download_button so the file is only serialized
+    when the button is clicked, and at most once per result and format.
+    """
+    def build() -> bytes:
+        with store["lock"]:
+            payload = store["payloads"].get((key, fmt))
+            if payload is None:
+                payload = store["payloads"][(key, fmt)] = DOWNLOAD_BUILDERS[fmt](df)
+            return payload
+    return build
+
+UDISE_CANDIDATES = ["UDISE", "UDISE Code", "UDISE_Code", "udise", "udise_code", "UDISECODE"]
+SCHOOL_NAME_CANDIDATES = ["School_Name", "School Name", "SchoolName", "school_name", "SCHOOL_NAME", "Name"]
+
 def find_column(df, candidates):
     """Find first matching column from candidates list."""
     for c in candidates:
@@ -439,42 +532,138 @@ def find_column(df, candidates):
             return c
     return None
 
-def get_numeric_columns(df):
-    """Get list of columns that can be converted to numeric."""
-    numeric_cols = []
+def build_udise_index(series: pd.Series) -> dict:
+    """Hash index of code -> row positions; repeated codes keep all their rows.
+
+    Codes are matched as text (leading zeros count), less any float ".0" suffix.
+    """
+    codes, uniques = pd.factorize(series.astype(str).str.strip().str.replace(r"\.0*$", "", regex=True))
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    keys = pd.Index(uniques)
+    keys.get_indexer(keys[:1])  # builds the hash table now instead of on first lookup
+    return {
+        "keys": keys,
+        "order": np.argsort(codes, kind="stable"),
+        "offsets": (codes < 0).sum() + np.concatenate([[0], np.cumsum(counts)])[:-1],
+        "counts": counts,
+    }
+
+def lookup_udise(index: dict, codes: List[str]):
+    """Resolve codes in the given order.
+
+    Returns (row positions in entered order, repeated codes, unknown codes);
+    a code entered twice contributes its rows once.
+    """
+    entered = pd.Series(codes, dtype=object).str.strip().str.replace(r"\.0*$", "", regex=True)
+    repeated = entered.duplicated()
+    duplicates = entered[repeated].unique().tolist()
+    wanted = entered[~repeated].to_numpy()
+
+    key_pos = index["keys"].get_indexer(pd.Index(wanted, dtype=index["keys"].dtype))
+    unknown = wanted[key_pos < 0].tolist()
+    found = key_pos[key_pos >= 0]
+
+    # Gather each code's slice of "order" back to back, preserving entry order
+    lengths = index["counts"][found]
+    starts = np.repeat(index["offsets"][found] - (np.cumsum(lengths) - lengths), lengths)
+    rows = index["order"][starts + np.arange(lengths.sum())]
+    return rows, duplicates, unknown
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def get_udise_index(fingerprint: str, column: str, _df) -> dict:
+    """UDISE index built once per dataset and column, shared by all sessions."""
+    return build_udise_index(_df[column])
+
+def read_code_list(uploaded_file) -> List[str]:
+    """Codes from an uploaded TXT (one per line / comma separated) or CSV / Excel file.
+
+    Tables use their UDISE column when one is recognised, else the first column.
+    """
+    if uploaded_file.name.lower().endswith(".txt"):
+        return parse_udise_codes(uploaded_file.getvalue().decode("utf-8-sig"))
+    table = read_table(uploaded_file, uploaded_file.name)
+    table.columns = table.columns.str.strip()
+    code_col = find_column(table, UDISE_CANDIDATES) or table.columns[0]
+    return [c for c in table[code_col].dropna().astype(str).str.strip() if c]
+
+def build_column_profile(df, top_n: int = 5) -> Dict[str, dict]:
+    """Profile every column once: dtype, numeric-ness, cardinality, nulls, range, top values."""
+    profile = {}
     for c in df.columns:
-        tmp = pd.to_numeric(df[c], errors="coerce")
-        if not tmp.isnull().all():
-            numeric_cols.append(c)
-    return numeric_cols
+        series = df[c]
+        numeric = is_numeric_dtype(series) and not is_bool_dtype(series)
+        counts = series.value_counts()
+        profile[c] = {
+            "dtype": str(series.dtype),
+            "numeric": numeric,
+            "n_unique": int((counts > 0).sum()),
+            "n_null": int(series.isna().sum()),
+            "min": series.min() if numeric and series.notna().any() else None,
+            "max": series.max() if numeric and series.notna().any() else None,
+            "top_values": [str(v) for v in counts.index[:top_n]],
+        }
+    return profile
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def get_column_profile(fingerprint: str, _df) -> Dict[str, dict]:
+    """Column profile computed once per dataset fingerprint and shared by all sessions."""
+    return build_column_profile(_df)
+
+def get_numeric_columns(df, profile=None):
+    """Get list of numeric columns, from the column profile where it covers them."""
+    profile = profile or {}
+    return [c for c in df.columns
+            if (profile[c]["numeric"] if c in profile else is_numeric_dtype(df[c]) and not is_bool_dtype(df[c]))]
+
+# Class-wise enrollment is held as one int32 block of shape (schools, 12, 3):
+# axis 1 is the class (1-12), axis 2 the gender in CLASS_GENDERS order. Totals,
+# grade bands and gender splits are single reductions over that block.
+CLASS_GENDERS = ("Boys", "Girls", "Transgen")
+CLASS_COLUMN_PATTERN = re.compile(r"(?i)^Class(\d+)_(Boys|Girls|Transgen)$")
+GRADE_BANDS = {"Enrollment_1_5": (1, 5), "Enrollment_6_8": (6, 8),
+               "Enrollment_9_10": (9, 10), "Enrollment_11_12": (11, 12)}
+ENROLLMENT_PRESET_NAMES = list(GRADE_BANDS) + ["Total_Enrollment"] + \
+    [f"Total_{g}" for g in CLASS_GENDERS] + [f"{g}_Share" for g in CLASS_GENDERS]
+
+def build_enrollment_tensor(target_df) -> np.ndarray:
+    """Stack the Class{i}_{Boys,Girls,Transgen} columns into an int32 (schools, 12, 3) array.
+
+    Missing columns count as 0.
+    """
+    tensor = np.zeros((len(target_df), 12, len(CLASS_GENDERS)), dtype=np.int32)
+    for col in target_df.columns:
+        match = CLASS_COLUMN_PATTERN.match(col)
+        if match and 1 <= int(match.group(1)) <= 12:
+            gender = [g.lower() for g in CLASS_GENDERS].index(match.group(2).lower())
+            tensor[:, int(match.group(1)) - 1, gender] = as_numeric(target_df[col]).to_numpy()
+    return tensor
 
-def build_class_totals(target_df):
+def build_class_totals(target_df, tensor=None):
     """Create Class1_Total ... Class12_Total in the given dataframe."""
     for col in target_df.columns:
-        if re.match(r"(?i)^Class\d+_(Boys|Girls|Transgen)$", col):
-            target_df[col] = pd.to_numeric(target_df[col], errors="coerce").fillna(0)
+        if CLASS_COLUMN_PATTERN.match(col) and not is_numeric_dtype(target_df[col]):
+            target_df[col] = as_numeric(target_df[col])
 
-    created = []
-    for i in range(1, 13):
-        members = [f"Class{i}_Boys", f"Class{i}_Girls", f"Class{i}_Transgen"]
-        target_df[f"Class{i}_Total"] = safe_numeric_sum(target_df, members)
-        created.append(f"Class{i}_Total")
+    tensor = build_enrollment_tensor(target_df) if tensor is None else tensor
+    created = [f"Class{i}_Total" for i in range(1, 13)]
+    target_df[created] = tensor.sum(axis=2, dtype=np.int64)
     return created
 
-def build_enrollment_presets(target_df):
-    """Create Enrollment aggregations."""
-    for i in range(1, 13):
-        if f"Class{i}_Total" not in target_df.columns:
-            members = [f"Class{i}_Boys", f"Class{i}_Girls", f"Class{i}_Transgen"]
-            target_df[f"Class{i}_Total"] = safe_numeric_sum(target_df, members)
-
-    target_df["Enrollment_1_5"] = safe_numeric_sum(target_df, [f"Class{i}_Total" for i in range(1, 6)])
-    target_df["Enrollment_6_8"] = safe_numeric_sum(target_df, [f"Class{i}_Total" for i in range(6, 9)])
-    target_df["Enrollment_9_10"] = safe_numeric_sum(target_df, [f"Class{i}_Total" for i in range(9, 11)])
-    target_df["Enrollment_11_12"] = safe_numeric_sum(target_df, [f"Class{i}_Total" for i in range(11, 13)])
-    target_df["Total_Enrollment"] = safe_numeric_sum(target_df, [f"Class{i}_Total" for i in range(1, 13)])
-
-    return ["Enrollment_1_5", "Enrollment_6_8", "Enrollment_9_10", "Enrollment_11_12", "Total_Enrollment"]
+def build_enrollment_presets(target_df, tensor=None):
+    """Create Enrollment aggregations: grade bands, totals and gender splits."""
+    tensor = build_enrollment_tensor(target_df) if tensor is None else tensor
+    class_totals = tensor.sum(axis=2, dtype=np.int64)
+    band_starts = [first - 1 for first, _ in GRADE_BANDS.values()]
+    total = class_totals.sum(axis=1)
+    by_gender = tensor.sum(axis=1, dtype=np.int64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shares = np.where(total[:, None] > 0, by_gender * 100.0 / total[:, None], 0.0).round(2)
+
+    target_df[list(GRADE_BANDS)] = np.add.reduceat(class_totals, band_starts, axis=1)
+    target_df["Total_Enrollment"] = total
+    target_df[[f"Total_{g}" for g in CLASS_GENDERS]] = by_gender
+    target_df[[f"{g}_Share" for g in CLASS_GENDERS]] = shares
+    return list(ENROLLMENT_PRESET_NAMES)
 
 def create_demo_data():
     """Create sample demo data for new users."""
@@ -508,6 +697,2255 @@ def create_demo_data():
 
     return pd.DataFrame(data)
 
+def read_table(source, name: str) -> pd.DataFrame:
+    """Read a CSV / XLS / XLSX source (path, buffer or upload) as strings."""
+    name = name.lower()
+    if name.endswith(".csv"):
+        return pd.read_csv(source, dtype=str)
+    elif name.endswith(".xls"):
+        return pd.read_excel(source, engine="xlrd", dtype=str)
+    return pd.read_excel(source, engine="openpyxl", dtype=str)
+
+# Schema inference: text that is entirely numeric becomes the smallest integer
+# dtype (nullable Int8/Int16/... when it has gaps, float64 for fractions);
+# repetitive text becomes categorical. Identifier-like columns (UDISE, codes, phone numbers) stay text
+# so that leading digits and matching by string keep working.
+CATEGORY_MAX_UNIQUE = 1000
+ID_COLUMN_PATTERN = re.compile(r"(?i)(udise|code|^id$|_id$|pin|phone|mobile)")
+
+def _downcast_numeric(values: pd.Series):
+    """Return (series, kind) using the smallest dtype that holds values exactly."""
+    present = values.dropna()
+    if present.empty or not (present % 1 == 0).all():
+        return values.astype("float64"), "float"
+    smallest = pd.to_numeric(present.astype("int64"), downcast="integer").dtype
+    if len(present) == len(values):
+        return values.astype(smallest), "int"
+    # Integral with gaps: nullable Int keeps "13" from turning into "13.0"
+    return values.astype(smallest.name.capitalize()), "int"
+
+def infer_schema(target_df) -> Dict[str, str]:
+    """Type every column once at load (in place) and return {column: kind}.
+
+    kind is one of "int", "float", "category" or "text".
+    """
+    schema = {}
+    n_rows = len(target_df)
+    for col in target_df.columns:
+        series = target_df[col]
+        values = None
+        if is_numeric_dtype(series) and not is_bool_dtype(series):
+            values = series
+        elif re.match(r"(?i)^Class\d+_(Boys|Girls|Transgen)$", col):
+            values = pd.to_numeric(series, errors="coerce").fillna(0)
+        elif ID_COLUMN_PATTERN.search(col):
+            schema[col] = "text"
+            continue
+        else:
+            present = series.dropna()
+            if not present.empty:
+                parsed = pd.to_numeric(present, errors="coerce")
+                if parsed.notna().all() and not present.astype(str).str.match(r"^0\d").any():
+                    values = pd.to_numeric(series, errors="coerce")
+
+        if values is not None:
+            target_df[col], schema[col] = _downcast_numeric(values)
+            continue
+
+        unique_count = series.nunique()
+        if 0 < unique_count <= CATEGORY_MAX_UNIQUE and unique_count < 0.5 * n_rows:
+            target_df[col] = series.astype("category")
+            schema[col] = "category"
+        else:
+            schema[col] = "text"
+    return schema
+
+def dataset_fingerprint(target_df) -> str:
+    """Content hash of a frame, used to key per-dataset indexes and caches."""
+    digest = hashlib.sha1(pd.util.hash_pandas_object(target_df, index=False).to_numpy().tobytes())
+    digest.update("|".join(map(str, target_df.columns)).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+def prepare_master(target_df):
+    """Strip column names, infer column types and fingerprint the data (in place)."""
+    target_df.columns = target_df.columns.str.strip()
+    target_df.attrs["schema"] = infer_schema(target_df)
+    target_df.attrs["fingerprint"] = dataset_fingerprint(target_df)
+    return target_df
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# MASTER DATA CACHE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+# Downloaded masters live here together with their ETag / Last-Modified headers.
+# Within MASTER_CACHE_TTL seconds the disk copy is used without touching the
+# network; after that it is revalidated with a conditional GET (304 = reuse).
+MASTER_CACHE_DIR = os.environ.get("UDISE_CACHE_DIR", ".udise_cache")
+MASTER_CACHE_TTL = int(os.environ.get("UDISE_MASTER_TTL", "300"))
+
+def _cache_paths(url: str, cache_dir: str):
+    """Return (body_path, meta_path) of the disk cache entry for url."""
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+    ext = os.path.splitext(url.split("?")[0])[1].lower() or ".bin"
+    return os.path.join(cache_dir, f"{key}{ext}"), os.path.join(cache_dir, f"{key}.json")
+
+def _write_atomic(path: str, payload: bytes):
+    """Write payload to path via a temp file so readers never see a partial file."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as fh:
+        fh.write(payload)
+    os.replace(tmp_path, path)
+
+def fetch_master_cached(url: str, cache_dir: str = MASTER_CACHE_DIR,
+                        ttl: int = MASTER_CACHE_TTL, timeout: int = 10):
+    """Return (path, meta) of a local copy of url, revalidated with a conditional GET.
+
+    meta holds the validators (etag / last_modified) plus fetched_at and
+    checked_at timestamps. Errors propagate to the caller.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    body_path, meta_path = _cache_paths(url, cache_dir)
+
+    meta = {}
+    if os.path.exists(body_path) and os.path.exists(meta_path):
+        try:
+            with open(meta_path, "r", encoding="utf-8") as fh:
+                meta = json.load(fh)
+        except (OSError, ValueError):
+            meta = {}
+
+    if meta and time.time() - meta.get("checked_at", 0) < ttl:
+        return body_path, meta
+
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+
+    response = requests.get(url, headers=headers, timeout=timeout)
+    if response.status_code == 304 and meta:
+        meta["checked_at"] = time.time()
+    elif response.status_code == 200:
+        _write_atomic(body_path, response.content)
+        now = time.time()
+        meta = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "size": len(response.content),
+            "fetched_at": now,
+            "checked_at": now,
+        }
+    else:
+        raise RuntimeError(f"Master download failed with HTTP {response.status_code}")
+
+    _write_atomic(meta_path, json.dumps(meta).encode("utf-8"))
+    return body_path, meta
+
+def _master_version(meta) -> str:
+    """Identify a downloaded master by its validators, falling back to fetch time."""
+    return meta.get("etag") or meta.get("last_modified") or str(meta.get("fetched_at"))
+
+@st.cache_resource(show_spinner=False)
+def _online_master_store(url: str):
+    """Process-wide slot holding the last good parsed master for url."""
+    return {
+        "lock": threading.Lock(),
+        "load_lock": threading.Lock(),  # serializes cold-start loads
+        "frame": None,
+        "meta": None,
+        "version": None,
+        "refreshing": False,
+        "attempted_at": 0.0,
+        "error": None,
+    }
+
+def _refresh_online_master(url: str, store):
+    """Revalidate url and swap a newly parsed frame into store (runs in a thread)."""
+    try:
+        path, meta = fetch_master_cached(url)
+        version = _master_version(meta)
+        frame = store["frame"]
+        if frame is None or version != store["version"]:
+            frame = load_master_snapshot(path)
+        with store["lock"]:
+            store["frame"], store["meta"], store["version"] = frame, meta, version
+            store["error"] = None
+    except Exception as e:
+        with store["lock"]:
+            store["error"] = str(e)
+    finally:
+        with store["lock"]:
+            store["refreshing"] = False
+
+def load_online_master(url: str, ttl: int = MASTER_CACHE_TTL):
+    """Return (frame, info) for the online master without waiting on the network.
+
+    The last good snapshot (in memory, else on disk) is served at once and a
+    background thread revalidates it once it is older than ttl. Only the very
+    first load, with nothing cached anywhere, blocks on the download. The frame
+    is shared across sessions and must not be mutated.
+    """
+    store = _online_master_store(url)
+
+    if store["frame"] is None:
+        # One session loads; concurrent cold-start sessions wait here and then
+        # reuse its frame (or its recent failure) instead of downloading again.
+        with store["load_lock"]:
+            if store["frame"] is None:
+                body_path, meta_path = _cache_paths(url, MASTER_CACHE_DIR)
+                try:
+                    with open(meta_path, "r", encoding="utf-8") as fh:
+                        meta = json.load(fh)
+                    frame = load_master_snapshot(body_path)
+                    with store["lock"]:
+                        store["frame"], store["meta"], store["version"] = frame, meta, _master_version(meta)
+                except (OSError, ValueError):
+                    pass
+            recently_failed = store["error"] and time.time() - store["attempted_at"] < ttl
+            if store["frame"] is None and not recently_failed:
+                with store["lock"]:
+                    store["refreshing"] = True
+                    store["attempted_at"] = time.time()
+                _refresh_online_master(url, store)
+        if store["frame"] is None:
+            raise RuntimeError(store["error"] or "Master could not be loaded")
+
+    with store["lock"]:
+        frame, meta = store["frame"], store["meta"]
+        last_check = max(meta.get("checked_at", 0), store["attempted_at"])
+        if not store["refreshing"] and time.time() - last_check >= ttl:
+            store["refreshing"] = True
+            store["attempted_at"] = time.time()
+            threading.Thread(target=_refresh_online_master, args=(url, store), daemon=True).start()
+        info = dict(meta, refreshing=store["refreshing"], error=store["error"])
+    return frame, info
+
+def format_age(seconds: float) -> str:
+    """Human readable age such as '45s', '12 min' or '3 h'."""
+    if seconds < 60:
+        return f"{int(seconds)}s"
+    if seconds < 3600:
+        return f"{int(seconds // 60)} min"
+    if seconds < 172800:
+        return f"{int(seconds // 3600)} h"
+    return f"{int(seconds // 86400)} days"
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# COLUMNAR SNAPSHOTS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+# Parsed masters are saved as uncompressed Feather files so later loads can
+# memory-map them instead of re-parsing Excel/CSV. A snapshot is reused while
+# the source's mtime and size are unchanged; if only the mtime moved, the
+# content hash decides whether it must be rebuilt.
+SNAPSHOT_DIR = os.path.join(MASTER_CACHE_DIR, "snapshots")
+SNAPSHOT_FORMAT = 5  # bump when prepare_master changes what a snapshot holds
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    """Stream a file through SHA-256."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def snapshot_paths(path: str, snapshot_dir: str = SNAPSHOT_DIR):
+    """Return the (feather, meta) paths of the snapshot for a source file."""
+    key = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(snapshot_dir, f"{key}.feather"), os.path.join(snapshot_dir, f"{key}.json")
+
+def load_master_snapshot(path: str, snapshot_dir: str = SNAPSHOT_DIR) -> pd.DataFrame:
+    """Return the prepared master for path, from its Feather snapshot when current."""
+    if feather is None:
+        return prepare_master(read_table(path, path))
+
+    abs_path = os.path.abspath(path)
+    snap_path, meta_path = snapshot_paths(abs_path, snapshot_dir)
+    stat = os.stat(abs_path)
+
+    meta = {}
+    if os.path.exists(snap_path) and os.path.exists(meta_path):
+        try:
+            with open(meta_path, "r", encoding="utf-8") as fh:
+                meta = json.load(fh)
+        except (OSError, ValueError):
+            meta = {}
+
+    if meta.get("format") == SNAPSHOT_FORMAT and meta.get("size") == stat.st_size:
+        current = meta.get("mtime") == stat.st_mtime
+        if not current and meta.get("sha256") == file_sha256(abs_path):
+            meta["mtime"] = stat.st_mtime
+            _write_atomic(meta_path, json.dumps(meta).encode("utf-8"))
+            current = True
+        if current:
+            try:
+                df_snap = feather.read_table(snap_path, memory_map=True).to_pandas()
+                df_snap.attrs["schema"] = meta.get("schema", {})
+                df_snap.attrs["fingerprint"] = meta.get("fingerprint")
+                return df_snap
+            except Exception:
+                pass
+
+    df_snap = prepare_master(read_table(abs_path, abs_path))
+    try:
+        os.makedirs(snapshot_dir, exist_ok=True)
+        tmp_path = f"{snap_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        feather.write_feather(df_snap.reset_index(drop=True), tmp_path, compression="uncompressed")
+        os.replace(tmp_path, snap_path)
+        meta = {"format": SNAPSHOT_FORMAT, "path": abs_path, "mtime": stat.st_mtime,
+                "size": stat.st_size, "sha256": file_sha256(abs_path),
+                "schema": df_snap.attrs.get("schema", {}),
+                "fingerprint": df_snap.attrs.get("fingerprint"), "created_at": time.time()}
+        _write_atomic(meta_path, json.dumps(meta).encode("utf-8"))
+    except Exception:
+        # A snapshot is only an accelerator - never fail the load because of it
+        pass
+    return df_snap
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def _shared_master(abs_path: str, mtime: float, size: int) -> pd.DataFrame:
+    """One prepared frame per file version, shared by every session."""
+    return load_master_snapshot(abs_path)
+
+def load_shared_master(path: str) -> pd.DataFrame:
+    """Return the process-wide, read-only master frame for a file on disk."""
+    abs_path = os.path.abspath(path)
+    stat = os.stat(abs_path)
+    return _shared_master(abs_path, stat.st_mtime, stat.st_size)
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# STREAMING INGESTION
+# ═══════════════════════════════════════════════════════════════════════════════
+
+# Very large CSV masters are read in chunks with the filters, UDISE list and
+# column projection applied to each chunk, so only the rows and columns that
+# are actually needed are ever held in memory.
+STREAM_CHUNK_ROWS = 100_000
+
+# Spooled uploads (and their snapshots) are kept as a small LRU: the most
+# recently used files stay on disk, older ones are removed once either limit
+# is exceeded.
+UPLOAD_CACHE_MAX_FILES = int(os.environ.get("UDISE_UPLOAD_CACHE_FILES", "8"))
+UPLOAD_CACHE_MAX_BYTES = int(os.environ.get("UDISE_UPLOAD_CACHE_MB", "1024")) * 1024 * 1024
+
+def parse_udise_codes(text: str) -> List[str]:
+    """Split pasted UDISE codes on commas / new lines, dropping blanks."""
+    return [u.strip() for u in text.replace("\r", "\n").replace(",", "\n").split("\n") if u.strip()]
+
+def spool_upload(uploaded_file, cache_dir: str = MASTER_CACHE_DIR) -> str:
+    """Persist an uploaded file under the cache dir so it can be re-read in chunks."""
+    data = uploaded_file.getvalue()
+    ext = os.path.splitext(uploaded_file.name)[1].lower()
+    path = os.path.join(cache_dir, "uploads", hashlib.sha1(data).hexdigest()[:16] + ext)
+    try:
+        # Recency lives in the access time: the modification time is part of the
+        # shared-master and value-scan cache keys and must only change on a rewrite
+        os.utime(path, (time.time(), os.stat(path).st_mtime))
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_atomic(path, data)
+    evict_spooled_uploads(cache_dir, keep=path)
+    return path
+
+def evict_spooled_uploads(cache_dir: str = MASTER_CACHE_DIR, keep: str = None,
+                          max_files: int = None, max_bytes: int = None) -> List[str]:
+    """Drop the least recently used (by access time) spooled uploads, and their snapshots, beyond the limits."""
+    max_files = UPLOAD_CACHE_MAX_FILES if max_files is None else max_files
+    max_bytes = UPLOAD_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    upload_dir = os.path.join(cache_dir, "uploads")
+    entries = []
+    for entry in os.scandir(upload_dir) if os.path.isdir(upload_dir) else []:
+        if entry.is_file() and not entry.name.endswith(".tmp"):
+            stat = entry.stat()
+            entries.append((stat.st_atime, stat.st_size, entry.path))
+    entries.sort(reverse=True)
+
+    keep = os.path.abspath(keep) if keep else None
+    removed, count, total = [], 0, 0
+    for _, size, path in entries:
+        count += 1
+        total += size
+        if os.path.abspath(path) == keep or (count <= max_files and total <= max_bytes):
+            continue
+        for stale in (path, *snapshot_paths(path, os.path.join(cache_dir, "snapshots"))):
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+        count -= 1
+        total -= size
+        removed.append(path)
+    return removed
+
+def scan_csv_header(path: str) -> List[str]:
+    """Column names of a CSV without reading its rows."""
+    return pd.read_csv(path, nrows=0).columns.str.strip().tolist()
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def scan_csv_values(path: str, mtime: float, column: str,
+                    chunksize: int = STREAM_CHUNK_ROWS) -> Dict[str, int]:
+    """Value counts of one CSV column, reading only that column in chunks.
+
+    mtime is part of the cache key so a replaced file is rescanned.
+    """
+    counts = {}
+    reader = pd.read_csv(path, dtype=str, usecols=lambda c: c.strip() == column, chunksize=chunksize)
+    for chunk in reader:
+        for value, n in chunk.iloc[:, 0].value_counts().items():
+            counts[value] = counts.get(value, 0) + int(n)
+    return dict(sorted(counts.items()))
+
+def stream_csv(path: str, filters: Dict[str, List[str]] = None, udise_col: str = None,
+               udise_codes: List[str] = None, usecols: List[str] = None,
+               chunksize: int = STREAM_CHUNK_ROWS, progress=None) -> pd.DataFrame:
+    """Read a CSV chunk by chunk, keeping only matching rows and wanted columns.
+
+    filters maps column -> accepted values, udise_codes restricts udise_col,
+    usecols is the output projection (all columns when empty). progress, if
+    given, is called as progress(fraction, rows_scanned, rows_kept).
+    """
+    filters = {c: set(v) for c, v in (filters or {}).items() if v}
+    codes = set(udise_codes or [])
+    header = scan_csv_header(path)
+    output_cols = [c for c in header if not usecols or c in usecols]
+    needed = set(output_cols) | set(filters) | ({udise_col} if codes and udise_col else set())
+
+    total_bytes = max(os.path.getsize(path), 1)
+    kept = []
+    rows_scanned = rows_kept = 0
+    with open(path, "rb") as fh:
+        reader = pd.read_csv(fh, dtype=str, usecols=lambda c: c.strip() in needed, chunksize=chunksize)
+        for chunk in reader:
+            chunk.columns = chunk.columns.str.strip()
+            mask = np.ones(len(chunk), dtype=bool)
+            for col, vals in filters.items():
+                mask &= chunk[col].isin(vals).to_numpy()
+            if codes and udise_col:
+                mask &= chunk[udise_col].str.strip().isin(codes).to_numpy()
+            part = chunk.loc[mask, output_cols]
+            rows_scanned += len(chunk)
+            rows_kept += len(part)
+            if len(part):
+                kept.append(part)
+            if progress is not None:
+                progress(min(fh.tell() / total_bytes, 1.0), rows_scanned, rows_kept)
+
+    if kept:
+        result = pd.concat(kept, ignore_index=True)
+    else:
+        result = pd.DataFrame(columns=output_cols, dtype=str)
+    return prepare_master(result)
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# FORMULA ENGINE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+# Custom formulas are parsed once into a tree of small closures over NumPy
+# arrays. Only the columns a formula names are converted to numbers, and rows
+# are evaluated in chunks so temporaries stay bounded. Column names that are
+# not Python identifiers can be written in backticks: `School Type`.
+FORMULA_CHUNK_ROWS = 250_000
+
+class FormulaError(ValueError):
+    """A formula that cannot be parsed, references unknown names or fails to evaluate."""
+
+def _safe_div(a, b):
+    """a / b with 0 wherever b is 0."""
+    a, b = np.broadcast_arrays(np.asarray(a, dtype="float64"), np.asarray(b, dtype="float64"))
+    out = np.zeros(a.shape, dtype="float64")
+    np.divide(a, b, out=out, where=b != 0)
+    return out
+
+FORMULA_FUNCTIONS = {
+    # name: (callable, min args, max args)
+    "IF": (lambda cond, a, b: np.where(cond, a, b), 3, 3),
+    "ROUND": (lambda x, digits=0: np.round(x, int(digits)), 1, 2),
+    "SAFE_DIV": (_safe_div, 2, 2),
+    "MIN": (lambda *args: functools.reduce(np.minimum, args), 1, None),
+    "MAX": (lambda *args: functools.reduce(np.maximum, args), 1, None),
+    "ABS": (np.abs, 1, 1),
+}
+
+_BINARY_OPS = {
+    ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply,
+    ast.Div: np.true_divide, ast.FloorDiv: np.floor_divide, ast.Mod: np.mod, ast.Pow: np.power,
+}
+_COMPARE_OPS = {
+    ast.Lt: np.less, ast.LtE: np.less_equal, ast.Gt: np.greater,
+    ast.GtE: np.greater_equal, ast.Eq: np.equal, ast.NotEq: np.not_equal,
+}
+_BACKTICK_NAME = re.compile(r"`([^`]+)`")
+
+def _compile_node(node, names: List[str]):
+    """Turn one AST node into a closure taking the {column: array} chunk."""
+    if isinstance(node, ast.Expression):
+        return _compile_node(node.body, names)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        value = node.value
+        return lambda env: value
+    if isinstance(node, ast.Name):
+        names.append(node.id)
+        name = node.id
+        return lambda env: env[name]
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPS:
+        op, left, right = _BINARY_OPS[type(node.op)], _compile_node(node.left, names), _compile_node(node.right, names)
+        return lambda env: op(left(env), right(env))
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd, ast.Not)):
+        op = {ast.USub: np.negative, ast.UAdd: np.positive, ast.Not: np.logical_not}[type(node.op)]
+        operand = _compile_node(node.operand, names)
+        return lambda env: op(operand(env))
+    if isinstance(node, ast.BoolOp):
+        op = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+        values = [_compile_node(v, names) for v in node.values]
+        return lambda env: functools.reduce(op, [v(env) for v in values])
+    if isinstance(node, ast.Compare) and all(type(o) in _COMPARE_OPS for o in node.ops):
+        operands = [_compile_node(node.left, names)] + [_compile_node(c, names) for c in node.comparators]
+        ops = [_COMPARE_OPS[type(o)] for o in node.ops]
+
+        def compare(env):
+            values = [operand(env) for operand in operands]
+            return functools.reduce(np.logical_and, [op(values[i], values[i + 1]) for i, op in enumerate(ops)])
+        return compare
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+        fname = node.func.id.upper()
+        if fname not in FORMULA_FUNCTIONS:
+            raise FormulaError(f"Unknown function '{node.func.id}'. Available: {', '.join(FORMULA_FUNCTIONS)}")
+        func, min_args, max_args = FORMULA_FUNCTIONS[fname]
+        if len(node.args) < min_args or (max_args is not None and len(node.args) > max_args):
+            raise FormulaError(f"{fname} takes {min_args}" + ("" if max_args == min_args else
+                               f" to {max_args}" if max_args else " or more") + " arguments")
+        args = [_compile_node(a, names) for a in node.args]
+        return lambda env: func(*[a(env) for a in args])
+    raise FormulaError(f"Unsupported syntax in formula: {ast.dump(node)[:60]}")
+
+@functools.lru_cache(maxsize=256)
+def _parse_formula(expression: str):
+    """Parse expression once; return (closure, referenced column names)."""
+    quoted = {}
+
+    def placeholder(match):
+        key = f"__col{len(quoted)}"
+        quoted[key] = match.group(1)
+        return key
+
+    source = _BACKTICK_NAME.sub(placeholder, expression.strip())
+    try:
+        tree = ast.parse(source, mode="eval")
+    except SyntaxError as e:
+        raise FormulaError(f"Invalid formula: {e.msg}") from None
+
+    names = []
+    fn = _compile_node(tree, names)
+    columns = list(dict.fromkeys(quoted.get(n, n) for n in names))
+    if quoted:
+        inner = fn
+        fn = lambda env: inner({**env, **{k: env[v] for k, v in quoted.items()}})
+    return fn, tuple(columns)
+
+def compile_formula(expression: str, available_columns) -> dict:
+    """Validate expression against the available columns.
+
+    Returns {"expression", "columns", "fn"}; raises FormulaError for syntax
+    errors, unknown functions or unknown column names.
+    """
+    if not expression or not expression.strip():
+        raise FormulaError("Enter a formula")
+    fn, columns = _parse_formula(expression.strip())
+    available = set(available_columns)
+    unknown = [c for c in columns if c not in available]
+    if unknown:
+        raise FormulaError(f"Unknown column(s): {', '.join(unknown)}")
+    return {"expression": expression.strip(), "columns": list(columns), "fn": fn}
+
+def evaluate_formula(compiled: dict, target_df: pd.DataFrame, chunk_rows: int = FORMULA_CHUNK_ROWS) -> pd.Series:
+    """Evaluate a compiled formula over target_df, touching only the columns it references."""
+    arrays = {c: as_numeric(target_df[c]).to_numpy() for c in compiled["columns"]}
+    n = len(target_df)
+    parts = []
+    try:
+        with np.errstate(all="ignore"):
+            for start in range(0, max(n, 1), chunk_rows):
+                env = {c: a[start:start + chunk_rows] for c, a in arrays.items()}
+                part = np.asarray(compiled["fn"](env))
+                parts.append(np.broadcast_to(part, (min(chunk_rows, n - start),)) if part.ndim == 0 else part)
+    except (TypeError, ValueError, ArithmeticError) as e:
+        raise FormulaError(f"Cannot evaluate '{compiled['expression']}': {e}") from None
+    values = np.concatenate(parts)
+    if np.issubdtype(values.dtype, np.floating):
+        # x / 0 has no value - leave the cell empty rather than inf
+        values = np.where(np.isfinite(values), values, np.nan)
+    return pd.Series(values, index=target_df.index)
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CALCULATED FIELDS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+# Created fields form a dependency graph: each node lists the columns it reads
+# and the columns it produces. Nodes are computed over the whole master in
+# topological order and memoized under a signature of their definition and
+# their inputs' signatures, so adding a field or changing one only recomputes
+# that node and its dependents; filtering just takes rows of cached results.
+CLASS_TOTAL_NAMES = [f"Class{i}_Total" for i in range(1, 13)]
+FIELD_CACHE_MAX_ENTRIES = 64
+
+def make_lru_store(max_entries: int) -> dict:
+    """A bounded, thread-safe LRU mapping with hit / miss counters."""
+    return {"lock": threading.Lock(), "entries": OrderedDict(), "max_entries": max_entries,
+            "hits": 0, "misses": 0}
+
+def lru_get(store: dict, key):
+    """Return the cached value for key (marking it recently used) or None."""
+    with store["lock"]:
+        value = store["entries"].get(key)
+        if value is None:
+            store["misses"] += 1
+        else:
+            store["hits"] += 1
+            store["entries"].move_to_end(key)
+        return value
+
+def lru_stats(store: dict) -> dict:
+    """Hit / miss counters and occupancy of an LRU store."""
+    with store["lock"]:
+        lookups = store["hits"] + store["misses"]
+        return {"hits": store["hits"], "misses": store["misses"], "entries": len(store["entries"]),
+                "max_entries": store["max_entries"], "hit_rate": store["hits"] / lookups if lookups else 0.0}
+
+def lru_put(store: dict, key, value):
+    """Insert value under key, evicting the least recently used entries."""
+    with store["lock"]:
+        store["entries"][key] = value
+        store["entries"].move_to_end(key)
+        while len(store["entries"]) > store["max_entries"]:
+            store["entries"].popitem(last=False)
+
+@st.cache_resource(show_spinner=False)
+def _field_memo() -> dict:
+    """Process-wide memo of computed field columns, keyed by (master, signature)."""
+    return make_lru_store(FIELD_CACHE_MAX_ENTRIES)
+
+def field_inputs(meta: dict) -> List[str]:
+    """Columns a created field reads."""
+    if meta["type"] == "custom":
+        return list(_parse_formula(meta["definition"])[1])
+    return list(meta["definition"])
+
+def field_nodes(created_fields: dict, extra_fields: List[str], columns) -> Dict[str, dict]:
+    """Build the field graph from the preset names and the user's created fields."""
+    nodes = {}
+    class_inputs = [c for c in columns if CLASS_COLUMN_PATTERN.match(c)]
+    if any(name in extra_fields for name in CLASS_TOTAL_NAMES):
+        nodes["Class totals"] = {"type": "class_totals", "definition": None,
+                                 "inputs": class_inputs, "outputs": list(CLASS_TOTAL_NAMES)}
+    if any(name in extra_fields for name in ENROLLMENT_PRESET_NAMES):
+        nodes["Enrollment presets"] = {"type": "enrollment_presets", "definition": None,
+                                       "inputs": class_inputs, "outputs": list(ENROLLMENT_PRESET_NAMES)}
+    for name, meta in created_fields.items():
+        nodes[name] = {"type": meta["type"], "definition": meta["definition"],
+                       "inputs": field_inputs(meta), "outputs": [name]}
+    return nodes
+
+def field_order(nodes: Dict[str, dict]) -> List[str]:
+    """Node names in dependency order; raises FormulaError on a cycle."""
+    producer = {out: name for name, node in nodes.items() for out in node["outputs"]}
+    graph = {name: {producer[c] for c in node["inputs"] if c in producer and producer[c] != name}
+             for name, node in nodes.items()}
+    try:
+        return list(graphlib.TopologicalSorter(graph).static_order())
+    except graphlib.CycleError as e:
+        raise FormulaError(f"Circular reference between fields: {' -> '.join(e.args[1])}") from None
+
+def compute_field(node: dict, inputs: pd.DataFrame) -> pd.DataFrame:
+    """Compute one node's output columns from a frame holding its inputs."""
+    out = pd.DataFrame(index=inputs.index)
+    if node["type"] == "class_totals":
+        build_class_totals(out, build_enrollment_tensor(inputs))
+    elif node["type"] == "enrollment_presets":
+        build_enrollment_presets(out, build_enrollment_tensor(inputs))
+    elif node["type"] == "diff":
+        a, b = node["definition"]
+        out[node["outputs"][0]] = as_numeric(inputs[a]) - as_numeric(inputs[b])
+    elif node["type"] == "sum":
+        out[node["outputs"][0]] = safe_numeric_sum(inputs, node["definition"])
+    elif node["type"] == "avg":
+        out[node["outputs"][0]] = safe_numeric_sum(inputs, node["definition"]) / max(1, len(node["definition"]))
+    elif node["type"] == "custom":
+        out[node["outputs"][0]] = evaluate_formula(compile_formula(node["definition"], inputs.columns), inputs)
+    else:
+        raise FormulaError(f"Unknown field type '{node['type']}'")
+    return out
+
+def field_signatures(nodes: Dict[str, dict]) -> Dict[str, str]:
+    """Signature of every derived column: its node's definition plus its inputs' signatures.
+
+    Empty when the graph has a cycle (compute_fields reports that).
+    """
+    signatures = {}
+    try:
+        order = field_order(nodes)
+    except FormulaError:
+        return signatures
+    for name in order:
+        node = nodes[name]
+        payload = [node["type"], node["definition"], [signatures.get(c, c) for c in node["inputs"]]]
+        signature = hashlib.sha1(json.dumps(payload, default=str).encode("utf-8")).hexdigest()[:16]
+        for out in node["outputs"]:
+            signatures[out] = signature
+    return signatures
+
+def compute_fields(base_df: pd.DataFrame, nodes: Dict[str, dict], memo: dict, base_key: str = None):
+    """Materialize every node over base_df in topological order.
+
+    Returns (columns, errors, recomputed): the derived columns by name, an
+    error message per failed node (its dependents fail too, nothing is
+    zero-filled) and the nodes that were not served from memo.
+    """
+    base_key = base_key or base_df.attrs.get("fingerprint") or dataset_fingerprint(base_df)
+    producer = {out: name for name, node in nodes.items() for out in node["outputs"]}
+    columns, errors, recomputed = {}, {}, []
+    try:
+        order = field_order(nodes)
+    except FormulaError as e:
+        return columns, {"Created fields": str(e)}, recomputed
+    signatures = field_signatures(nodes)
+    for name in order:
+        node = nodes[name]
+        failed = [producer[c] for c in node["inputs"] if c in producer and producer[c] in errors]
+        missing = [c for c in node["inputs"] if c not in columns and c not in base_df.columns]
+        if failed:
+            errors[name] = f"depends on failed field(s): {', '.join(dict.fromkeys(failed))}"
+            continue
+        if missing:
+            errors[name] = f"uses missing column(s): {', '.join(missing)}"
+            continue
+
+        signature = signatures[node["outputs"][0]]
+        result = lru_get(memo, (base_key, signature))
+        if result is None:
+            inputs = pd.DataFrame({c: columns[c] if c in columns else base_df[c] for c in node["inputs"]},
+                                  index=base_df.index)
+            try:
+                result = compute_field(node, inputs)
+            except FormulaError as e:
+                errors[name] = str(e)
+                continue
+            lru_put(memo, (base_key, signature), result)
+            recomputed.append(name)
+        columns.update(result.items())
+    return columns, errors, recomputed
+
+def attach_fields(view_df: pd.DataFrame, master_df: pd.DataFrame, columns: Dict[str, pd.Series]) -> pd.DataFrame:
+    """Add master-level derived columns to a view holding a subset of the master's rows."""
+    if not columns:
+        return view_df
+    positions = master_df.index.get_indexer(view_df.index)
+    derived = pd.DataFrame({name: values.to_numpy()[positions] for name, values in columns.items()},
+                           index=view_df.index)
+    return pd.concat([view_df.drop(columns=[c for c in derived.columns if c in view_df.columns]), derived], axis=1)
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# PIVOT ENGINE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+PIVOT_AGGREGATIONS = {
+    "Sum": "sum", "Count": "count", "Distinct Count": "nunique", "Average": "mean",
+    "Min": "min", "Max": "max", "Median": "median", "Std Dev": "std", "First": "first", "Last": "last",
+}
+# Aggregations that work on the raw values; all others coerce to numbers first
+RAW_VALUE_AGGREGATIONS = ("Count", "Distinct Count", "First", "Last")
+
+def finish_pivot(result: pd.DataFrame, agg_map: Dict[str, str]) -> pd.DataFrame:
+    """Suffix value columns with their aggregation and round floats to 2 places."""
+    result = result.rename(columns={c: f"{c}_{agg_map[c].replace(' ', '_')}" for c in result.columns if c in agg_map})
+    for col in result.columns:
+        if result[col].dtype in ["float64", "float32"]:
+            result[col] = result[col].round(2)
+    return result
+
+# Sum / Count / Distinct Count / Average / Min / Max are computed by a NumPy
+# kernel: the grouping columns are factorized once and combined into a single
+# dense integer group id, then every value column is reduced into per-group
+# slots with np.bincount and unbuffered ufunc.at (fast from NumPy 1.25) -
+# no sort and no per-group Python work. Median, Std Dev, First and Last go
+# through pandas.
+KERNEL_AGGREGATIONS = ("Sum", "Count", "Distinct Count", "Average", "Min", "Max")
+KERNEL_DENSE_SLOTS = 1 << 22  # above this many key combinations, compact keys by sorting
+
+def pair_counts(pairs: np.ndarray, n_slots: int):
+    """(distinct values, occurrences) of non-negative int64 pair keys below n_slots, in order."""
+    if n_slots <= KERNEL_DENSE_SLOTS:
+        counts = np.bincount(pairs, minlength=n_slots)
+        keys = np.flatnonzero(counts)
+        return keys, counts[keys]
+    pairs = np.sort(pairs)
+    starts = np.flatnonzero(np.diff(pairs, prepend=-1))
+    return pairs[starts], np.diff(np.append(starts, len(pairs)))
+
+def group_keys(df_pivot: pd.DataFrame, rows: List[str]):
+    """Factorize rows into (group id per row or -1, key frame per group), in groupby's sorted order.
+
+    Returns None when the combined key would not fit in 64 bits.
+    """
+    key = np.zeros(len(df_pivot), dtype=np.int64)
+    valid = np.ones(len(df_pivot), dtype=bool)
+    levels, radix = [], 1
+    for col in rows:
+        series = df_pivot[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            codes, uniques = series.cat.codes.to_numpy().astype(np.int64), series.dtype
+            size = max(len(uniques.categories), 1)
+        else:
+            codes, uniques = pd.factorize(series, sort=True)
+            size = max(len(uniques), 1)
+        radix *= size
+        if radix >= 2 ** 62:
+            return None
+        valid &= codes >= 0
+        key = key * size + codes
+        levels.append((col, uniques, size))
+
+    # Compact the observed keys to 0..n_groups-1 (sorted, like groupby)
+    if radix <= KERNEL_DENSE_SLOTS:
+        present = np.bincount(key[valid], minlength=radix) > 0
+        group_of_key = np.flatnonzero(present)
+        gid = (np.cumsum(present) - 1)[key[valid]]
+    else:
+        group_of_key, gid = np.unique(key[valid], return_inverse=True)
+    group_id = np.full(len(df_pivot), -1, dtype=np.int64)
+    group_id[valid] = gid
+
+    keys, rest = {}, group_of_key
+    for col, uniques, size in reversed(levels):
+        rest, codes = np.divmod(rest, size)
+        if isinstance(uniques, pd.CategoricalDtype):
+            keys[col] = pd.Categorical.from_codes(codes, dtype=uniques)
+        else:
+            keys[col] = pd.Index(uniques).infer_objects().take(codes)
+    return group_id, pd.DataFrame({col: keys[col] for col in rows}, index=range(len(group_of_key)))
+
+def kernel_values(series: pd.Series) -> np.ndarray:
+    """as_numeric values for the kernel, reading gap-free integer storage as-is (accumulators widen)."""
+    if isinstance(series.dtype, np.dtype) and series.dtype.kind in "biu":
+        return series.to_numpy()
+    return as_numeric(series).to_numpy()
+
+def pivot_kernel(df_pivot: pd.DataFrame, group_id: np.ndarray, n_groups: int,
+                 agg_map: Dict[str, str]) -> Dict[str, np.ndarray]:
+    """Kernel aggregations of df_pivot's (uncoerced) value columns by group id."""
+    valid = group_id >= 0
+    dense = bool(valid.all())
+    gid = group_id if dense else group_id[valid]
+    sizes = np.bincount(gid, minlength=n_groups)
+    out = {}
+    for col, agg_type in agg_map.items():
+        series = df_pivot[col]
+        if agg_type == "Count":
+            present = series.notna().to_numpy()
+            out[col] = np.bincount(gid, weights=present if dense else present[valid], minlength=n_groups).astype(np.int64)
+        elif agg_type == "Distinct Count":
+            codes, uniques = pd.factorize(series)
+            codes, base = codes if dense else codes[valid], max(len(uniques), 1)
+            seen = codes >= 0
+            pairs, _ = pair_counts(gid[seen] * base + codes[seen], n_groups * base)
+            out[col] = np.bincount(pairs // base, minlength=n_groups)
+        else:
+            values = kernel_values(series)
+            wide = np.float64 if values.dtype.kind == "f" else np.int64
+            values = (values if dense else values[valid]).astype(wide, copy=False)  # ufunc.at's fast path needs matching dtypes
+            if agg_type in ("Sum", "Average"):
+                sums = np.zeros(n_groups, dtype=wide)
+                np.add.at(sums, gid, values)
+                out[col] = sums if agg_type == "Sum" else sums / sizes
+            else:
+                ufunc = np.minimum if agg_type == "Min" else np.maximum
+                extremes = np.empty(n_groups, dtype=wide)
+                extremes[gid] = values  # seed every slot with a member of its group
+                ufunc.at(extremes, gid, values)
+                out[col] = extremes
+    return out
+
+def pivot_scan(target_df: pd.DataFrame, rows: List[str], agg_map: Dict[str, str],
+               use_kernel: bool = True) -> pd.DataFrame:
+    """Group the rows of target_df directly (the path for anything the cube can't answer)."""
+    df_pivot = target_df[list(dict.fromkeys(rows + list(agg_map)))].copy(deep=False)
+    kernel_map = {c: a for c, a in agg_map.items() if a in KERNEL_AGGREGATIONS and c not in rows} if use_kernel else {}
+    grouping = group_keys(df_pivot, rows) if kernel_map and len(df_pivot) else None
+    if grouping is None or not len(grouping[1]):  # too many key combinations, or every key missing
+        grouping, kernel_map = None, {}
+    pandas_map = {c: a for c, a in agg_map.items() if c not in kernel_map}
+    for val_col, agg_type in pandas_map.items():
+        if agg_type not in RAW_VALUE_AGGREGATIONS:
+            df_pivot[val_col] = as_numeric(df_pivot[val_col])
+
+    if pandas_map or not kernel_map:
+        agg_funcs = {val_col: PIVOT_AGGREGATIONS[agg_type] for val_col, agg_type in pandas_map.items()}
+        keys = rows or np.zeros(len(df_pivot), dtype=np.int8)  # no rows: one grand-total group
+        result = df_pivot.groupby(keys, observed=True).agg(agg_funcs).reset_index(drop=not rows)
+    if kernel_map:
+        group_id, key_frame = grouping
+        values = pivot_kernel(df_pivot, group_id, len(key_frame), kernel_map)
+        result = key_frame.assign(**values) if not pandas_map else result.assign(**values)
+    return finish_pivot(result[rows + list(agg_map)], agg_map)
+
+# The cube pre-aggregates the master at the finest District x Block x
+# Management grain ("cells"). Every pivot over those dimensions - with sidebar
+# filters on them - is then a small merge of cell partials: sums, counts,
+# min/max and moments merge directly; first/last use the first/last row
+# position per cell; distinct counts and medians use exact per-cell value
+# counts, built the first time a column needs them.
+CUBE_HIERARCHY = ["District", "Block"]
+CUBE_DIMENSIONS = CUBE_HIERARCHY + ["Management"]
+
+def build_pivot_cube(master: pd.DataFrame):
+    """Pre-aggregate master over the cube dimensions it has; None if it has none."""
+    dims = [d for d in CUBE_DIMENSIONS if d in master.columns]
+    if not dims or master.empty:
+        return None
+    grouped = master.groupby(dims, observed=True, dropna=False, sort=True)
+    cell = grouped.ngroup().to_numpy()
+    sizes = grouped.size()
+    order = np.argsort(cell, kind="stable")
+    starts = np.concatenate([[0], np.cumsum(sizes.to_numpy())[:-1]])
+    cube = {
+        "dims": dims, "frame": master, "leaf": sizes.index.to_frame(index=False),
+        "rows": sizes.to_numpy().astype(np.int64), "cell": cell, "order": order, "starts": starts,
+        "partials": {}, "sketches": {}, "lock": threading.Lock(),
+    }
+    for col in master.columns:
+        if col not in dims and is_numeric_dtype(master[col]):
+            cube_partials(cube, col)
+    return cube
+
+def cube_partials(cube: dict, col: str) -> dict:
+    """Per-cell count, first/last row and (numeric columns) sum, min, max, mean and M2."""
+    with cube["lock"]:
+        if col in cube["partials"]:
+            return cube["partials"][col]
+    series = cube["frame"][col]
+    order, starts = cube["order"], cube["starts"]
+    present = series.notna().to_numpy()[order]
+    partials = {
+        "count": np.add.reduceat(present.astype(np.int64), starts),
+        "first": np.minimum.reduceat(np.where(present, order, len(order)), starts),
+        "last": np.maximum.reduceat(np.where(present, order, -1), starts),
+    }
+    if is_numeric_dtype(series):
+        values = as_numeric(series).to_numpy()[order]
+        cell_mean = np.add.reduceat(values.astype("float64"), starts) / cube["rows"]
+        partials.update({
+            "sum": np.add.reduceat(values, starts),
+            "min": np.minimum.reduceat(values, starts),
+            "max": np.maximum.reduceat(values, starts),
+            "mean": cell_mean,
+            "m2": np.add.reduceat((values - np.repeat(cell_mean, cube["rows"])) ** 2, starts),
+        })
+    with cube["lock"]:
+        return cube["partials"].setdefault(col, partials)
+
+def cube_sketch(cube: dict, col: str, kind: str) -> dict:
+    """Exact per-cell value counts of col: raw value codes ("distinct") or numbers ("median")."""
+    key = (col, kind)
+    with cube["lock"]:
+        if key in cube["sketches"]:
+            return cube["sketches"][key]
+    series = cube["frame"][col]
+    if kind == "distinct":
+        values, _ = pd.factorize(series)
+        keep = values >= 0
+    else:
+        values = as_numeric(series).to_numpy()
+        keep = np.ones(len(values), dtype=bool)
+    counts = pd.DataFrame({"cell": cube["cell"][keep], "value": values[keep]}).groupby(["cell", "value"]).size()
+    sketch = {"cell": counts.index.get_level_values(0).to_numpy(),
+              "value": counts.index.get_level_values(1).to_numpy(), "n": counts.to_numpy()}
+    with cube["lock"]:
+        return cube["sketches"].setdefault(key, sketch)
+
+def cube_covers(cube, rows: List[str], agg_map: Dict[str, str], filters=None) -> bool:
+    """Whether a pivot of the (filtered) master can be answered from the cube."""
+    if cube is None or filters is None:
+        return False
+    dims = set(cube["dims"])
+    if not set(rows) <= dims or not set(filters) <= dims:
+        return False
+    frame = cube["frame"]
+    for col, agg_type in agg_map.items():
+        if col not in frame.columns or col in dims:
+            return False
+        if agg_type not in RAW_VALUE_AGGREGATIONS and not is_numeric_dtype(frame[col]):
+            return False
+    return True
+
+def _group_reduce(ufunc, gid, values, n_groups, initial):
+    """Reduce values into n_groups slots by group id, keeping the dtype."""
+    out = np.full(n_groups, initial, dtype=np.result_type(values, type(initial)))
+    ufunc.at(out, gid, values)
+    return out
+
+def _weighted_median(gid, values, weights, n_groups):
+    """Median per group of values repeated weights times (pandas' midpoint rule)."""
+    order = np.lexsort((values, gid))
+    gid, values, cum = gid[order], values[order], np.cumsum(weights[order])
+    total = np.bincount(gid, weights=weights[order], minlength=n_groups).astype(np.int64)
+    before = np.concatenate([[0], cum])[np.searchsorted(gid, np.arange(n_groups))]
+    low = values[np.searchsorted(cum, before + (total - 1) // 2, side="right")]
+    high = values[np.searchsorted(cum, before + total // 2, side="right")]
+    return (low + high) / 2
+
+def pivot_from_cube(cube: dict, rows: List[str], agg_map: Dict[str, str], filters=None,
+                    with_rows: bool = False) -> pd.DataFrame:
+    """Answer a pivot by merging cube cells (see cube_covers); with_rows adds a Schools column."""
+    leaf = cube["leaf"]
+    mask = np.ones(len(leaf), dtype=bool)
+    for col, vals in (filters or {}).items():
+        mask &= leaf[col].astype(str).isin(vals).to_numpy()
+    cells = np.flatnonzero(mask)
+    if rows:
+        grouped = leaf.iloc[cells].groupby(rows, observed=True, sort=True)
+        gid = grouped.ngroup().fillna(-1).to_numpy().astype(np.int64)  # -1: a key is missing
+        cells, gid = cells[gid >= 0], gid[gid >= 0]
+        result = grouped.size().index.to_frame(index=False)
+    else:  # grand total
+        gid = np.zeros(len(cells), dtype=np.int64)
+        result = pd.DataFrame(index=range(min(len(cells), 1)))
+    n_groups = len(result)
+    group_of_cell = np.full(len(leaf), -1)
+    group_of_cell[cells] = gid
+    group_rows = _group_reduce(np.add, gid, cube["rows"][cells], n_groups, 0)
+
+    if with_rows:
+        result["Schools"] = group_rows
+    for col, agg_type in agg_map.items():
+        p = cube_partials(cube, col)
+        if agg_type == "Sum":
+            values = _group_reduce(np.add, gid, p["sum"][cells], n_groups, 0)
+        elif agg_type == "Count":
+            values = _group_reduce(np.add, gid, p["count"][cells], n_groups, 0)
+        elif agg_type == "Average":
+            values = _group_reduce(np.add, gid, p["sum"][cells], n_groups, 0) / group_rows
+        elif agg_type == "Min":
+            values = _group_reduce(np.minimum, gid, p["min"][cells], n_groups, p["min"].max(initial=0))
+        elif agg_type == "Max":
+            values = _group_reduce(np.maximum, gid, p["max"][cells], n_groups, p["max"].min(initial=0))
+        elif agg_type == "Std Dev":
+            # Chan et al.: M2 = sum of cell M2 + n_cell * (cell mean - group mean)^2
+            mean = _group_reduce(np.add, gid, p["mean"][cells] * cube["rows"][cells], n_groups, 0.0) / group_rows
+            m2 = _group_reduce(np.add, gid, p["m2"][cells] + cube["rows"][cells] *
+                               (p["mean"][cells] - mean[gid]) ** 2, n_groups, 0.0)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                values = np.where(group_rows > 1, np.sqrt(m2 / (group_rows - 1)), np.nan)
+        elif agg_type in ("First", "Last"):
+            edge = p["first"] if agg_type == "First" else p["last"]
+            if agg_type == "First":
+                pos = _group_reduce(np.minimum, gid, edge[cells], n_groups, len(cube["order"]))
+                found = pos < len(cube["order"])
+            else:
+                pos = _group_reduce(np.maximum, gid, edge[cells], n_groups, -1)
+                found = pos >= 0
+            taken = cube["frame"][col].take(np.where(found, pos, 0)).reset_index(drop=True)
+            values = taken if found.all() else taken.where(found)
+        else:
+            sketch = cube_sketch(cube, col, "distinct" if agg_type == "Distinct Count" else "median")
+            sk_group = group_of_cell[sketch["cell"]]
+            keep = sk_group >= 0
+            if agg_type == "Distinct Count":
+                base = int(sketch["value"].max(initial=0)) + 1  # value codes: pack pairs into one int64
+                pairs, _ = pair_counts(sk_group[keep] * base + sketch["value"][keep], n_groups * base)
+                values = np.bincount(pairs // base, minlength=n_groups)
+            else:
+                values = _weighted_median(sk_group[keep], sketch["value"][keep].astype("float64"),
+                                          sketch["n"][keep], n_groups)
+        result[col] = values
+    return finish_pivot(result, agg_map)
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def get_pivot_cube(fingerprint: str, _master: pd.DataFrame):
+    """One cube per master version, built once and shared by all sessions."""
+    return build_pivot_cube(_master)
+
+# Finished pivots are memoized across sessions, keyed by everything that
+# determines them: master version, sidebar filters (or the exact rows of an
+# ad hoc view), grouping, per-column aggregations and derived-field versions.
+PIVOT_CACHE_MAX_ENTRIES = 32
+
+@st.cache_resource(show_spinner=False)
+def _pivot_memo() -> dict:
+    """Process-wide LRU of pivot results."""
+    return make_lru_store(PIVOT_CACHE_MAX_ENTRIES)
+
+def pivot_cache_key(fingerprint: str, filters, rows: List[str], agg_map: Dict[str, str],
+                    view_key: str = None, signatures: Dict[str, str] = None, subtotals: str = None,
+                    columns: str = None, approximate: bool = False) -> tuple:
+    """Hashable key of a pivot request; view_key identifies rows not described by filters."""
+    used = list(rows) + [columns] + list(agg_map)
+    return (
+        fingerprint,
+        subtotals,
+        columns,
+        approximate,
+        tuple(sorted((col, tuple(sorted(map(str, vals)))) for col, vals in (filters or {}).items())),
+        view_key,
+        tuple(rows),
+        tuple(agg_map.items()),
+        tuple((col, signatures[col]) for col in used if col in (signatures or {})),
+    )
+
+def run_pivot(target_df: pd.DataFrame, rows: List[str], agg_map: Dict[str, str], cube=None, filters=None,
+              subtotals: str = None, columns: str = None, parallel: bool = False, approximate: bool = False):
+    """Return (result, source): from the cube when it covers the request, else a scan of target_df.
+
+    filters must be the sidebar filters that turned the master into target_df,
+    or None when target_df is not such a view (e.g. a UDISE list was applied).
+    subtotals ("rollup" / "cube") adds subtotal and grand-total rows; columns
+    makes a crosstab (which has its own totals) instead. parallel lets a large
+    scan run on the process pool (source "parallel"); approximate estimates a
+    scan's Distinct Count and Median from sketches (see SKETCH_ERRORS).
+    """
+    if columns:
+        return pivot_crosstab(target_df, rows, columns, agg_map), "scan"
+    source = "cube" if cube_covers(cube, rows, agg_map, filters) else "scan"
+    if subtotals:
+        return pivot_grouping_sets(target_df, rows, agg_map, subtotals, cube, filters), source
+    if source == "cube":
+        return pivot_from_cube(cube, rows, agg_map, filters), source
+    if parallel and PIVOT_WORKERS > 1 and len(target_df) >= PIVOT_PARALLEL_MIN_ROWS and _pivot_pool() is not None:
+        try:
+            return pivot_parallel(target_df, rows, agg_map, _pivot_pool(), PIVOT_WORKERS, approximate), "parallel"
+        except BrokenProcessPool:
+            _pivot_pool.clear()  # a worker died; start a fresh pool next time
+        except (pickle.PicklingError, OSError):
+            pass  # scan in this process instead
+    if approximate:
+        return pivot_sketched(target_df, rows, agg_map), source
+    return pivot_scan(target_df, rows, agg_map), source
+
+# Subtotals: ROLLUP (every prefix of the grouping rows) or CUBE (every subset)
+# in one request. Additive aggregations are merged from a single leaf-level
+# pass; Median, Distinct Count, First and Last are computed per level (from
+# the cube when it covers them). Rolled-up columns show SUBTOTAL_LABEL and
+# each row is marked in SUBTOTAL_COLUMN. Rows missing any grouping key belong
+# to no group, so - as in the plain pivot - they are left out of every level,
+# and each level adds up to the grand total.
+SUBTOTAL_MODES = {"None": None, "Subtotals (ROLLUP)": "rollup", "All combinations (CUBE)": "cube"}
+SUBTOTAL_COLUMN = "Row_Type"
+SUBTOTAL_LABEL = "All"
+MERGEABLE_AGGREGATIONS = ("Sum", "Count", "Average", "Min", "Max", "Std Dev")
+
+def grouping_sets(rows: List[str], mode: str) -> List[List[str]]:
+    """Grouping levels from the full rows down to the grand total."""
+    if mode == "cube":
+        return [list(combo) for k in range(len(rows), -1, -1) for combo in itertools.combinations(rows, k)]
+    return [rows[:k] for k in range(len(rows), -1, -1)]
+
+def _leaf_partials(target_df: pd.DataFrame, rows: List[str], agg_map: Dict[str, str]) -> pd.DataFrame:
+    """One groupby over rows producing mergeable partials."""
+    named = {}
+    for col, agg_type in agg_map.items():
+        if agg_type == "Count":
+            named[f"{col}|count"] = (col, "count")
+        else:
+            named.update({f"{col}|sum": (col, "sum"), f"{col}|n": (col, "size"),
+                          f"{col}|min": (col, "min"), f"{col}|max": (col, "max"), f"{col}|var": (col, "var")})
+    df_pivot = target_df[list(dict.fromkeys(rows + list(agg_map)))].copy(deep=False)
+    for col, agg_type in agg_map.items():
+        if agg_type != "Count":
+            df_pivot[col] = as_numeric(df_pivot[col])
+    return df_pivot.groupby(rows, observed=True, sort=True).agg(**named).reset_index()
+
+def _merge_partials(leaf: pd.DataFrame, level: List[str], agg_map: Dict[str, str]) -> pd.DataFrame:
+    """Aggregate leaf partials up to level (no level: grand total)."""
+    keys = level or np.zeros(len(leaf), dtype=np.int8)
+    grouped = leaf.groupby(keys, observed=True, sort=True)
+    out = {}
+    for col, agg_type in agg_map.items():
+        if agg_type == "Count":
+            out[col] = grouped[f"{col}|count"].sum()
+        elif agg_type == "Sum":
+            out[col] = grouped[f"{col}|sum"].sum()
+        elif agg_type == "Average":
+            out[col] = grouped[f"{col}|sum"].sum() / grouped[f"{col}|n"].sum()
+        elif agg_type == "Min":
+            out[col] = grouped[f"{col}|min"].min()
+        elif agg_type == "Max":
+            out[col] = grouped[f"{col}|max"].max()
+        else:  # Std Dev: M2 = sum of leaf M2 + n_leaf * (leaf mean - level mean)^2
+            n = leaf[f"{col}|n"]
+            leaf_mean = leaf[f"{col}|sum"] / n
+            mean = grouped[f"{col}|sum"].transform("sum") / grouped[f"{col}|n"].transform("sum")
+            m2 = leaf[f"{col}|var"].fillna(0) * (n - 1) + n * (leaf_mean - mean) ** 2
+            total_n = grouped[f"{col}|n"].sum()
+            m2_keys = [leaf[k] for k in level] if level else keys
+            out[col] = np.sqrt(m2.groupby(m2_keys, observed=True, sort=True).sum() / (total_n - 1)).where(total_n > 1)
+    return pd.DataFrame(out).reset_index(drop=not level)
+
+def pivot_grouping_sets(target_df: pd.DataFrame, rows: List[str], agg_map: Dict[str, str], mode: str = "rollup",
+                        cube=None, filters=None) -> pd.DataFrame:
+    """Pivot with subtotal and grand-total rows for every grouping level of mode."""
+    keyed = target_df[rows].notna().all(axis=1).to_numpy()
+    if not keyed.all():
+        target_df = target_df[keyed]
+    covered = cube_covers(cube, rows, agg_map, filters) and not cube["leaf"][rows].isna().to_numpy().any()
+    mergeable = {c: a for c, a in agg_map.items() if a in MERGEABLE_AGGREGATIONS and not covered}
+    others = {c: a for c, a in agg_map.items() if c not in mergeable}
+    leaf = _leaf_partials(target_df, rows, mergeable) if mergeable else None
+
+    value_columns = list(finish_pivot(pd.DataFrame(columns=list(agg_map)), agg_map).columns)
+    parts = []
+    for level in grouping_sets(rows, mode):
+        pieces = []
+        if mergeable:
+            pieces.append(finish_pivot(_merge_partials(leaf, level, mergeable), mergeable))
+        if others:
+            pieces.append(pivot_from_cube(cube, level, others, filters) if covered
+                          else pivot_scan(target_df, level, others))
+        part = pieces[0]
+        for piece in pieces[1:]:
+            part = pd.concat([part, piece.drop(columns=level)], axis=1)
+        part = part.astype({d: object for d in level})
+        for dim in rows:
+            if dim not in level:
+                part[dim] = SUBTOTAL_LABEL
+        part[SUBTOTAL_COLUMN] = "Detail" if len(level) == len(rows) else "Subtotal" if level else "Grand Total"
+        parts.append(part)
+    result = pd.concat(parts, ignore_index=True)
+
+    # Order like a spreadsheet: each group's detail rows, then its subtotal
+    sort_keys = []
+    for dim in reversed(rows):
+        values = target_df[dim]
+        labels = values.cat.categories if isinstance(values.dtype, pd.CategoricalDtype) else \
+            pd.Index(values.dropna().unique()).sort_values()
+        rank = pd.Index(labels).get_indexer(result[dim].where(result[dim] != SUBTOTAL_LABEL))
+        sort_keys.append(np.where(result[dim].to_numpy() == SUBTOTAL_LABEL, len(labels), rank))
+    order = np.lexsort(sort_keys) if sort_keys else np.arange(len(result))
+    return result.iloc[order].reset_index(drop=True)[[SUBTOTAL_COLUMN] + rows + value_columns]
+
+# Crosstab: an optional column dimension spreads each value column across the
+# column's values. Row and column keys are factorized separately (group_keys)
+# and every aggregation is accumulated into a dense rows x columns grid of
+# flat cell ids; row totals, column totals and the grand total are the same
+# reduction over the row ids, the column ids and a single group - or, for
+# Sum / Count / Min / Max, a fold of the grid itself.
+CROSSTAB_MAX_COLUMNS = 200
+CROSSTAB_FOLDS = {"Sum": "sum", "Count": "sum", "Min": "min", "Max": "max"}
+CROSSTAB_TOTAL_LABEL = "Total"
+
+def crosstab_cells(df_pivot: pd.DataFrame, group_id: np.ndarray, n_groups: int,
+                   agg_map: Dict[str, str]) -> Dict[str, pd.Series]:
+    """Aggregate df_pivot into n_groups dense slots (empty slots: 0 for counts, missing otherwise)."""
+    kernel_map = {c: a for c, a in agg_map.items() if a in KERNEL_AGGREGATIONS}
+    with np.errstate(invalid="ignore", divide="ignore"):  # empty slots
+        out = pivot_kernel(df_pivot, group_id, n_groups, kernel_map) if kernel_map else {}
+    valid = group_id >= 0
+    others = {c: a for c, a in agg_map.items() if c not in kernel_map}
+    if others:
+        values = pd.DataFrame({c: df_pivot[c] if a in RAW_VALUE_AGGREGATIONS else as_numeric(df_pivot[c])
+                               for c, a in others.items()})[valid]
+        grouped = values.groupby(group_id[valid]).agg({c: PIVOT_AGGREGATIONS[a] for c, a in others.items()})
+        out.update({c: grouped[c].reindex(range(n_groups)).to_numpy() for c in others})
+
+    empty = np.bincount(group_id[valid], minlength=n_groups) == 0
+    cells = {}
+    for col, agg_type in agg_map.items():
+        series = pd.Series(out[col])
+        if empty.any() and agg_type not in ("Count", "Distinct Count"):
+            series = (series.astype("Int64") if is_integer_dtype(series) else series).mask(empty)
+        cells[col] = series
+    return cells
+
+def pivot_crosstab(target_df: pd.DataFrame, rows: List[str], column: str, agg_map: Dict[str, str]) -> pd.DataFrame:
+    """Wide pivot: rows down, one column per value of column (per value column), with totals."""
+    used = list(dict.fromkeys(rows + [column] + list(agg_map)))
+    df_pivot = target_df[used].copy(deep=False)
+    row_keys, col_keys = group_keys(df_pivot, rows), group_keys(df_pivot, [column])
+    if row_keys is None:
+        raise ValueError("Too many combinations of the grouping columns for a crosstab")
+    (row_id, row_frame), (col_id, col_frame) = row_keys, col_keys
+    n_rows, n_cols = len(row_frame), len(col_frame)
+    if n_cols > CROSSTAB_MAX_COLUMNS:
+        raise ValueError(f"'{column}' has {n_cols:,} values - a crosstab supports at most {CROSSTAB_MAX_COLUMNS}")
+
+    # Rows missing either key fall out of the cells and of every total
+    missing = (row_id < 0) | (col_id < 0)
+    row_id, col_id = np.where(missing, -1, row_id), np.where(missing, -1, col_id)
+    cells = crosstab_cells(df_pivot, np.where(missing, -1, row_id * n_cols + col_id), n_rows * n_cols, agg_map)
+    rest = {c: a for c, a in agg_map.items() if a not in CROSSTAB_FOLDS}
+    row_totals = crosstab_cells(df_pivot, row_id, n_rows, rest)
+    col_totals = crosstab_cells(df_pivot, col_id, n_cols, rest)
+    grand = crosstab_cells(df_pivot, np.where(missing, -1, 0), 1, rest)
+    for col, agg_type in agg_map.items():
+        if agg_type in CROSSTAB_FOLDS:
+            grid = pd.DataFrame(cells[col].to_numpy().reshape(n_rows, n_cols), dtype=cells[col].dtype)
+            fold = CROSSTAB_FOLDS[agg_type]
+            row_totals[col] = getattr(grid, fold)(axis=1)
+            col_totals[col] = getattr(grid, fold)(axis=0).reset_index(drop=True)
+            grand[col] = pd.Series([getattr(col_totals[col], fold)()])
+
+    col_labels = [str(v) for v in col_frame[column]] + [CROSSTAB_TOTAL_LABEL]
+    value_names = finish_pivot(pd.DataFrame(columns=list(agg_map)), agg_map).columns
+    body, total_row = {}, {}
+    for col, name in zip(agg_map, value_names):
+        grid = cells[col].to_numpy().reshape(n_rows, n_cols)
+        labels = col_labels if len(agg_map) == 1 else [f"{name} | {label}" for label in col_labels]
+        for j, label in enumerate(labels[:-1]):
+            body[label] = pd.Series(grid[:, j], dtype=cells[col].dtype)
+            total_row[label] = col_totals[col].iloc[j]
+        body[labels[-1]] = row_totals[col]
+        total_row[labels[-1]] = grand[col].iloc[0]
+
+    detail = pd.concat([row_frame.astype(object), pd.DataFrame(body)], axis=1)
+    totals = pd.DataFrame([{**{dim: CROSSTAB_TOTAL_LABEL for dim in rows}, **total_row}])
+    result = pd.concat([detail, totals], ignore_index=True)
+    result.insert(0, SUBTOTAL_COLUMN, ["Detail"] * n_rows + ["Grand Total"])
+    for name in body:
+        if is_float_dtype(result[name]):
+            result[name] = result[name].round(2)
+    return result
+
+# Approximate Distinct Count / Median: per-group mergeable sketches. Distinct
+# counts use HyperLogLog registers over 64-bit value hashes (merge: register
+# max); medians use a log-bucket quantile sketch whose buckets are within
+# QUANTILE_ACCURACY relative error of any value they hold (merge: add counts).
+# Both are built with one vectorized pass per column, for a whole frame, a
+# chunk or a worker's shard alike.
+APPROXIMATE_AGGREGATIONS = ("Distinct Count", "Median")
+HLL_PRECISION = 10  # 1024 registers per group
+SKETCH_MAX_REGISTERS = 1 << 26  # more groups than this allows: count distinct values exactly
+QUANTILE_ACCURACY = 0.01
+QUANTILE_KEY_OFFSET = 1 << 20  # bucket indexes of any float64 magnitude stay below this
+SKETCH_ERRORS = {
+    "Distinct Count": f"±{104 / np.sqrt(1 << HLL_PRECISION):.1f}% (1 standard error, HyperLogLog)",
+    "Median": f"within ±{QUANTILE_ACCURACY:.0%} of the exact value (log-bucket quantile sketch)",
+}
+
+def value_hashes(series: pd.Series):
+    """(64-bit hash of every value, presence flags) - the HyperLogLog input of a column."""
+    if isinstance(series.dtype, pd.CategoricalDtype):  # hashes the categories once
+        hashes = pd.util.hash_pandas_object(series, index=False).to_numpy()
+    else:  # categorize=False: hashing every value beats factorizing a high-cardinality column first
+        hashes = pd.util.hash_array(series.to_numpy(), categorize=False)
+    return hashes, series.notna().to_numpy()
+
+def hll_registers(hashes: np.ndarray, gid: np.ndarray, n_groups: int, precision: int = HLL_PRECISION) -> np.ndarray:
+    """HyperLogLog registers (n_groups x 2**precision) of hashed values by group id."""
+    m = 1 << precision
+    index = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+    # Rank = position of the first 1-bit in the next 53 - precision bits (exact in float64)
+    rest = ((hashes >> np.uint64(11)) & np.uint64((1 << (53 - precision)) - 1)).astype(np.float64)
+    rank = (54 - precision - np.frexp(rest)[1]).astype(np.uint8)
+    registers = np.zeros(n_groups * m, dtype=np.uint8)
+    np.maximum.at(registers, gid * m + index, rank)
+    return registers.reshape(n_groups, m)
+
+def hll_estimate(registers: np.ndarray) -> np.ndarray:
+    """Distinct-count estimate per group (row) of HyperLogLog registers."""
+    n_groups, m = registers.shape
+    alpha = 0.7213 / (1 + 1.079 / m)
+    inverse = np.ldexp(1.0, -np.arange(256))
+    harmonic = np.empty(n_groups)
+    block = max(KERNEL_DENSE_SLOTS // m, 1)
+    for lo in range(0, n_groups, block):
+        harmonic[lo:lo + block] = inverse[registers[lo:lo + block]].sum(axis=1)
+    raw = alpha * m * m / harmonic
+    zeros = (registers == 0).sum(axis=1)
+    with np.errstate(divide="ignore"):
+        linear = m * np.log(m / zeros)  # small-range correction
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+def quantile_sketch(values: np.ndarray, gid: np.ndarray, n_groups: int,
+                    accuracy: float = QUANTILE_ACCURACY) -> dict:
+    """Log-bucket sketch {group, key, n} of numeric values by group id, sorted by (group, key)."""
+    gamma = (1 + accuracy) / (1 - accuracy)
+    magnitude = np.abs(values)
+    nonzero = magnitude > 0
+    bucket = np.zeros(len(values), dtype=np.int64)
+    bucket[nonzero] = np.ceil(np.log(magnitude[nonzero]) / np.log(gamma)).astype(np.int64) + QUANTILE_KEY_OFFSET
+    key = np.sign(values).astype(np.int64) * bucket  # ordered like the values; 0 holds exact zeros
+    span = 4 * QUANTILE_KEY_OFFSET
+    pairs, counts = pair_counts(gid * span + key + span // 2, n_groups * span)
+    return {"group": pairs // span, "key": pairs % span - span // 2, "n": counts}
+
+def merge_quantile_sketches(sketches: List[dict], n_groups: int) -> dict:
+    """One quantile sketch holding the values of all sketches."""
+    span = 4 * QUANTILE_KEY_OFFSET
+    pairs = np.concatenate([sk["group"] * span + sk["key"] + span // 2 for sk in sketches])
+    weights = np.concatenate([sk["n"] for sk in sketches])
+    order = np.argsort(pairs, kind="stable")
+    pairs, weights = pairs[order], weights[order]
+    starts = np.flatnonzero(np.diff(pairs, prepend=-1))
+    pairs = pairs[starts]
+    return {"group": pairs // span, "key": pairs % span - span // 2, "n": np.add.reduceat(weights, starts)}
+
+def quantile_estimate(sketch: dict, n_groups: int, q: float = 0.5,
+                      accuracy: float = QUANTILE_ACCURACY) -> np.ndarray:
+    """q-quantile per group (pandas' linear interpolation between bucket values); NaN for empty groups."""
+    gamma = (1 + accuracy) / (1 - accuracy)
+    key = sketch["key"]
+    level = np.abs(key) - QUANTILE_KEY_OFFSET
+    value = np.where(key == 0, 0.0, np.sign(key) * 2 * np.power(gamma, level.astype(np.float64)) / (gamma + 1))
+    if not len(value):
+        return np.full(n_groups, np.nan)
+    cum = np.cumsum(sketch["n"])
+    total = np.bincount(sketch["group"], weights=sketch["n"], minlength=n_groups).astype(np.int64)
+    before = np.concatenate([[0], cum])[np.searchsorted(sketch["group"], np.arange(n_groups))]
+    position = q * np.maximum(total - 1, 0)
+    low, high = np.floor(position).astype(np.int64), np.ceil(position).astype(np.int64)
+    last = len(value) - 1
+    low_value = value[np.minimum(np.searchsorted(cum, before + low, side="right"), last)]
+    high_value = value[np.minimum(np.searchsorted(cum, before + high, side="right"), last)]
+    return np.where(total > 0, low_value + (high_value - low_value) * (position - low), np.nan)
+
+def approximate_column(series: pd.Series, agg_type: str, group_id: np.ndarray, n_groups: int) -> np.ndarray:
+    """Sketch estimate of Distinct Count / Median of series per group id (-1: no group)."""
+    if agg_type == "Distinct Count":
+        hashes, present = value_hashes(series)
+        keep = present & (group_id >= 0)
+        return np.rint(hll_estimate(hll_registers(hashes[keep], group_id[keep], n_groups))).astype(np.int64)
+    keep = group_id >= 0
+    values = as_numeric(series).to_numpy().astype(np.float64)
+    return quantile_estimate(quantile_sketch(values[keep], group_id[keep], n_groups), n_groups)
+
+def sketched_columns(agg_map: Dict[str, str], rows: List[str], n_groups: int) -> Dict[str, str]:
+    """The columns of agg_map an approximate pivot with n_groups groups answers from sketches."""
+    fits = n_groups * (1 << HLL_PRECISION) <= SKETCH_MAX_REGISTERS
+    return {c: a for c, a in agg_map.items()
+            if a in APPROXIMATE_AGGREGATIONS and c not in rows and (fits or a == "Median")}
+
+def finish_sketched(result: pd.DataFrame, rows: List[str], agg_map: Dict[str, str],
+                    estimates: Dict[str, np.ndarray]) -> pd.DataFrame:
+    """Add sketch estimates to an exact result, in agg_map order, noting their error bounds."""
+    names = dict(zip(agg_map, finish_pivot(pd.DataFrame(columns=list(agg_map)), agg_map).columns))
+    result = result.assign(**{names[c]: np.round(v, 2) if v.dtype.kind == "f" else v for c, v in estimates.items()})
+    result = result[rows + list(names.values())]
+    result.attrs["error_bounds"] = {names[c]: SKETCH_ERRORS[agg_map[c]] for c in estimates}
+    return result
+
+def pivot_sketched(target_df: pd.DataFrame, rows: List[str], agg_map: Dict[str, str]) -> pd.DataFrame:
+    """pivot_scan with Distinct Count and Median estimated from sketches (see SKETCH_ERRORS)."""
+    grouping = group_keys(target_df, rows)
+    if grouping is None or not len(grouping[1]):
+        return pivot_scan(target_df, rows, agg_map)
+    group_id, key_frame = grouping
+    sketched = sketched_columns(agg_map, rows, len(key_frame))
+    if not sketched:
+        return pivot_scan(target_df, rows, agg_map)
+    exact = {c: a for c, a in agg_map.items() if c not in sketched}
+    result = pivot_scan(target_df, rows, exact) if exact else key_frame
+    estimates = {c: approximate_column(target_df[c], a, group_id, len(key_frame)) for c, a in sketched.items()}
+    return finish_sketched(result, rows, agg_map, estimates)
+
+# Parallel pivot: the factorized group ids and the value columns (as numbers,
+# presence flags or value codes) are placed in shared memory, a process pool
+# reduces contiguous row shards to per-group partials - the same partials and
+# value-count sketches the cube keeps per cell - and the (shard, group) cells
+# are merged exactly like cube cells by pivot_from_cube.
+PIVOT_WORKERS = int(os.environ.get("UDISE_PIVOT_WORKERS", str(os.cpu_count() or 1)))
+PIVOT_PARALLEL_MIN_ROWS = int(os.environ.get("UDISE_PIVOT_PARALLEL_ROWS", "500000"))
+
+def worker_pool(max_workers: int):
+    """A process pool started from a fork server; None where there is none.
+
+    Forking the multi-threaded Streamlit server itself can deadlock on locks
+    other threads hold, so workers come from a clean server process that has
+    only imported udise_workers; tasks are submitted as udise_workers.run.
+    Workers never re-run this script (see udise_workers.context).
+    """
+    context = udise_workers.context()
+    if context is None:
+        return None
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+
+@st.cache_resource(show_spinner=False)
+def _pivot_pool():
+    """Process-wide worker pool (see worker_pool)."""
+    return worker_pool(PIVOT_WORKERS)
+
+def _value_counts(gid: np.ndarray, codes: np.ndarray, n_groups: int, n_codes: int) -> dict:
+    """Occurrences of each (group, value code) pair, as a cube sketch."""
+    pairs, counts = pair_counts(gid * n_codes + codes, n_groups * n_codes)
+    return {"cell": pairs // n_codes, "value": pairs % n_codes, "n": counts}
+
+def _attach_shard(spec: tuple, start: int, stop: int) -> np.ndarray:
+    """Copy rows start:stop of a shared array (the segment is closed before returning)."""
+    shm = SharedMemory(name=spec[0])
+    try:
+        shared = np.ndarray(spec[2], dtype=spec[1], buffer=shm.buf)
+        shard = shared[start:stop].copy()
+        del shared
+        return shard
+    finally:
+        shm.close()
+
+def pivot_shard(specs: dict, agg_map: Dict[str, str], n_groups: int, n_total: int, n_codes: Dict[str, int],
+                start: int, stop: int, sketched: Dict[str, str] = None) -> dict:
+    """Worker: per-group partials and sketches of rows start:stop (see cube_partials / cube_sketch).
+
+    Columns in sketched get mergeable approximate sketches instead ("hll" / "quantile").
+    """
+    gid = _attach_shard(specs["gid"], start, stop)
+    valid = gid >= 0
+    gid = gid[valid]
+    rows = np.bincount(gid, minlength=n_groups)
+    partials, sketches = {col: {} for col in agg_map}, {}
+    for col, agg_type in agg_map.items():
+        data = _attach_shard(specs[col], start, stop)[valid]
+        if col in (sketched or {}):
+            if agg_type == "Distinct Count":
+                present = _attach_shard(specs[f"{col}|present"], start, stop)[valid]
+                sketches[(col, "hll")] = hll_registers(data[present], gid[present], n_groups)
+            else:
+                sketches[(col, "quantile")] = quantile_sketch(data, gid, n_groups)
+            continue
+        if data.dtype.kind in "iu":
+            data = data.astype(np.int64)
+        if agg_type == "Count":
+            partials[col] = {"count": _group_reduce(np.add, gid, data.astype(np.int64), n_groups, 0)}
+        elif agg_type in ("First", "Last"):
+            positions = start + np.flatnonzero(valid)
+            if agg_type == "First":
+                edge = _group_reduce(np.minimum, gid, np.where(data, positions, n_total), n_groups, n_total)
+            else:
+                edge = _group_reduce(np.maximum, gid, np.where(data, positions, -1), n_groups, -1)
+            partials[col] = {agg_type.lower(): edge}
+        elif agg_type in ("Distinct Count", "Median"):
+            seen = data >= 0
+            kind = "distinct" if agg_type == "Distinct Count" else "median"
+            sketches[(col, kind)] = _value_counts(gid[seen], data[seen], n_groups, n_codes[col])
+        elif agg_type in ("Sum", "Average"):
+            partials[col] = {"sum": _group_reduce(np.add, gid, data, n_groups, 0)}
+        elif agg_type == "Min":
+            partials[col] = {"min": _group_reduce(np.minimum, gid, data, n_groups, data.max(initial=0))}
+        elif agg_type == "Max":
+            partials[col] = {"max": _group_reduce(np.maximum, gid, data, n_groups, data.min(initial=0))}
+        else:  # Std Dev: Welford state (mean, M2) per group
+            with np.errstate(divide="ignore", invalid="ignore"):
+                mean = _group_reduce(np.add, gid, data.astype("float64"), n_groups, 0.0) / rows
+            partials[col] = {"mean": mean, "m2": _group_reduce(np.add, gid, (data - mean[gid]) ** 2, n_groups, 0.0)}
+    return {"rows": rows, "partials": partials, "sketches": sketches}
+
+def pivot_parallel(target_df: pd.DataFrame, rows: List[str], agg_map: Dict[str, str], executor,
+                   n_shards: int, approximate: bool = False) -> pd.DataFrame:
+    """pivot_scan (approximate: pivot_sketched) of target_df as n_shards row shards on executor, merged."""
+    df_pivot = target_df[list(dict.fromkeys(rows + list(agg_map)))].copy(deep=False)
+    grouping = group_keys(df_pivot, rows) if not set(rows) & set(agg_map) else None
+    if grouping is None or not len(grouping[1]):
+        return pivot_sketched(target_df, rows, agg_map) if approximate else pivot_scan(target_df, rows, agg_map)
+    group_id, key_frame = grouping
+    n_groups, n_total = len(key_frame), len(df_pivot)
+    sketched = sketched_columns(agg_map, rows, n_groups) if approximate else {}
+
+    # Exact value counts travel as value codes (medians are decoded after the merge).
+    # Float sums and standard deviations would come out of a shard merge with
+    # their additions in another order than pivot_scan's, which can change the
+    # result; they are reduced here, in pivot_scan's own order, instead.
+    arrays, uniques, local = {"gid": group_id}, {}, {}
+    for col, agg_type in agg_map.items():
+        if agg_type == "Std Dev" and col not in sketched:
+            local[col] = agg_type
+        elif col in sketched:
+            if agg_type == "Distinct Count":
+                arrays[col], arrays[f"{col}|present"] = value_hashes(df_pivot[col])
+            else:
+                arrays[col] = as_numeric(df_pivot[col]).to_numpy().astype(np.float64)
+        elif agg_type in ("Count", "First", "Last"):
+            arrays[col] = df_pivot[col].notna().to_numpy()
+        elif agg_type in ("Distinct Count", "Median"):
+            values = df_pivot[col] if agg_type == "Distinct Count" else as_numeric(df_pivot[col])
+            codes, uniques[col] = pd.factorize(values)
+            arrays[col] = codes.astype(np.int64)
+        else:
+            values = kernel_values(df_pivot[col])  # widened in the workers
+            if agg_type in ("Sum", "Average") and values.dtype.kind == "f":
+                local[col] = agg_type
+            else:
+                arrays[col] = values
+    n_codes = {col: max(len(values), 1) for col, values in uniques.items()}
+    sharded = {col: agg_type for col, agg_type in agg_map.items() if col not in local}
+
+    blocks, specs = [], {}
+    try:
+        for name, values in arrays.items():
+            shm = SharedMemory(create=True, size=max(values.nbytes, 1))
+            blocks.append(shm)
+            np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)[:] = values
+            specs[name] = (shm.name, values.dtype.str, values.shape)
+        bounds = np.linspace(0, n_total, max(n_shards, 1) + 1).astype(int)
+        futures = [executor.submit(udise_workers.run, "pivot_shard", specs, sharded, n_groups, n_total, n_codes,
+                                   lo, hi, sketched)
+                   for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+        shards = [future.result() for future in futures]
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    # (shard, group) cells with rows become the cells of a throwaway cube
+    shard_rows = np.concatenate([shard["rows"] for shard in shards])
+    keep = shard_rows > 0
+    cell_of = np.cumsum(keep) - 1
+    partials = {col: {stat: np.concatenate([shard["partials"][col][stat] for shard in shards])[keep]
+                      for stat in shards[0]["partials"][col]} for col in shards[0]["partials"]}
+    sketches = {key: {"cell": np.concatenate([cell_of[i * n_groups + shard["sketches"][key]["cell"]]
+                                              for i, shard in enumerate(shards)]),
+                      "value": np.asarray(uniques[key[0]])[np.concatenate([shard["sketches"][key]["value"]
+                                                                           for shard in shards])]
+                      if key[1] == "median" else np.concatenate([shard["sketches"][key]["value"] for shard in shards]),
+                      "n": np.concatenate([shard["sketches"][key]["n"] for shard in shards])}
+                for key in shards[0]["sketches"] if key[0] not in sketched}
+    cube = {
+        "dims": rows, "frame": df_pivot, "rows": shard_rows[keep].astype(np.int64), "order": range(n_total),
+        "leaf": key_frame.take(np.tile(np.arange(n_groups), len(shards))[keep]).reset_index(drop=True),
+        "partials": partials, "sketches": sketches, "lock": threading.Lock(),
+    }
+    exact_map = {c: a for c, a in agg_map.items() if c not in sketched}
+    result = pivot_from_cube(cube, rows, {c: a for c, a in exact_map.items() if c not in local})
+    if local:  # same groups in the same (sorted key) order
+        scanned = pivot_scan(target_df, rows, local)
+        result = result.assign(**{name: scanned[name].to_numpy() for name in scanned.columns[len(rows):]})
+        names = finish_pivot(pd.DataFrame(columns=list(exact_map)), exact_map).columns
+        result = result[rows + list(names)]
+    if not sketched:
+        return result
+
+    estimates = {}
+    for col, agg_type in sketched.items():
+        if agg_type == "Distinct Count":
+            registers = np.maximum.reduce([shard["sketches"][(col, "hll")] for shard in shards])
+            estimates[col] = np.rint(hll_estimate(registers)).astype(np.int64)
+        else:
+            merged = merge_quantile_sketches([shard["sketches"][(col, "quantile")] for shard in shards], n_groups)
+            estimates[col] = quantile_estimate(merged, n_groups)
+    return finish_sketched(result, rows, agg_map, estimates)
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# COMPARE & MATCH ENGINE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+# Keys are normalized once per column: text is stripped, blanks are missing
+# (they never match), and digit codes - including Excel's "33012345678.0" -
+# lose their leading zeros and are packed into int64 so "033012345678",
+# 33012345678 and "33012345678.0" are one key. Both sides of each key column
+# are factorized into a shared code space; composite keys combine the column
+# codes. Every selection and diagnostic is then a bincount / gather over the
+# integer codes.
+DIGIT_KEY_PATTERN = r"\d{1,18}(?:\.0*)?"
+
+def normalize_keys(series: pd.Series, strip_zeros: bool = True):
+    """(int64 or text keys, missing mask) of a key column."""
+    if is_bool_dtype(series):
+        series = series.astype(object)
+    if is_integer_dtype(series):
+        return series.to_numpy(dtype="int64", na_value=0), series.isna().to_numpy()
+    if is_float_dtype(series):
+        values = series.to_numpy(dtype="float64", na_value=np.nan)
+        missing = np.isnan(values)
+        if (missing | ((values == np.floor(values)) & (np.abs(values) < 2 ** 53))).all():
+            return np.where(missing, 0, values).astype(np.int64), missing
+    text = series.astype("string").str.strip()
+    missing = (text.isna() | (text == "")).to_numpy()
+    digits = text.str.fullmatch(DIGIT_KEY_PATTERN).fillna(False).to_numpy(dtype=bool)
+    if strip_zeros and digits[~missing].all():
+        ints = np.zeros(len(text), dtype=np.int64)
+        ints[~missing] = text[~missing].str.replace(r"\.0*$", "", regex=True).astype("int64").to_numpy()
+        return ints, missing
+    if strip_zeros:
+        stripped = text.str.replace(r"\.0*$", "", regex=True).str.lstrip("0").replace("", "0")
+        text = text.where(~digits, stripped)
+    return text.to_numpy(dtype=object, na_value=None), missing
+
+def shared_key_codes(left: pd.Series, right: pd.Series, strip_zeros: bool = True):
+    """Codes of two key columns in one code space (-1: missing), and the number of distinct keys."""
+    (left_keys, left_missing), (right_keys, right_missing) = (normalize_keys(left, strip_zeros),
+                                                                normalize_keys(right, strip_zeros))
+    if left_keys.dtype != right_keys.dtype:  # one side has text keys: compare as text
+        left_keys, right_keys = (keys.astype(str).astype(object) if keys.dtype == np.int64 else keys
+                                 for keys in (left_keys, right_keys))
+    present = ~np.concatenate([left_missing, right_missing])
+    codes = np.full(len(present), -1, dtype=np.int64)
+    codes[present], uniques = pd.factorize(np.concatenate([left_keys, right_keys])[present])
+    return codes[:len(left)], codes[len(left):], len(uniques)
+
+def match_keys(master_df: pd.DataFrame, master_cols: List[str], compare_df: pd.DataFrame,
+               compare_cols: List[str], strip_zeros: bool = True) -> dict:
+    """Match master rows against comparison rows on (composite) key columns.
+
+    Returns the key code of every row on each side (-1: a key part is
+    missing), the number of distinct keys, and how many rows of each side
+    hold each key.
+    """
+    if not master_cols or len(master_cols) != len(compare_cols):
+        raise ValueError("Select the same number of key columns on both sides")
+    codes = None
+    for master_col, compare_col in zip(master_cols, compare_cols):
+        left, right, n_part = shared_key_codes(master_df[master_col], compare_df[compare_col], strip_zeros)
+        part = np.concatenate([left, right]).astype(np.int64)
+        if codes is None:
+            codes, n_keys = part, n_part
+        else:  # combine with the columns so far and compact, so the radix never overflows
+            valid = (codes >= 0) & (part >= 0)
+            compact, uniques = pd.factorize(codes[valid] * n_part + part[valid])
+            codes = np.full(len(part), -1, dtype=np.int64)
+            codes[valid] = compact
+            n_keys = len(uniques)
+    n_master = len(master_df)
+    master_codes, compare_codes = codes[:n_master], codes[n_master:]
+    return {
+        "master": master_codes, "compare": compare_codes, "n_keys": n_keys,
+        "master_counts": np.bincount(master_codes[master_codes >= 0], minlength=n_keys),
+        "compare_counts": np.bincount(compare_codes[compare_codes >= 0], minlength=n_keys),
+    }
+
+def _first_rows(codes: np.ndarray, n_keys: int) -> np.ndarray:
+    """Position of each key's first row (len(codes) where the key has none)."""
+    first = np.full(n_keys, len(codes), dtype=np.int64)
+    valid = np.flatnonzero(codes >= 0)
+    np.minimum.at(first, codes[valid], valid)
+    return first
+
+def match_summary(match: dict) -> dict:
+    """Key-level counts of a match_keys result."""
+    in_master, in_compare = match["master_counts"] > 0, match["compare_counts"] > 0
+    return {
+        "master_keys": int(in_master.sum()), "compare_keys": int(in_compare.sum()),
+        "matched": int((in_master & in_compare).sum()),
+        "master_only": int((in_master & ~in_compare).sum()),
+        "compare_only": int((in_compare & ~in_master).sum()),
+        "master_duplicates": int((match["master_counts"] > 1).sum()),
+        "compare_duplicates": int((match["compare_counts"] > 1).sum()),
+        "master_blank": int((match["master"] < 0).sum()), "compare_blank": int((match["compare"] < 0).sum()),
+    }
+
+def duplicate_keys(match: dict, master_df: pd.DataFrame, master_cols: List[str], compare_df: pd.DataFrame,
+                   compare_cols: List[str]) -> pd.DataFrame:
+    """Keys held by more than one row on either side, as first seen, with each side's row count."""
+    dup = np.flatnonzero((match["master_counts"] > 1) | (match["compare_counts"] > 1))
+    first_master = _first_rows(match["master"], match["n_keys"])[dup]
+    first_compare = _first_rows(match["compare"], match["n_keys"])[dup]
+    in_master = first_master < len(master_df)
+    keys = {}
+    for col, compare_col in zip(master_cols, compare_cols):
+        values = np.empty(len(dup), dtype=object)
+        values[in_master] = master_df[col].to_numpy(dtype=object)[first_master[in_master]]
+        values[~in_master] = compare_df[compare_col].to_numpy(dtype=object)[first_compare[~in_master]]
+        keys[col] = values
+    keys = pd.DataFrame(keys)
+    keys["Master_Rows"] = match["master_counts"][dup]
+    keys["Comparison_Rows"] = match["compare_counts"][dup]
+    return keys
+
+# Field diff: each matched master row is paired with the first comparison row
+# of its key (the row its extra columns come from) and every mapped column
+# pair is compared over all pairs at once. Numbers are equal within an
+# absolute tolerance; text is equal after trimming, collapsing whitespace and
+# case-folding. A blank on both sides is no change.
+COLUMN_NAME_NOISE = re.compile(r"[^0-9a-z]+")
+DIFF_NUMERIC_SHARE = 0.9  # a text column compares as numbers when this share of its filled values parse
+
+def suggest_column_mapping(master_columns, compare_columns) -> Dict[str, str]:
+    """Master -> comparison columns whose names agree ignoring case, spaces and punctuation."""
+    name_key = lambda col: COLUMN_NAME_NOISE.sub("", str(col).casefold())
+    by_key = {}
+    for col in compare_columns:
+        by_key.setdefault(name_key(col), col)
+    return {col: by_key[name_key(col)] for col in master_columns if name_key(col) in by_key}
+
+def _diff_numbers(values: pd.Series):
+    """float64 values of a column (NaN: blank or not a number), or None when it holds text."""
+    if is_bool_dtype(values):
+        return None
+    if is_numeric_dtype(values):
+        return values.to_numpy(dtype="float64", na_value=np.nan)
+    codes, uniques = pd.factorize(values)  # parse each distinct value once
+    parsed = pd.to_numeric(pd.Series(uniques, dtype=object), errors="coerce").to_numpy(dtype="float64",
+                                                                                        na_value=np.nan)
+    numbers = np.append(parsed, np.nan)[codes]
+    filled = np.count_nonzero(codes >= 0)
+    return numbers if filled and np.count_nonzero(~np.isnan(numbers)) >= DIFF_NUMERIC_SHARE * filled else None
+
+def _diff_text(values: pd.Series) -> np.ndarray:
+    """Normalized text of a column, blanks as ""."""
+    codes, uniques = pd.factorize(values)
+    text = pd.Series(uniques, dtype="string").str.strip().str.replace(r"\s+", " ", regex=True).str.casefold()
+    return np.append(text.to_numpy(dtype=object, na_value=""), "")[codes]
+
+def diff_fields(master_df: pd.DataFrame, compare_df: pd.DataFrame, master_rows: np.ndarray,
+                compare_rows: np.ndarray, field_map: Dict[str, str], key_cols: List[str],
+                tolerance: float = 0.0):
+    """Compare mapped columns of paired rows (positions into each frame).
+
+    Returns the per-column mismatch counts, the long table of changed values
+    (one row per pair and column) and the number of changed columns of each
+    pair.
+    """
+    master_part = master_df[list(dict.fromkeys([*key_cols, *field_map]))].iloc[master_rows].reset_index(drop=True)
+    compare_part = compare_df[list(dict.fromkeys(field_map.values()))].iloc[compare_rows].reset_index(drop=True)
+    changed_per_row = np.zeros(len(master_rows), dtype=np.int64)
+    counts, changes = [], []
+    for col, compare_col in field_map.items():
+        left, right = master_part[col], compare_part[compare_col]
+        left_num, right_num = _diff_numbers(left), _diff_numbers(right)
+        numeric = left_num is not None and right_num is not None
+        changed = np.zeros(len(master_part), dtype=bool)
+        text_rows = np.ones(len(master_part), dtype=bool)
+        if numeric:
+            both = ~np.isnan(left_num) & ~np.isnan(right_num)
+            changed[both] = np.abs(left_num[both] - right_num[both]) > tolerance
+            text_rows = ~both  # blanks and stray text compare as text
+        if text_rows.any():
+            rows = np.flatnonzero(text_rows)
+            changed[rows] = _diff_text(left.iloc[rows]) != _diff_text(right.iloc[rows])
+        changed_per_row += changed
+        counts.append({"Column": col, "Comparison_Column": compare_col,
+                       "Type": "Numeric" if numeric else "Text", "Compared": len(master_part),
+                       "Mismatches": int(changed.sum()),
+                       "Mismatch_Rate": f"{changed.mean() * 100:.1f}%" if len(master_part) else "N/A"})
+        rows = np.flatnonzero(changed)
+        if len(rows):
+            change = {"_pair": rows, "Column": col,
+                      "Master_Value": left.iloc[rows].astype("string").to_numpy(),
+                      "Comparison_Value": right.iloc[rows].astype("string").to_numpy(),
+                      "Difference": right_num[rows] - left_num[rows] if numeric else np.nan}
+            changes.append(pd.DataFrame(change))
+    mismatches = pd.DataFrame(counts, columns=["Column", "Comparison_Column", "Type", "Compared",
+                                               "Mismatches", "Mismatch_Rate"])
+    if changes:
+        changed_values = pd.concat(changes, ignore_index=True)
+        changed_values = changed_values.iloc[np.argsort(changed_values["_pair"].to_numpy(), kind="stable")]
+    else:
+        changed_values = pd.DataFrame(columns=["_pair", "Column", "Master_Value", "Comparison_Value",
+                                               "Difference"])
+    pairs = changed_values.pop("_pair").to_numpy(dtype=np.int64)
+    keys = master_part[list(key_cols)].iloc[pairs].reset_index(drop=True)
+    changed_values = pd.concat([keys, changed_values.reset_index(drop=True)], axis=1)
+    return mismatches, changed_values, changed_per_row
+
+# Fuzzy pass over unmatched rows: names are cut into character n-grams
+# (codepoints packed into one int64 per gram, so Tamil works as well as
+# Latin), rows are blocked on District/Block codes shared by both sides, and
+# an inverted index on (block, gram) yields the candidate pairs. Grams that
+# more than FUZZY_MAX_POSTINGS rows of a block share ("sch", "gov") tell
+# names apart as little as stop words do; they are left out, which also caps
+# the candidates of every gram, so the work grows linearly with the rows.
+# Pairs are scored by the Dice coefficient of their remaining grams.
+FUZZY_NGRAM = 3
+FUZZY_MAX_NAME_CHARS = 64
+FUZZY_MAX_POSTINGS = 50
+FUZZY_CHUNK_PAIRS = 4_000_000
+FUZZY_MIN_SCORE = 0.5
+FUZZY_TOP_K = 3
+# Spaces and punctuation, spelt out: the Arrow regex engine's \W is ASCII-only and would erase Tamil
+NAME_PUNCTUATION = "[\\s!-/:-@\\[-`{-~\u2018-\u201f]+"
+
+def name_grams(names: pd.Series, n: int = FUZZY_NGRAM):
+    """(row, gram) pairs of the distinct character n-grams of each name, as row positions and packed grams."""
+    text = (names.astype("string").str.casefold().str.replace(NAME_PUNCTUATION, " ", regex=True).str.strip()
+            .str.slice(0, FUZZY_MAX_NAME_CHARS).fillna(""))
+    text = (" " + text + " ").where(text != "", "")  # pad so word edges form grams
+    lengths = text.str.len().to_numpy(dtype=np.int64)
+    width = int(lengths.max()) if len(lengths) else 0
+    if width < n:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    chars = text.to_numpy(dtype=f"<U{width}").view(np.uint32).reshape(len(text), width).astype(np.int64)
+    grams = chars[:, :width - n + 1].copy()
+    for offset in range(1, n):
+        grams = (grams << 21) | chars[:, offset:width - n + 1 + offset]
+    valid = np.arange(width - n + 1) <= (lengths - n)[:, None]
+    rows = np.broadcast_to(np.arange(len(text))[:, None], valid.shape)[valid]
+    grams = grams[valid]
+    pairs = pd.DataFrame({"row": rows, "gram": grams}).drop_duplicates()
+    return pairs["row"].to_numpy(), pairs["gram"].to_numpy()
+
+def fuzzy_candidates(master_df: pd.DataFrame, compare_df: pd.DataFrame, master_name: str, compare_name: str,
+                     master_blocks: List[str] = (), compare_blocks: List[str] = (),
+                     min_score: float = FUZZY_MIN_SCORE, top_k: int = FUZZY_TOP_K) -> pd.DataFrame:
+    """Ranked candidate pairs of similar names within the same block.
+
+    Returns Master_Row / Comparison_Row positions, the Dice Score and the
+    Rank of each candidate among those of its master row (best first).
+    """
+    n_master, n_compare = len(master_df), len(compare_df)
+    columns = ["Master_Row", "Comparison_Row", "Score", "Rank"]
+    if not n_master or not n_compare:
+        return pd.DataFrame(columns=columns)
+    if len(master_blocks) != len(compare_blocks):
+        raise ValueError("Select the same number of block columns on both sides")
+    if master_blocks:
+        blocks = match_keys(master_df, list(master_blocks), compare_df, list(compare_blocks))
+        block_of = np.concatenate([blocks["master"], blocks["compare"]])
+    else:
+        block_of = np.zeros(n_master + n_compare, dtype=np.int64)
+    rows, grams = name_grams(pd.concat([master_df[master_name], compare_df[compare_name]], ignore_index=True))
+    gram_ids, gram_values = pd.factorize(grams)
+    keep = block_of[rows] >= 0  # rows without a block are never compared
+    rows, keys = rows[keep], block_of[rows[keep]] * len(gram_values) + gram_ids[keep]
+
+    # Drop grams shared by too many rows of a block on either side
+    key_ids, key_values = pd.factorize(keys)
+    is_master = rows < n_master
+    too_common = ((np.bincount(key_ids[is_master], minlength=len(key_values)) > FUZZY_MAX_POSTINGS)
+                  | (np.bincount(key_ids[~is_master], minlength=len(key_values)) > FUZZY_MAX_POSTINGS))
+    keep = ~too_common[key_ids]
+    rows, key_ids, is_master = rows[keep], key_ids[keep], is_master[keep]
+    sizes = np.bincount(rows, minlength=n_master + n_compare)
+
+    # Join master postings with the comparison postings of the same key, a
+    # slice of master rows at a time so the pairs in memory stay bounded
+    master_rows, master_keys = rows[is_master], key_ids[is_master]
+    order = np.argsort(key_ids[~is_master], kind="stable")
+    compare_keys, compare_rows = key_ids[~is_master][order], rows[~is_master][order] - n_master
+    lo = np.searchsorted(compare_keys, master_keys, side="left")
+    hits = np.searchsorted(compare_keys, master_keys, side="right") - lo
+    row_pairs = np.cumsum(np.bincount(master_rows, weights=hits, minlength=n_master))
+    bounds = np.searchsorted(row_pairs, np.arange(FUZZY_CHUNK_PAIRS, row_pairs[-1], FUZZY_CHUNK_PAIRS))
+    candidates = []
+    for first, last in zip(np.r_[0, bounds], np.r_[bounds, n_master - 1] + 1):
+        chunk = slice(*np.searchsorted(master_rows, [first, last]))
+        chunk_hits = hits[chunk]
+        total = int(chunk_hits.sum())
+        if not total:
+            continue
+        starts = np.repeat(lo[chunk] - (np.cumsum(chunk_hits) - chunk_hits), chunk_hits) + np.arange(total)
+        pairs = (np.repeat(master_rows[chunk] - first, chunk_hits) * n_compare + compare_rows[starts])
+        pairs, shared = pair_counts(pairs, (last - first) * n_compare)
+        left, right = pairs // n_compare + first, pairs % n_compare
+        scores = 2 * shared / (sizes[left] + sizes[n_master + right])
+        good = scores >= min_score
+        left, right, scores = left[good], right[good], scores[good]
+        order = np.lexsort((right, -scores, left))
+        left, right, scores = left[order], right[order], scores[order]
+        group_start = np.flatnonzero(np.diff(left, prepend=-1))
+        ranks = np.arange(len(left)) - np.repeat(group_start, np.diff(np.append(group_start, len(left)))) + 1
+        top = ranks <= top_k
+        candidates.append(pd.DataFrame({"Master_Row": left[top], "Comparison_Row": right[top],
+                                        "Score": np.round(scores[top], 3), "Rank": ranks[top]}))
+    return pd.concat(candidates, ignore_index=True) if candidates else pd.DataFrame(columns=columns)
+
+def fuzzy_report(master_df: pd.DataFrame, compare_df: pd.DataFrame, master_rows: np.ndarray,
+                 compare_rows: np.ndarray, master_cols: List[str], compare_cols: List[str],
+                 fuzzy: dict) -> pd.DataFrame:
+    """fuzzy_candidates of the given rows, with each side's key, name and block columns."""
+    master_part, compare_part = master_df.iloc[master_rows], compare_df.iloc[compare_rows]
+    candidates = fuzzy_candidates(master_part, compare_part, **fuzzy)
+    master_show = list(dict.fromkeys([*master_cols, fuzzy["master_name"], *fuzzy.get("master_blocks", ())]))
+    compare_show = list(dict.fromkeys([*compare_cols, fuzzy["compare_name"]]))
+    report = master_part[master_show].iloc[candidates["Master_Row"].to_numpy(dtype=np.int64)]
+    report = report.reset_index(drop=True)
+    matches = compare_part[compare_show].iloc[candidates["Comparison_Row"].to_numpy(dtype=np.int64)]
+    for col in compare_show:
+        report[f"{col}_compare" if col in report.columns else col] = matches[col].to_numpy()
+    report["Score"] = candidates["Score"].to_numpy(dtype="float64")
+    report["Rank"] = candidates["Rank"].to_numpy(dtype=np.int64)
+    return report
+
+def compare_frames(master_df: pd.DataFrame, compare_df: pd.DataFrame, master_cols: List[str],
+                   compare_cols: List[str], outputs: List[str], extra_cols: List[str] = (),
+                   strip_zeros: bool = True, field_map: Dict[str, str] = None, tolerance: float = 0.0,
+                   fuzzy: dict = None, match: dict = None):
+    """Compare & Match results (keyed like the tab's outputs) and the match_summary counts.
+
+    Matched master rows take extra_cols from the first comparison row with
+    their key, so repeated comparison keys never duplicate master rows; they
+    are listed under "duplicate_keys" instead. With a field_map (master ->
+    comparison column) the same row pairs are diffed into "field_mismatches"
+    and "changed_values". With fuzzy (fuzzy_candidates arguments: names and
+    block columns) the rows left unmatched on both sides are paired by name
+    into "fuzzy_candidates". match may be passed in when the keys are already
+    matched (see index_match).
+    """
+    if match is None:
+        match = match_keys(master_df, master_cols, compare_df, compare_cols, strip_zeros)
+    summary = match_summary(match)
+    master_codes, compare_codes = match["master"], match["compare"]
+    # A trailing 0 count makes code -1 (blank key) index "no rows"
+    master_matched = np.append(match["compare_counts"], 0)[master_codes] > 0
+    compare_matched = np.append(match["master_counts"], 0)[compare_codes] > 0
+    master_rows = np.flatnonzero(master_matched)
+    compare_rows = _first_rows(compare_codes, match["n_keys"])[master_codes[master_rows]]
+
+    changed_per_row = None
+    if field_map:
+        mismatches, changed_values, changed_per_row = diff_fields(
+            master_df, compare_df, master_rows, compare_rows, field_map, master_cols, tolerance)
+        summary["changed_records"] = int(np.count_nonzero(changed_per_row))
+
+    results = {}
+    if "Matched Records" in outputs:
+        matched_df = master_df.iloc[master_rows].copy()
+        if extra_cols:
+            extras = compare_df[list(extra_cols)].iloc[compare_rows]
+            for col in extra_cols:
+                matched_df[f"{col}_compare" if col in matched_df.columns else col] = extras[col].to_numpy()
+        matched_df["_match_status"] = "Matched"
+        if changed_per_row is not None:
+            matched_df["_changed_fields"] = changed_per_row
+        results["matched"] = matched_df
+    if "Not Matched (in Master)" in outputs:
+        not_in_compare = master_df[~master_matched].copy()
+        not_in_compare["_match_status"] = np.where(master_codes[~master_matched] < 0, "Blank Key",
+                                                   "Not in Comparison File")
+        results["not_matched_master"] = not_in_compare
+    if "Not Matched (in Comparison)" in outputs:
+        not_in_master = compare_df[~compare_matched].copy()
+        not_in_master["_match_status"] = np.where(compare_codes[~compare_matched] < 0, "Blank Key",
+                                                  "Not in Master Data")
+        results["not_matched_compare"] = not_in_master
+    if "Full Comparison Report" in outputs:
+        rate = lambda side: f"{summary['matched'] / summary[side] * 100:.1f}%" if summary[side] else "N/A"
+        results["report"] = pd.DataFrame({
+            "Metric": ["Total Master Records", "Total Comparison Records", "Matched Records",
+                       "Not Matched (Master Only)", "Not Matched (Comparison Only)",
+                       "Match Rate (Master)", "Match Rate (Comparison)",
+                       "Duplicate Keys (Master)", "Duplicate Keys (Comparison)",
+                       "Blank Keys (Master)", "Blank Keys (Comparison)"],
+            "Value": [summary["master_keys"], summary["compare_keys"], summary["matched"],
+                      summary["master_only"], summary["compare_only"], rate("master_keys"), rate("compare_keys"),
+                      summary["master_duplicates"], summary["compare_duplicates"],
+                      summary["master_blank"], summary["compare_blank"]],
+        })
+        if field_map:
+            results["report"].loc[len(results["report"])] = ["Matched Records With Changed Values",
+                                                             summary["changed_records"]]
+    if summary["master_duplicates"] or summary["compare_duplicates"]:
+        results["duplicate_keys"] = duplicate_keys(match, master_df, master_cols, compare_df, compare_cols)
+    if field_map:
+        results["field_mismatches"] = mismatches
+        results["changed_values"] = changed_values
+    if fuzzy:
+        results["fuzzy_candidates"] = fuzzy_report(master_df, compare_df, np.flatnonzero(~master_matched),
+                                                   np.flatnonzero(~compare_matched), master_cols, compare_cols,
+                                                   fuzzy)
+        summary["fuzzy_matches"] = int(results["fuzzy_candidates"]["Rank"].eq(1).sum())
+        if "report" in results:
+            results["report"].loc[len(results["report"])] = ["Unmatched Master Records With Fuzzy Candidates",
+                                                             summary["fuzzy_matches"]]
+    return results, summary
+
+# Batch compare: the master's key columns are normalized and factorized once
+# into a key index, shared with the worker processes once per batch; workers
+# parse the returned files, normalize their keys and look them up in the index
+# (keys the master lacks get codes after the master's), so each file costs only
+# its own rows. The parent turns every file's match into the usual
+# compare_frames outputs and a summary row. Files are keyed by a unique name:
+# ZIP members by archive and member path, repeats numbered.
+BATCH_EXTENSIONS = (".csv", ".xlsx", ".xls")
+
+def master_key_index(master_df: pd.DataFrame, master_cols: List[str], strip_zeros: bool = True) -> dict:
+    """Normalized distinct values of each key column and the key code of every master row."""
+    uniques, codes = [], []
+    for col in master_cols:
+        keys, missing = normalize_keys(master_df[col], strip_zeros)
+        col_codes = np.full(len(keys), -1, dtype=np.int64)
+        col_codes[~missing], col_uniques = pd.factorize(keys[~missing])
+        uniques.append(pd.Index(col_uniques))
+        codes.append(col_codes)
+    valid = np.logical_and.reduce([c >= 0 for c in codes])
+    master = np.full(len(master_df), -1, dtype=np.int64)
+    if len(codes) == 1:
+        key_index, n_keys = None, len(uniques[0])
+        master[valid] = codes[0][valid]
+    else:  # composite keys: the distinct tuples of column codes
+        master[valid], key_index = pd.MultiIndex.from_arrays([c[valid] for c in codes]).factorize()
+        n_keys = len(key_index)
+    return {"uniques": uniques, "key_index": key_index, "n_keys": n_keys, "strip_zeros": strip_zeros,
+            "master": master, "master_counts": np.bincount(master[master >= 0], minlength=n_keys)}
+
+def index_lookup(index: dict, compare_df: pd.DataFrame, compare_cols: List[str]) -> np.ndarray:
+    """Key codes of comparison rows against a master_key_index (-1: missing; n_keys and up: not in master)."""
+    if len(compare_cols) != len(index["uniques"]):
+        raise ValueError("Select the same number of key columns on both sides")
+    n_rows, codes, present = len(compare_df), [], np.ones(len(compare_df), dtype=bool)
+    for col, uniques in zip(compare_cols, index["uniques"]):
+        keys, missing = normalize_keys(compare_df[col], index["strip_zeros"])
+        if len(uniques) and (keys.dtype == np.int64) != (uniques.dtype == np.int64):  # compare as text
+            keys, uniques = keys.astype(str).astype(object), pd.Index(uniques.astype(str), dtype=object)
+        col_codes = np.full(n_rows, -1, dtype=np.int64)
+        col_codes[~missing] = uniques.get_indexer(keys[~missing])
+        unknown = ~missing & (col_codes < 0)  # values the master never holds: numbered after its own
+        col_codes[unknown] = len(uniques) + pd.factorize(keys[unknown])[0]
+        codes.append(col_codes)
+        present &= ~missing
+    known = present & np.logical_and.reduce([c < len(u) for c, u in zip(codes, index["uniques"])])
+    ids = np.full(n_rows, -1, dtype=np.int64)
+    if index["key_index"] is None:
+        ids[known] = codes[0][known]
+    elif known.any():
+        ids[known] = index["key_index"].get_indexer(pd.MultiIndex.from_arrays([c[known] for c in codes]))
+    new = present & (ids < 0)
+    if new.any():
+        parts = [c[new] for c in codes]
+        ids[new] = index["n_keys"] + (pd.factorize(parts[0])[0] if len(parts) == 1
+                                      else pd.MultiIndex.from_arrays(parts).factorize()[0])
+    return ids
+
+def index_match(index: dict, compare_codes: np.ndarray) -> dict:
+    """A match_keys result from a master_key_index and the index_lookup codes of one file."""
+    n_keys = max(index["n_keys"], int(compare_codes.max(initial=-1)) + 1)
+    return {"master": index["master"], "compare": compare_codes, "n_keys": n_keys,
+            "master_counts": np.pad(index["master_counts"], (0, n_keys - index["n_keys"])),
+            "compare_counts": np.bincount(compare_codes[compare_codes >= 0], minlength=n_keys)}
+
+def resolve_key_columns(columns, master_cols: List[str], preferred: List[str]) -> List[str]:
+    """A file's key columns: the preferred names, else names agreeing with the master's, else a UDISE column."""
+    columns = list(columns)
+    if preferred and all(col in columns for col in preferred):
+        return list(preferred)
+    mapping = suggest_column_mapping(master_cols, columns)
+    if all(col in mapping for col in master_cols):
+        return [mapping[col] for col in master_cols]
+    udise_cols = suggest_column_mapping(UDISE_CANDIDATES, columns)
+    if len(master_cols) == 1 and udise_cols:
+        return [next(iter(udise_cols.values()))]
+    raise ValueError(f"No key column matching {', '.join(master_cols)}")
+
+def unique_names(names) -> List[str]:
+    """names with repeats made distinct: the second "a.csv" becomes "a (2).csv", and so on."""
+    taken, unique = set(), []
+    for name in names:
+        stem, ext = os.path.splitext(name)
+        candidate, n = name, 1
+        while candidate in taken:
+            n += 1
+            candidate = f"{stem} ({n}){ext}"
+        taken.add(candidate)
+        unique.append(candidate)
+    return unique
+
+def expand_batch_uploads(uploads) -> List[tuple]:
+    """(file name, bytes) of every table among the uploads, ZIP archives unpacked.
+
+    ZIP members are named "archive.zip/member/path.csv".
+    """
+    files = []
+    for name, payload in uploads:
+        if name.lower().endswith(".zip"):
+            with zipfile.ZipFile(BytesIO(payload)) as archive:
+                for member in archive.infolist():
+                    base = os.path.basename(member.filename)
+                    if (not member.is_dir() and not member.filename.startswith("__MACOSX/")
+                            and not base.startswith(".") and base.lower().endswith(BATCH_EXTENSIONS)):
+                        files.append((f"{name}/{member.filename}", archive.read(member)))
+        elif name.lower().endswith(BATCH_EXTENSIONS):
+            files.append((name, payload))
+    return files
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def _shared_index(name: str, size: int) -> dict:
+    """A master_key_index pickled into shared memory by batch_compare (read once per worker)."""
+    shm = SharedMemory(name=name)
+    try:
+        return pickle.loads(bytes(shm.buf[:size]))
+    finally:
+        shm.close()
+
+def batch_shard(index, files: List[tuple], master_cols: List[str], preferred: List[str]) -> List[dict]:
+    """Worker: parse each (name, bytes) file and look up its keys in the master index.
+
+    index is a master_key_index, or the (segment name, size) of one in shared memory.
+    """
+    if not isinstance(index, dict):
+        index = _shared_index(*index)
+    parsed = []
+    for name, payload in files:
+        try:
+            frame = read_table(BytesIO(payload), name)
+            frame.columns = frame.columns.str.strip()
+            key_cols = resolve_key_columns(frame.columns, master_cols, preferred)
+            parsed.append({"name": name, "frame": frame, "key_cols": key_cols,
+                           "codes": index_lookup(index, frame, key_cols)})
+        except Exception as e:  # one unreadable file must not sink the batch
+            parsed.append({"name": name, "error": str(e)})
+    return parsed
+
+def batch_compare(master_df: pd.DataFrame, files: List[tuple], master_cols: List[str], outputs: List[str],
+                  preferred: List[str] = (), strip_zeros: bool = True, field_map: Dict[str, str] = None,
+                  tolerance: float = 0.0, executor=None, n_workers: int = 1):
+    """Compare every (name, bytes) file against the master.
+
+    Returns the per-file summary and {file name: compare_frames results},
+    repeated names made distinct by unique_names. Files are parsed and matched
+    on executor (n_workers shards, balanced by size) when given, else in this
+    process.
+    """
+    files = list(zip(unique_names(name for name, _ in files), (payload for _, payload in files)))
+    index = master_key_index(master_df, master_cols, strip_zeros)
+    shards = [[] for _ in range(max(1, min(n_workers, len(files))))]
+    loads = [0] * len(shards)
+    for name, payload in sorted(files, key=lambda f: -len(f[1])):
+        lightest = loads.index(min(loads))
+        shards[lightest].append((name, payload))
+        loads[lightest] += len(payload)
+    if executor is not None and len(shards) > 1:
+        payload = pickle.dumps(index, protocol=pickle.HIGHEST_PROTOCOL)
+        shm = SharedMemory(create=True, size=max(len(payload), 1))
+        try:
+            shm.buf[:len(payload)] = payload
+            futures = [executor.submit(udise_workers.run, "batch_shard", (shm.name, len(payload)), shard,
+                                       master_cols, list(preferred)) for shard in shards]
+            parsed = [item for future in futures for item in future.result()]
+        finally:
+            shm.close()
+            shm.unlink()
+    else:
+        parsed = [item for shard in shards for item in batch_shard(index, shard, master_cols, list(preferred))]
+    order = {name: position for position, (name, _) in enumerate(files)}
+    parsed.sort(key=lambda item: order[item["name"]])
+
+    rows, per_file = [], {}
+    for item in parsed:
+        if "error" in item:
+            rows.append({"File": item["name"], "Status": f"Error: {item['error']}"})
+            continue
+        frame = item["frame"]
+        file_map = {col: mapped for col, mapped in (field_map or {}).items() if mapped in frame.columns}
+        results, summary = compare_frames(master_df, frame, master_cols, item["key_cols"], outputs,
+                                          field_map=file_map, tolerance=tolerance,
+                                          match=index_match(index, item["codes"]))
+        per_file[item["name"]] = results
+        row = {"File": item["name"], "Status": "OK", "Key_Columns": ", ".join(item["key_cols"]),
+               "Records": len(frame), "Keys": summary["compare_keys"], "Matched": summary["matched"],
+               "Not_In_Master": summary["compare_only"],
+               "Match_Rate": f"{summary['matched'] / summary['compare_keys'] * 100:.1f}%"
+               if summary["compare_keys"] else "N/A",
+               "Duplicate_Keys": summary["compare_duplicates"], "Blank_Keys": summary["compare_blank"]}
+        if file_map:
+            row["Changed_Records"] = summary["changed_records"]
+        rows.append(row)
+    summary_df = pd.DataFrame(rows, columns=list(dict.fromkeys(
+        ["File", "Status", "Key_Columns", "Records", "Keys", "Matched", "Not_In_Master", "Match_Rate",
+         "Duplicate_Keys", "Blank_Keys"] + [k for row in rows for k in row])))
+    return summary_df, per_file
+
+def run_batch_compare(master_df: pd.DataFrame, files: List[tuple], master_cols: List[str], outputs: List[str],
+                      **options):
+    """batch_compare on the worker pool when there are several workers and files, else in this process."""
+    if PIVOT_WORKERS > 1 and len(files) > 1 and _pivot_pool() is not None:
+        try:
+            return batch_compare(master_df, files, master_cols, outputs, executor=_pivot_pool(),
+                                 n_workers=PIVOT_WORKERS, **options)
+        except BrokenProcessPool:
+            _pivot_pool.clear()  # a worker died; start a fresh pool next time
+        except (pickle.PicklingError, OSError):
+            pass  # compare in this process instead
+    return batch_compare(master_df, files, master_cols, outputs, **options)
+
+def batch_zip(summary_df: pd.DataFrame, per_file: Dict[str, dict]) -> bytes:
+    """ZIP of the batch summary (Excel) and each file's outputs as CSV, one folder per file.
+
+    Folders follow the file names ("returns.zip/north/a.csv/matched.csv").
+    """
+    parts = ([re.sub(r"[^\w. ()-]+", "_", part) for part in re.split(r"[\\/]+", name) if part.strip(".")]
+             for name in per_file)
+    folders = unique_names("/".join(path) or "file" for path in parts)
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("batch_summary.xlsx", to_excel_bytes_styled(summary_df))
+        for folder, results in zip(folders, per_file.values()):
+            for key, result_df in results.items():
+                archive.writestr(f"{folder}/{key}.csv", to_csv_bytes(result_df))
+    return buffer.getvalue()
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # TRANSLATIONS
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -589,6 +3027,7 @@ TRANSLATIONS = {
         "pivot_table": "Pivot Table",
         "pivot_desc": "Summarize data by grouping rows and aggregating values",
         "pivot_rows": "Group By (Rows)",
+        "pivot_columns": "Columns (optional)",
         "pivot_values": "Values to Aggregate",
         "pivot_agg": "Aggregation",
         "pivot_generate": "Generate Pivot",
@@ -673,6 +3112,7 @@ TRANSLATIONS = {
         "pivot_table": "பிவோட் அட்டவணை",
         "pivot_desc": "வரிசைகளை குழுவாக்கி மதிப்புகளை சேர்த்து தரவை சுருக்கமாக்குங்கள்",
         "pivot_rows": "குழுவாக்கு (வரிசைகள்)",
+        "pivot_columns": "நெடுவரிசைகள் (விருப்பம்)",
         "pivot_values": "சேர்க்க மதிப்புகள்",
         "pivot_agg": "சேர்க்கை முறை",
         "pivot_generate": "பிவோட் உருவாக்கு",
@@ -794,11 +3234,13 @@ if st.session_state["show_welcome"]:
 # DATA SOURCE SELECTION
 # ═══════════════════════════════════════════════════════════════════════════════
 
-MASTER_URL = "https://d3ijhv7dn0xr3b.cloudfront.net/10684.csv"
+# UDISE_MASTER_URL lets tests and staging point the app at a local HTTP stand-in.
+MASTER_URL = os.environ.get("UDISE_MASTER_URL", "https://d3ijhv7dn0xr3b.cloudfront.net/10684.csv")
 
 df_master = None
 source_used = None
 source_type = None
+master_info = None
 
 # Data source selection
 st.markdown("### 📂 Data Source")
@@ -822,7 +3264,7 @@ st.markdown("")
 
 # Load data based on selection
 if st.session_state["use_demo"]:
-    df_master = create_demo_data()
+    df_master = prepare_master(create_demo_data())
     source_used = "Demo Data (50 sample schools)"
     source_type = "demo"
     st.markdown(f"""
@@ -832,63 +3274,144 @@ if st.session_state["use_demo"]:
     </div>
     """, unsafe_allow_html=True)
 else:
-    # Try loading from online master URL first
-    try:
-        with st.spinner("🔄 Fetching master data from online source..."):
-            response = requests.get(MASTER_URL, timeout=10)
-            if response.status_code == 200:
-                data = BytesIO(response.content)
-                if MASTER_URL.lower().endswith(".csv"):
-                    df_master = pd.read_csv(data, dtype=str)
-                elif MASTER_URL.lower().endswith(".xls"):
-                    df_master = pd.read_excel(data, engine="xlrd", dtype=str)
-                else:
-                    df_master = pd.read_excel(data, engine="openpyxl", dtype=str)
-                source_used = "Online Master Database"
-                source_type = "online"
-    except Exception as e:
-        pass
+    streaming_mode = st.checkbox(
+        "🌊 Streaming mode for very large CSV masters",
+        key="streaming_mode",
+        help="Read the CSV in chunks and keep only the rows and columns you need"
+    )
+
+    if streaming_mode:
+        # Stream an uploaded CSV, else the online master's disk copy, else master.csv
+        stream_path, stream_label = None, None
+        stream_upload = st.file_uploader(
+            "Large CSV to stream (optional)",
+            type=["csv"],
+            key="stream_file_uploader",
+            help="Leave empty to stream the online master or the local master.csv"
+        )
+        if stream_upload is not None:
+            stream_path, stream_label = spool_upload(stream_upload), f"Uploaded: {stream_upload.name}"
+        else:
+            try:
+                stream_path, _ = fetch_master_cached(MASTER_URL)
+                stream_label = "Online Master Database"
+            except Exception:
+                if os.path.exists("master.csv"):
+                    stream_path, stream_label = "master.csv", "Local: master.csv"
+
+        if stream_path is None:
+            st.warning("⚠️ No CSV master available to stream - upload one above.")
+        else:
+            stream_header = scan_csv_header(stream_path)
+            stream_mtime = os.path.getmtime(stream_path)
+
+            st.markdown("**🎯 Streaming scope** - only matching rows and columns are loaded")
+            stream_filter_cols = st.multiselect(
+                "Filter columns",
+                options=stream_header,
+                default=[c for c in st.session_state.get("dynamic_filter_columns", []) if c in stream_header],
+                key="stream_filter_columns"
+            )
+            stream_filters = {}
+            for col in stream_filter_cols:
+                value_counts = scan_csv_values(stream_path, stream_mtime, col)
+                stream_filters[col] = st.multiselect(
+                    f"📌 {col}",
+                    options=list(value_counts),
+                    default=[v for v in st.session_state.get(f"filter_{col}", []) if v in value_counts],
+                    format_func=lambda v, vc=value_counts: f"{v} ({vc[v]:,})",
+                    key=f"stream_filter_{col}"
+                )
+
+            stream_col1, stream_col2 = st.columns(2)
+            with stream_col1:
+                detected_udise = find_column(pd.DataFrame(columns=stream_header), UDISE_CANDIDATES)
+                stream_udise_col = st.selectbox(
+                    tr['udise_col'],
+                    options=stream_header,
+                    index=stream_header.index(detected_udise) if detected_udise else 0,
+                    key="stream_udise_column"
+                )
+                stream_codes = st.text_area(
+                    tr['udise_input'],
+                    value=st.session_state.get("udise_input", ""),
+                    height=100,
+                    placeholder=tr['udise_placeholder'],
+                    key="stream_udise_input"
+                )
+            with stream_col2:
+                stream_usecols = st.multiselect(
+                    "Columns to load (empty = all)",
+                    options=stream_header,
+                    default=[c for c in st.session_state["selected_columns"] if c in stream_header],
+                    key="stream_usecols"
+                )
+
+            if st.button("🌊 Stream Data", type="primary", use_container_width=True):
+                progress_bar = st.progress(0.0, text="Starting scan...")
+
+                def _report(fraction, scanned, kept):
+                    progress_bar.progress(fraction, text=f"Scanned {scanned:,} rows · kept {kept:,}")
 
-    # Try local default master files (fallback)
-    if df_master is None:
-        default_files = ["master.xlsx", "master.xls", "master.csv"]
-        for f in default_files:
-            if os.path.exists(f):
                 try:
-                    if f.endswith(".csv"):
-                        df_master = pd.read_csv(f, dtype=str)
-                    elif f.endswith(".xls"):
-                        df_master = pd.read_excel(f, engine="xlrd", dtype=str)
-                    else:
-                        df_master = pd.read_excel(f, engine="openpyxl", dtype=str)
-                    source_used = f"Local: {f}"
-                    source_type = "local"
-                    break
+                    streamed = stream_csv(
+                        stream_path,
+                        filters=stream_filters,
+                        udise_col=stream_udise_col,
+                        udise_codes=parse_udise_codes(stream_codes),
+                        usecols=stream_usecols,
+                        progress=_report
+                    )
+                    st.session_state["streamed_master"] = (stream_label, streamed)
                 except Exception as e:
-                    pass
+                    st.error(f"❌ Error streaming file: {e}")
 
-    # File upload option (always available)
-    with st.expander(f"📁 {tr['upload']}", expanded=(df_master is None)):
-        uploaded_file = st.file_uploader(
-            "Drop your file here or click to browse",
-            type=["xlsx", "xls", "csv"],
-            label_visibility="collapsed"
-        )
+            if st.session_state.get("streamed_master") is not None:
+                stream_label, df_master = st.session_state["streamed_master"]
+                source_used = f"Streamed: {stream_label} ({len(df_master):,} rows kept)"
+                source_type = "streamed"
+            else:
+                st.info("👆 Set the scope and click **Stream Data** to load the matching rows.")
 
-        if uploaded_file is not None:
-            try:
-                fname = uploaded_file.name.lower()
-                if fname.endswith(".csv"):
-                    df_master = pd.read_csv(uploaded_file, dtype=str)
-                elif fname.endswith(".xls"):
-                    df_master = pd.read_excel(uploaded_file, engine="xlrd", dtype=str)
-                else:
-                    df_master = pd.read_excel(uploaded_file, engine="openpyxl", dtype=str)
-                source_used = f"Uploaded: {uploaded_file.name}"
-                source_type = "uploaded"
-                st.success(f"✅ File loaded successfully!")
-            except Exception as e:
-                st.error(f"❌ Error reading file: {e}")
+    else:
+        # Try loading from online master URL first
+        try:
+            with st.spinner("🔄 Fetching master data from online source..."):
+                df_master, master_info = load_online_master(MASTER_URL)
+                source_used = "Online Master Database"
+                source_type = "online"
+        except Exception as e:
+            pass
+
+        # Try local default master files (fallback)
+        if df_master is None:
+            default_files = ["master.xlsx", "master.xls", "master.csv"]
+            for f in default_files:
+                if os.path.exists(f):
+                    try:
+                        df_master = load_shared_master(f)
+                        source_used = f"Local: {f}"
+                        source_type = "local"
+                        break
+                    except Exception as e:
+                        pass
+
+        # File upload option (always available)
+        with st.expander(f"📁 {tr['upload']}", expanded=(df_master is None)):
+            uploaded_file = st.file_uploader(
+                "Drop your file here or click to browse",
+                type=["xlsx", "xls", "csv"],
+                label_visibility="collapsed"
+            )
+
+            if uploaded_file is not None:
+                try:
+                    df_master = load_shared_master(spool_upload(uploaded_file))
+                    source_used = f"Uploaded: {uploaded_file.name}"
+                    source_type = "uploaded"
+                    st.success(f"✅ File loaded successfully!")
+                except Exception as e:
+                    st.error(f"❌ Error reading file: {e}")
 
 # Final check - if no data, offer demo
 if df_master is None:
@@ -900,23 +3423,21 @@ if df_master is None:
     """, unsafe_allow_html=True)
     st.stop()
 
-# Normalize columns
-df_master.columns = df_master.columns.str.strip()
+# Working view: df_master is shared across sessions and never written to. The
+# shallow copy shares its column buffers (Copy-on-Write), so a session only
+# pays for the rows it filters and the derived columns it adds.
+df = df_master.copy(deep=False)
+df_rows = np.arange(len(df_master))  # positions of df's rows in df_master (ascending)
 
-# Coerce class gender columns to numeric
-for col in df_master.columns:
-    if re.match(r"(?i)^Class\d+_(Boys|Girls|Transgen)$", col):
-        df_master[col] = pd.to_numeric(df_master[col], errors="coerce").fillna(0)
-
-# Working copy
-df = df_master.copy()
+# Column statistics shared by the filters, the pivot tab and the field builders
+column_profile = get_column_profile(df_master.attrs.get("fingerprint"), df_master)
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # DATA STATISTICS DISPLAY
 # ═══════════════════════════════════════════════════════════════════════════════
 
 # Display source and stats
-source_icon = {"online": "🌐", "local": "💾", "uploaded": "📤", "demo": "🎮"}.get(source_type, "📊")
+source_icon = {"online": "🌐", "local": "💾", "uploaded": "📤", "demo": "🎮", "streamed": "🌊"}.get(source_type, "📊")
 st.markdown(f"""
 <div class="success-box">
     <strong>{source_icon} {tr['data_source']}:</strong> {source_used}
@@ -924,6 +3445,16 @@ st.markdown(f"""
 </div>
 """, unsafe_allow_html=True)
 
+if master_info:
+    as_of = master_info.get("last_modified") or time.strftime(
+        "%d %b %Y %H:%M", time.localtime(master_info.get("fetched_at", 0)))
+    freshness = f"🕒 Data as of {as_of} · checked {format_age(time.time() - master_info.get('checked_at', 0))} ago"
+    if master_info.get("refreshing"):
+        freshness += " · refreshing in background…"
+    elif master_info.get("error"):
+        freshness += " · last refresh failed, showing last good copy"
+    st.caption(freshness)
+
 stat_col1, stat_col2, stat_col3, stat_col4 = st.columns(4)
 with stat_col1:
     st.markdown(f"""
@@ -958,11 +3489,11 @@ with stat_col4:
 # SIDEBAR FILTERS - DYNAMIC FOR ALL COLUMNS
 # ═══════════════════════════════════════════════════════════════════════════════
 
-def get_filterable_columns(dataframe, max_unique=100):
+def get_filterable_columns(profile, max_unique=100):
     """Get columns suitable for filtering (categorical or low-cardinality)."""
     filterable = []
-    for col in dataframe.columns:
-        unique_count = dataframe[col].nunique()
+    for col, info in profile.items():
+        unique_count = info["n_unique"]
         # Include columns with reasonable number of unique values for filtering
         if unique_count <= max_unique and unique_count > 1:
             filterable.append((col, unique_count))
@@ -970,13 +3501,67 @@ def get_filterable_columns(dataframe, max_unique=100):
     filterable.sort(key=lambda x: x[1])
     return [col for col, _ in filterable]
 
+def build_filter_index(dataframe, columns) -> Dict[str, dict]:
+    """Inverted index of each column: value -> sorted row positions, plus counts.
+
+    Row positions of all values are kept in one array grouped by value
+    ("order"); a value's postings are the slices [offsets[c], offsets[c+1])
+    of its codes. Values are compared as strings, like the filter widgets.
+    """
+    index = {}
+    for col in columns:
+        series = dataframe[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            codes = series.cat.codes.to_numpy().astype(np.int64)
+            labels = series.cat.categories.astype(str)
+        else:
+            codes, uniques = pd.factorize(series)
+            labels = pd.Index(uniques).astype(str)
+
+        counts = np.bincount(codes[codes >= 0], minlength=len(labels))
+        order = np.argsort(codes, kind="stable").astype(np.int32)
+        offsets = (codes < 0).sum() + np.concatenate([[0], np.cumsum(counts)])
+
+        value_codes, value_counts = {}, {}
+        for code, label in enumerate(labels):
+            if counts[code]:
+                value_codes.setdefault(label, []).append(code)
+                value_counts[label] = value_counts.get(label, 0) + int(counts[code])
+        index[col] = {
+            "order": order,
+            "offsets": offsets,
+            "codes": value_codes,
+            "counts": dict(sorted(value_counts.items())),
+        }
+    return index
+
+def filter_index_rows(index, selected) -> np.ndarray:
+    """Sorted row positions matching every column filter (OR within, AND across)."""
+    postings = []
+    for col, vals in selected.items():
+        entry = index[col]
+        slices = [entry["order"][entry["offsets"][c]:entry["offsets"][c + 1]]
+                  for v in vals for c in entry["codes"].get(v, [])]
+        postings.append(np.sort(np.concatenate(slices)) if slices else np.empty(0, dtype=np.int32))
+    # Intersect the most selective column first to keep intermediate sets small
+    result = None
+    for rows in sorted(postings, key=len):
+        result = rows if result is None else np.intersect1d(result, rows, assume_unique=True)
+    return result if result is not None else np.empty(0, dtype=np.int32)
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def get_filter_index(fingerprint: str, columns: tuple, _dataframe) -> Dict[str, dict]:
+    """Filter index built once per dataset fingerprint and shared by all sessions."""
+    return build_filter_index(_dataframe, list(columns))
+
 selected_filters = {}
 with st.sidebar:
     st.markdown(f"### 🔍 {tr['filters']}")
     st.caption(tr['help_filters'])
 
     # Get all filterable columns dynamically
-    filterable_columns = get_filterable_columns(df)
+    filterable_columns = get_filterable_columns(column_profile)
+    filter_index = get_filter_index(df_master.attrs.get("fingerprint"), tuple(filterable_columns), df)
 
     if filterable_columns:
         # Column selector for filters
@@ -995,10 +3580,12 @@ with st.sidebar:
         if selected_filter_cols:
             with st.form("filters_form"):
                 for col in selected_filter_cols:
-                    options = sorted(df[col].dropna().astype(str).unique().tolist())
+                    value_counts = filter_index[col]["counts"]
+                    options = list(value_counts)
                     chosen = st.multiselect(
                         f"📌 {col}",
                         options=options,
+                        format_func=lambda v, vc=value_counts: f"{v} ({vc[v]:,})",
                         key=f"filter_{col}",
                         help=f"Filter by {col} ({len(options)} values)"
                     )
@@ -1017,10 +3604,8 @@ with st.sidebar:
 
 # Apply filters
 if selected_filters:
-    mask = pd.Series([True] * len(df))
-    for col, vals in selected_filters.items():
-        mask = mask & df[col].astype(str).isin(vals)
-    df = df[mask]
+    df_rows = filter_index_rows(filter_index, selected_filters)
+    df = df.take(df_rows)
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # MAIN CONTENT TABS
@@ -1046,8 +3631,7 @@ with tab1:
     st.caption(tr['help_udise'])
 
     # UDISE column auto-detect
-    udise_candidates = ["UDISE", "UDISE Code", "UDISE_Code", "udise", "udise_code", "UDISECODE"]
-    udise_col = find_column(df, udise_candidates)
+    udise_col = find_column(df, UDISE_CANDIDATES)
 
     col1, col2 = st.columns([3, 1])
     with col1:
@@ -1069,28 +3653,43 @@ with tab1:
         tr['udise_input'],
         height=120,
         placeholder=tr['udise_placeholder'],
-        label_visibility="collapsed"
+        label_visibility="collapsed",
+        key="udise_input"
+    )
+
+    udise_code_file = st.file_uploader(
+        "...or upload a code list (TXT / CSV / Excel)",
+        type=["txt", "csv", "xlsx", "xls"],
+        key="udise_code_file",
+        help="For large lists: one code per line, or a table with a UDISE column"
     )
 
     udise_list = []
-    if udise_input and udise_col:
-        udise_list = [u.strip() for u in udise_input.replace("\r", "\n").replace(",", "\n").split("\n") if u.strip()]
+    if udise_col:
+        if udise_input:
+            udise_list = parse_udise_codes(udise_input)
+        if udise_code_file is not None:
+            try:
+                udise_list += read_code_list(udise_code_file)
+            except Exception as e:
+                st.error(f"❌ Error reading code list: {e}")
 
     # Apply UDISE filter only if column is selected AND codes are provided
     if udise_list and udise_col:
-        df = df[df[udise_col].astype(str).isin(udise_list)]
+        udise_index = get_udise_index(df_master.attrs.get("fingerprint"), udise_col, df_master)
+        master_rows, duplicate_codes, unknown_codes = lookup_udise(udise_index, udise_list)
 
-        # Maintain user-given UDISE order
-        try:
-            df[udise_col] = df[udise_col].astype(str)
-            df = df.set_index(udise_col).loc[[u for u in udise_list if u in df.index]].reset_index()
-        except Exception:
-            pass
+        # Keep rows that survived the sidebar filters, in the entered order
+        local_rows = np.searchsorted(df_rows, master_rows)
+        in_view = local_rows < len(df_rows)
+        in_view[in_view] = df_rows[local_rows[in_view]] == master_rows[in_view]
+        excluded_rows = int((~in_view).sum())
+        df = df.take(local_rows[in_view])
 
         if len(df) > 0:
             st.markdown(f"""
             <div class="success-box">
-                ✅ <strong>{tr['found_matches'].format(n=len(df))}</strong> from {len(udise_list)} codes entered
+                ✅ <strong>{tr['found_matches'].format(n=len(df))}</strong> from {len(udise_list):,} codes entered
             </div>
             """, unsafe_allow_html=True)
         else:
@@ -1099,6 +3698,16 @@ with tab1:
                 ⚠️ <strong>{tr['no_matches']}</strong>
             </div>
             """, unsafe_allow_html=True)
+
+        if unknown_codes or duplicate_codes or excluded_rows:
+            with st.expander(f"⚠️ {len(unknown_codes):,} unknown · {len(duplicate_codes):,} repeated codes · "
+                             f"{excluded_rows:,} rows hidden by filters"):
+                if unknown_codes:
+                    st.markdown("**Codes not found in the master:**")
+                    st.code(", ".join(unknown_codes[:500]) + (" ..." if len(unknown_codes) > 500 else ""))
+                if duplicate_codes:
+                    st.markdown("**Codes entered more than once (kept once):**")
+                    st.code(", ".join(duplicate_codes[:500]) + (" ..." if len(duplicate_codes) > 500 else ""))
     else:
         if not udise_col:
             st.markdown(f"""
@@ -1113,6 +3722,12 @@ with tab1:
             </div>
             """, unsafe_allow_html=True)
 
+# Created fields are computed on the master (memoized) and joined to the view,
+# so every tab sees them and filtering never recomputes them
+field_graph = field_nodes(st.session_state["created_fields"], st.session_state["extra_fields"], df_master.columns)
+field_columns, field_errors, _ = compute_fields(df_master, field_graph, _field_memo())
+df = attach_fields(df, df_master, field_columns)
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # TAB 2: CALCULATED FIELDS
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -1126,7 +3741,7 @@ with tab2:
 
     with preset_col1:
         if st.button(f"📊 {tr['class_totals']}", use_container_width=True, help="Creates Class1_Total through Class12_Total"):
-            created = build_class_totals(df)
+            created = list(CLASS_TOTAL_NAMES)
             for cname in created:
                 if cname not in st.session_state.get("extra_fields", []):
                     st.session_state.setdefault("extra_fields", []).append(cname)
@@ -1134,9 +3749,8 @@ with tab2:
             st.experimental_rerun()
 
     with preset_col2:
-        if st.button(f"📈 {tr['enrollment_presets']}", use_container_width=True, help="Creates enrollment aggregations by grade ranges"):
-            build_class_totals(df)
-            created = build_enrollment_presets(df)
+        if st.button(f"📈 {tr['enrollment_presets']}", use_container_width=True, help="Creates enrollment aggregations by grade ranges and gender"):
+            created = list(ENROLLMENT_PRESET_NAMES)
             for cname in created:
                 if cname not in st.session_state.get("extra_fields", []):
                     st.session_state.setdefault("extra_fields", []).append(cname)
@@ -1162,13 +3776,16 @@ with tab2:
         st.markdown(f'<div>{field_html}</div>', unsafe_allow_html=True)
         st.markdown("")
 
+    for field_name, message in field_errors.items():
+        st.error(f"❌ {field_name}: {message}")
+
     st.markdown('<div class="divider"></div>', unsafe_allow_html=True)
 
     # Custom calculated fields
     st.markdown(f"### 🔧 {tr['create_calc']}")
     st.caption(tr['help_custom'])
 
-    numeric_candidates = get_numeric_columns(df)
+    numeric_candidates = get_numeric_columns(df, column_profile)
 
     # Add existing calculated fields to numeric candidates
     for f in st.session_state.get("extra_fields", []):
@@ -1211,7 +3828,8 @@ with tab2:
             st.caption(f"Formula: {' + '.join(cols_to_use)}" + (f" / {len(cols_to_use)}" if calc_type == tr["avg"] else ""))
 
     else:  # Custom formula
-        st.caption("Use column names and operators (+, -, *, /, parentheses)")
+        st.caption("Use column names, operators (+, -, *, /, parentheses, comparisons) and "
+                   "IF, ROUND, SAFE_DIV, MIN, MAX, ABS. Put names with spaces in `backticks`.")
         custom_formula = st.text_input(
             tr['formula'],
             placeholder="(Class1_Total + Class2_Total) / Total_Enrollment",
@@ -1226,8 +3844,8 @@ with tab2:
         else:
             try:
                 if calc_type == tr["diff"]:
-                    a = pd.to_numeric(df[col_a], errors="coerce").fillna(0)
-                    b = pd.to_numeric(df[col_b], errors="coerce").fillna(0)
+                    a = as_numeric(df[col_a])
+                    b = as_numeric(df[col_b])
                     df[new_field_name] = a - b
                     meta = ("diff", (col_a, col_b))
                 elif calc_type == tr["sum"]:
@@ -1243,13 +3861,11 @@ with tab2:
                     df[new_field_name] = safe_numeric_sum(df, cols_to_use) / len(cols_to_use)
                     meta = ("avg", cols_to_use)
                 else:
-                    expr = custom_formula.strip()
-                    if not expr:
-                        st.error("❌ Enter a formula")
-                        raise RuntimeError("no formula")
-                    env = {c: pd.to_numeric(df[c], errors="coerce").fillna(0) for c in df.columns}
-                    df[new_field_name] = eval(expr, {"__builtins__": {}}, env)
-                    meta = ("custom", expr)
+                    available = list(df.columns) + st.session_state.get("extra_fields", [])
+                    compiled = compile_formula(custom_formula, available)
+                    if all(c in df.columns for c in compiled["columns"]):
+                        evaluate_formula(compiled, df.head(100))  # surface evaluation errors now
+                    meta = ("custom", compiled["expression"])
 
                 st.session_state.setdefault("extra_fields", []).append(new_field_name)
                 st.session_state["created_fields"][new_field_name] = {"type": meta[0], "definition": meta[1]}
@@ -1275,16 +3891,25 @@ with tab3:
     </div>
     """, unsafe_allow_html=True)
 
+    # Pivots over District / Block / Management of the (sidebar-filtered) master
+    # are answered from the cube; a UDISE list makes the view ad hoc, so scan it
+    pivot_cube = get_pivot_cube(df_master.attrs.get("fingerprint"), df_master)
+    cube_filters = None if (udise_list and udise_col) else selected_filters
+    pivot_memo = _pivot_memo()
+
     # Get categorical and numeric columns
     categorical_cols = []
     numeric_cols = []
     all_cols_for_count = list(df.columns)  # All columns available for distinct count
 
     for col in df.columns:
-        if df[col].dtype == 'object' or df[col].nunique() < 50:
+        if col in column_profile:
+            is_numeric, unique_count = column_profile[col]["numeric"], column_profile[col]["n_unique"]
+        else:  # derived column added this run
+            is_numeric, unique_count = is_numeric_dtype(df[col]), df[col].nunique()
+        if not is_numeric or unique_count < 50:
             categorical_cols.append(col)
-        tmp = pd.to_numeric(df[col], errors='coerce')
-        if not tmp.isnull().all():
+        if is_numeric:
             numeric_cols.append(col)
 
     # Add created fields to numeric cols
@@ -1332,6 +3957,43 @@ with tab3:
     else:
         st.info("👆 Select value columns above to configure aggregations")
 
+    pivot_columns = st.selectbox(
+        tr['pivot_columns'],
+        options=["(None)"] + [c for c in categorical_cols if c not in pivot_rows],
+        key="pivot_columns",
+        help="Spread the values across this column's values (e.g. Management) for a wide crosstab "
+             "with row and column totals"
+    )
+    pivot_columns = None if pivot_columns == "(None)" else pivot_columns
+
+    pivot_subtotals = SUBTOTAL_MODES[st.radio(
+        "Subtotals",
+        options=list(SUBTOTAL_MODES),
+        horizontal=True,
+        key="pivot_subtotals",
+        disabled=pivot_columns is not None,
+        help="ROLLUP adds a subtotal for each level of the grouping plus a grand total; "
+             "CUBE adds totals for every combination of the grouping columns. "
+             "A crosstab always has its own row and column totals."
+    )]
+    if pivot_columns is not None:
+        pivot_subtotals = None
+
+    pivot_parallel_mode = st.checkbox(
+        f"⚡ Use all {PIVOT_WORKERS} CPU cores for large pivots",
+        key="pivot_parallel",
+        disabled=PIVOT_WORKERS < 2,
+        help=f"Pivots of {PIVOT_PARALLEL_MIN_ROWS:,}+ rows that the cube can't answer are split into row shards "
+             "and aggregated in parallel worker processes; the results are identical"
+    )
+    pivot_approximate = st.checkbox(
+        "≈ Approximate Distinct Count and Median",
+        key="pivot_approximate",
+        help="Estimate them from small mergeable sketches instead of every group's full set of values: "
+             f"distinct counts {SKETCH_ERRORS['Distinct Count']}, medians {SKETCH_ERRORS['Median']}. "
+             "Pivots answered from the cube stay exact."
+    )
+
     st.markdown("---")
 
     if st.button(f"📊 {tr['pivot_generate']}", type="primary", use_container_width=True):
@@ -1341,65 +4003,49 @@ with tab3:
             st.error("❌ Please select at least one value column to aggregate")
         else:
             try:
-                df_pivot = df.copy()
-
-                # Prepare aggregation functions
-                agg_funcs = {}
-                for val_col, agg_type in pivot_agg_map.items():
-                    # Convert to numeric for most aggregations (except Count/Distinct Count on text)
-                    if agg_type not in ["Count", "Distinct Count", "First", "Last"]:
-                        df_pivot[val_col] = pd.to_numeric(df_pivot[val_col], errors='coerce').fillna(0)
-
-                    if agg_type == "Sum":
-                        agg_funcs[val_col] = 'sum'
-                    elif agg_type == "Count":
-                        agg_funcs[val_col] = 'count'
-                    elif agg_type == "Distinct Count":
-                        agg_funcs[val_col] = 'nunique'
-                    elif agg_type == "Average":
-                        agg_funcs[val_col] = 'mean'
-                    elif agg_type == "Min":
-                        agg_funcs[val_col] = 'min'
-                    elif agg_type == "Max":
-                        agg_funcs[val_col] = 'max'
-                    elif agg_type == "Median":
-                        agg_funcs[val_col] = 'median'
-                    elif agg_type == "Std Dev":
-                        agg_funcs[val_col] = 'std'
-                    elif agg_type == "First":
-                        agg_funcs[val_col] = 'first'
-                    elif agg_type == "Last":
-                        agg_funcs[val_col] = 'last'
-
-                # Create pivot table with individual aggregations
-                pivot_result = df_pivot.groupby(pivot_rows).agg(agg_funcs).reset_index()
-
-                # Rename columns to include aggregation type
-                new_columns = {}
-                for col in pivot_result.columns:
-                    if col in pivot_agg_map:
-                        new_columns[col] = f"{col}_{pivot_agg_map[col].replace(' ', '_')}"
-                pivot_result = pivot_result.rename(columns=new_columns)
-
-                # Round numeric columns
-                for col in pivot_result.columns:
-                    if pivot_result[col].dtype in ['float64', 'float32']:
-                        pivot_result[col] = pivot_result[col].round(2)
-
+                view_key = None if cube_filters is not None else \
+                    hashlib.sha1(df.index.to_numpy().tobytes()).hexdigest()[:16]
+                pivot_key = pivot_cache_key(df_master.attrs.get("fingerprint"), selected_filters, pivot_rows,
+                                            pivot_agg_map, view_key, field_signatures(field_graph), pivot_subtotals,
+                                            pivot_columns, pivot_approximate)
+                cached = lru_get(pivot_memo, pivot_key)
+                if cached is None:
+                    pivot_result, pivot_source = run_pivot(df, pivot_rows, pivot_agg_map, pivot_cube, cube_filters,
+                                                           pivot_subtotals, pivot_columns, pivot_parallel_mode,
+                                                           pivot_approximate)
+                    pivot_result.attrs["fingerprint"] = dataset_fingerprint(pivot_result)
+                    lru_put(pivot_memo, pivot_key, (pivot_result, pivot_source))
+                else:
+                    pivot_result, pivot_source = cached
+                    pivot_source = "cache"
                 st.session_state["pivot_result"] = pivot_result
-                st.success(f"✅ Pivot table created with {len(pivot_result)} rows!")
+                source_note = {"cube": " (from the pre-aggregated cube)", "cache": " (cached)",
+                               "parallel": f" (in parallel on {PIVOT_WORKERS} processes)"}.get(pivot_source, "")
+                st.success(f"✅ Pivot table created with {len(pivot_result)} rows{source_note}!")
 
             except Exception as e:
                 st.error(f"❌ Error creating pivot: {e}")
 
+    pivot_stats = lru_stats(pivot_memo)
+    st.caption(f"Pivot cache: {pivot_stats['hits']:,} hits · {pivot_stats['misses']:,} misses · "
+               f"{pivot_stats['entries']}/{pivot_stats['max_entries']} entries (shared by all users)")
+
     # Display pivot result
     if st.session_state["pivot_result"] is not None:
         st.markdown("### 📋 Pivot Result")
-        st.dataframe(st.session_state["pivot_result"], use_container_width=True, height=400)
-
-        # Download pivot
-        pivot_excel = to_excel_bytes_styled(st.session_state["pivot_result"])
-        pivot_csv = st.session_state["pivot_result"].to_csv(index=False).encode("utf-8")
+        pivot_view = st.session_state["pivot_result"]
+        if SUBTOTAL_COLUMN in pivot_view.columns:
+            pivot_view = pivot_view.style.apply(
+                lambda row: ["font-weight: bold; background-color: rgba(99, 102, 241, 0.15)"
+                             if row[SUBTOTAL_COLUMN] != "Detail" else ""] * len(row), axis=1)
+        st.dataframe(pivot_view, use_container_width=True, height=400)
+        for name, bound in st.session_state["pivot_result"].attrs.get("error_bounds", {}).items():
+            st.caption(f"≈ {name}: estimated, {bound}")
+
+        # Download pivot - payloads are only built when a button is clicked
+        pivot_downloads = download_store(st.session_state, "pivot_downloads", st.session_state["pivot_result"])
+        pivot_excel = lazy_payload(pivot_downloads, st.session_state["pivot_result"], "xlsx")
+        pivot_csv = lazy_payload(pivot_downloads, st.session_state["pivot_result"], "csv")
 
         dl_col1, dl_col2 = st.columns(2)
         with dl_col1:
@@ -1419,6 +4065,33 @@ with tab3:
                 use_container_width=True
             )
 
+    # Drill-down District -> Block from the cube, then the schools themselves
+    drill_levels = [d for d in CUBE_HIERARCHY if pivot_cube is not None and d in pivot_cube["dims"]]
+    if drill_levels and cube_filters is not None:
+        with st.expander(f"🔎 Drill-down: {' → '.join(drill_levels)} → School"):
+            drill_map = {c: a for c, a in pivot_agg_map.items() if cube_covers(pivot_cube, [], {c: a}, {})}
+            drill_filters = dict(cube_filters)
+            drill_path = []
+            for level in drill_levels:
+                level_values = pivot_from_cube(pivot_cube, [level], {}, drill_filters)[level].astype(str).tolist()
+                choice = st.selectbox(level, ["(All)"] + level_values, key=f"drill_{level}")
+                if choice == "(All)":
+                    break
+                drill_filters[level] = [choice]
+                drill_path.append(level)
+
+            if len(drill_path) < len(drill_levels):
+                st.dataframe(pivot_from_cube(pivot_cube, [drill_levels[len(drill_path)]], drill_map,
+                                             drill_filters, with_rows=True),
+                             use_container_width=True, hide_index=True)
+            else:
+                in_path = np.ones(len(df), dtype=bool)
+                for level in drill_path:
+                    in_path &= (df[level].astype(str) == drill_filters[level][0]).to_numpy()
+                school_cols = [c for c in [udise_col, "School_Name"] if c and c in df.columns]
+                school_cols += drill_path + [c for c in drill_map if c not in school_cols]
+                st.dataframe(df.loc[in_path, school_cols], use_container_width=True, hide_index=True)
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # TAB 4: COMPARE & MATCH FILES
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -1428,6 +4101,8 @@ if "comparison_file" not in st.session_state:
     st.session_state["comparison_file"] = None
 if "comparison_result" not in st.session_state:
     st.session_state["comparison_result"] = None
+if "batch_result" not in st.session_state:
+    st.session_state["batch_result"] = None
 
 with tab4:
     st.markdown("### 🔄 Compare & Match Data")
@@ -1442,6 +4117,70 @@ with tab4:
     </div>
     """, unsafe_allow_html=True)
 
+    # Batch compare: every returned file (or a ZIP of them) against the master in one run
+    with st.expander("📦 Batch Compare - many files or a ZIP"):
+        st.caption("Compare each district's returned file against the master data in one run. Each file's key "
+                   "column is found by name (the master's name, ignoring case and spaces, or a UDISE column).")
+        batch_uploads = st.file_uploader(
+            "Upload comparison files",
+            type=["xlsx", "xls", "csv", "zip"],
+            accept_multiple_files=True,
+            key="batch_file_uploader",
+            label_visibility="collapsed",
+            help="Select several Excel/CSV files, or one ZIP holding them"
+        )
+        batch_key_default = find_column(df, UDISE_CANDIDATES)
+        batch_master_cols = st.multiselect(
+            "Master key column(s)",
+            options=list(df.columns),
+            default=[batch_key_default] if batch_key_default else [],
+            max_selections=4,
+            key="batch_master_columns"
+        )
+        batch_outputs = st.multiselect(
+            "Outputs per file",
+            options=["Matched Records", "Not Matched (in Comparison)", "Full Comparison Report"],
+            default=["Matched Records", "Not Matched (in Comparison)"],
+            key="batch_outputs"
+        )
+        batch_strip_zeros = st.checkbox("Ignore leading zeros in numeric codes", value=True,
+                                        key="batch_strip_zeros")
+
+        if st.button("📦 Run Batch Comparison", disabled=not batch_uploads or not batch_master_cols,
+                     use_container_width=True):
+            try:
+                with st.spinner("Comparing files..."):
+                    batch_files = expand_batch_uploads([(u.name, u.getvalue()) for u in batch_uploads])
+                    if not batch_files:
+                        st.warning("⚠️ No CSV or Excel files found in the upload")
+                    else:
+                        batch_summary, batch_per_file = run_batch_compare(
+                            df, batch_files, batch_master_cols, batch_outputs, strip_zeros=batch_strip_zeros)
+                        st.session_state["batch_result"] = {"summary": batch_summary,
+                                                            "per_file": batch_per_file, "zip": None}
+            except Exception as e:
+                st.error(f"❌ Error during batch comparison: {e}")
+
+        if st.session_state["batch_result"]:
+            batch = st.session_state["batch_result"]
+            batch_ok = batch["summary"]["Status"].eq("OK")
+            st.caption(f"{int(batch_ok.sum())} of {len(batch_ok)} files compared")
+            st.dataframe(batch["summary"], use_container_width=True, hide_index=True)
+
+            def _zip_payload(batch=batch):
+                if batch["zip"] is None:
+                    batch["zip"] = batch_zip(batch["summary"], batch["per_file"])
+                return batch["zip"]
+
+            st.download_button(
+                "📦 Download All Results (ZIP)",
+                data=_zip_payload,
+                file_name="batch_comparison.zip",
+                mime="application/zip",
+                use_container_width=True,
+                key="dl_batch_zip"
+            )
+
     # Comparison file upload
     st.markdown("#### 📁 Upload Comparison File (Optional)")
     compare_file = st.file_uploader(
@@ -1455,13 +4194,7 @@ with tab4:
     df_compare = None
     if compare_file is not None:
         try:
-            fname = compare_file.name.lower()
-            if fname.endswith(".csv"):
-                df_compare = pd.read_csv(compare_file, dtype=str)
-            elif fname.endswith(".xls"):
-                df_compare = pd.read_excel(compare_file, engine="xlrd", dtype=str)
-            else:
-                df_compare = pd.read_excel(compare_file, engine="openpyxl", dtype=str)
+            df_compare = read_table(compare_file, compare_file.name)
 
             df_compare.columns = df_compare.columns.str.strip()
             st.session_state["comparison_file"] = df_compare
@@ -1486,25 +4219,38 @@ with tab4:
         match_col1, match_col2 = st.columns(2)
 
         with match_col1:
-            st.markdown("**Master Data Column:**")
-            master_match_col = st.selectbox(
-                "Select column from master data",
+            st.markdown("**Master Data Key Column(s):**")
+            master_key_default = find_column(df, UDISE_CANDIDATES)
+            master_match_cols = st.multiselect(
+                "Select key columns from master data",
                 options=list(df.columns),
-                key="master_match_column",
+                default=[master_key_default] if master_key_default else [],
+                max_selections=4,
+                key="master_match_columns",
                 label_visibility="collapsed",
-                help="Column in your master/filtered data to match against"
+                help="Column(s) in your master/filtered data to match against; pick several for a composite key"
             )
 
         with match_col2:
-            st.markdown("**Comparison File Column:**")
-            compare_match_col = st.selectbox(
-                "Select column from comparison file",
+            st.markdown("**Comparison File Key Column(s):**")
+            compare_key_default = find_column(df_compare, UDISE_CANDIDATES)
+            compare_match_cols = st.multiselect(
+                "Select key columns from comparison file",
                 options=list(df_compare.columns),
-                key="compare_match_column",
+                default=[compare_key_default] if compare_key_default else [],
+                max_selections=4,
+                key="compare_match_columns",
                 label_visibility="collapsed",
-                help="Column in the uploaded comparison file"
+                help="The matching column(s) of the uploaded comparison file, in the same order"
             )
 
+        strip_zeros = st.checkbox(
+            "Ignore leading zeros in numeric codes",
+            value=True,
+            key="compare_strip_zeros",
+            help="Treat 033012345678, 33012345678 and 33012345678.0 (as Excel saves it) as the same code"
+        )
+
         # Output options
         st.markdown("#### 📤 Output Options")
         output_options = st.multiselect(
@@ -1518,94 +4264,126 @@ with tab4:
         st.markdown("**Include columns from comparison file (optional):**")
         extra_compare_cols = st.multiselect(
             "Additional columns from comparison file",
-            options=[c for c in df_compare.columns if c != compare_match_col],
+            options=[c for c in df_compare.columns if c not in compare_match_cols],
             key="extra_compare_columns",
             label_visibility="collapsed",
-            help="Select additional columns from comparison file to include in matched output"
+            help="Select additional columns from comparison file to include in matched output "
+                 "(taken from the first comparison row with each key)"
         )
 
+        # Field-level diff: map master columns to comparison columns
+        field_map = {}
+        with st.expander("🧬 Field-Level Diff (optional)"):
+            st.caption("Compare values of matched records column by column. Columns whose names agree "
+                       "(ignoring case, spaces and punctuation) are mapped automatically.")
+            diff_candidates = [c for c in df.columns if c not in master_match_cols]
+            compare_options = [c for c in df_compare.columns if c not in compare_match_cols]
+            suggested = suggest_column_mapping(diff_candidates, compare_options)
+            diff_cols = st.multiselect(
+                "Master columns to compare",
+                options=diff_candidates,
+                default=list(suggested),
+                key="diff_master_columns",
+                help="Each selected column is compared with its mapped comparison column"
+            )
+            map_cols = st.columns(3)
+            for idx, col in enumerate(diff_cols):
+                with map_cols[idx % 3]:
+                    field_map[col] = st.selectbox(
+                        f"{col} ↔",
+                        options=compare_options,
+                        index=compare_options.index(suggested[col]) if col in suggested else 0,
+                        key=f"diff_map_{col}"
+                    )
+            diff_tolerance = st.number_input(
+                "Numeric tolerance",
+                min_value=0.0,
+                value=0.0,
+                key="compare_tolerance",
+                help="Numbers closer than this are treated as unchanged"
+            )
+
+        # Fuzzy pass: pair leftover rows by similar school names within a District/Block
+        fuzzy = None
+        with st.expander("🔤 Fuzzy Name Matching (optional)"):
+            st.caption("Suggest likely pairs among the records left unmatched on both sides - the same school "
+                       "under a slightly different name or a mistyped code")
+            if st.checkbox("Find fuzzy name matches", key="compare_fuzzy"):
+                name_col1, name_col2 = st.columns(2)
+                master_name_default = find_column(df, SCHOOL_NAME_CANDIDATES)
+                compare_name_default = find_column(df_compare, SCHOOL_NAME_CANDIDATES)
+                with name_col1:
+                    master_name_col = st.selectbox(
+                        "Master name column",
+                        options=list(df.columns),
+                        index=list(df.columns).index(master_name_default) if master_name_default else 0,
+                        key="fuzzy_master_name"
+                    )
+                    master_block_cols = st.multiselect(
+                        "Block by (master)",
+                        options=list(df.columns),
+                        default=[c for c in CUBE_HIERARCHY if c in df.columns],
+                        max_selections=3,
+                        key="fuzzy_master_blocks",
+                        help="Only records in the same District/Block are compared - this keeps the pass fast"
+                    )
+                with name_col2:
+                    compare_name_col = st.selectbox(
+                        "Comparison name column",
+                        options=list(df_compare.columns),
+                        index=list(df_compare.columns).index(compare_name_default) if compare_name_default else 0,
+                        key="fuzzy_compare_name"
+                    )
+                    block_defaults = suggest_column_mapping(master_block_cols, df_compare.columns)
+                    compare_block_cols = st.multiselect(
+                        "Block by (comparison)",
+                        options=list(df_compare.columns),
+                        default=[block_defaults[c] for c in master_block_cols if c in block_defaults],
+                        max_selections=3,
+                        key="fuzzy_compare_blocks",
+                        help="The matching block columns of the comparison file, in the same order"
+                    )
+                fuzzy_min_score = st.slider(
+                    "Minimum similarity",
+                    min_value=0.3,
+                    max_value=1.0,
+                    value=FUZZY_MIN_SCORE,
+                    step=0.05,
+                    key="fuzzy_min_score",
+                    help="Share of character trigrams two names have in common (Dice coefficient)"
+                )
+                fuzzy = {"master_name": master_name_col, "compare_name": compare_name_col,
+                         "master_blocks": master_block_cols, "compare_blocks": compare_block_cols,
+                         "min_score": fuzzy_min_score}
+
         if st.button("🔍 Generate Comparison", type="primary", use_container_width=True):
             try:
-                # Clean and prepare data for matching
-                master_values = df[master_match_col].astype(str).str.strip()
-                compare_values = df_compare[compare_match_col].astype(str).str.strip()
-
-                master_set = set(master_values)
-                compare_set = set(compare_values)
-
-                # Calculate matches
-                matched_values = master_set & compare_set
-                master_only = master_set - compare_set
-                compare_only = compare_set - master_set
-
-                results = {}
-
-                # Matched Records
-                if "Matched Records" in output_options:
-                    matched_df = df[master_values.isin(matched_values)].copy()
-
-                    # Add extra columns from comparison file if requested
-                    if extra_compare_cols:
-                        compare_subset = df_compare[[compare_match_col] + extra_compare_cols].copy()
-                        compare_subset[compare_match_col] = compare_subset[compare_match_col].astype(str).str.strip()
-                        matched_df = matched_df.merge(
-                            compare_subset,
-                            left_on=master_match_col,
-                            right_on=compare_match_col,
-                            how='left',
-                            suffixes=('', '_compare')
-                        )
-
-                    matched_df['_match_status'] = 'Matched'
-                    results["matched"] = matched_df
-
-                # Not Matched in Master (records in master not found in comparison)
-                if "Not Matched (in Master)" in output_options:
-                    not_in_compare = df[master_values.isin(master_only)].copy()
-                    not_in_compare['_match_status'] = 'Not in Comparison File'
-                    results["not_matched_master"] = not_in_compare
-
-                # Not Matched in Comparison (records in comparison not found in master)
-                if "Not Matched (in Comparison)" in output_options:
-                    not_in_master = df_compare[compare_values.isin(compare_only)].copy()
-                    not_in_master['_match_status'] = 'Not in Master Data'
-                    results["not_matched_compare"] = not_in_master
-
-                # Full Comparison Report
-                if "Full Comparison Report" in output_options:
-                    report_data = {
-                        'Metric': [
-                            'Total Master Records',
-                            'Total Comparison Records',
-                            'Matched Records',
-                            'Not Matched (Master Only)',
-                            'Not Matched (Comparison Only)',
-                            'Match Rate (Master)',
-                            'Match Rate (Comparison)'
-                        ],
-                        'Value': [
-                            len(master_set),
-                            len(compare_set),
-                            len(matched_values),
-                            len(master_only),
-                            len(compare_only),
-                            f"{(len(matched_values)/len(master_set)*100):.1f}%" if master_set else "N/A",
-                            f"{(len(matched_values)/len(compare_set)*100):.1f}%" if compare_set else "N/A"
-                        ]
-                    }
-                    results["report"] = pd.DataFrame(report_data)
+                results, summary = compare_frames(df, df_compare, master_match_cols, compare_match_cols,
+                                                  output_options, extra_compare_cols, strip_zeros,
+                                                  field_map, diff_tolerance, fuzzy)
 
+                for result_df in results.values():
+                    result_df.attrs["fingerprint"] = dataset_fingerprint(result_df)
                 st.session_state["comparison_result"] = results
 
                 # Summary
                 st.markdown(f"""
                 <div class="success-box">
                     ✅ <strong>Comparison Complete!</strong><br>
-                    🔗 Matched: <strong>{len(matched_values)}</strong> records<br>
-                    📌 Master Only: <strong>{len(master_only)}</strong> records<br>
-                    📌 Comparison Only: <strong>{len(compare_only)}</strong> records
+                    🔗 Matched: <strong>{summary['matched']}</strong> records<br>
+                    📌 Master Only: <strong>{summary['master_only']}</strong> records<br>
+                    📌 Comparison Only: <strong>{summary['compare_only']}</strong> records
                 </div>
                 """, unsafe_allow_html=True)
+                if field_map:
+                    st.info(f"🧬 {summary['changed_records']} matched records have changed values "
+                            f"across {len(field_map)} compared columns - see Changed Values")
+                if fuzzy:
+                    st.info(f"🔤 {summary['fuzzy_matches']} unmatched master records have fuzzy name "
+                            f"candidates - see Fuzzy Candidates")
+                if summary["master_duplicates"] or summary["compare_duplicates"]:
+                    st.warning(f"⚠️ Repeated keys: {summary['master_duplicates']} in master data, "
+                               f"{summary['compare_duplicates']} in the comparison file - see Duplicate Keys")
 
             except Exception as e:
                 st.error(f"❌ Error during comparison: {e}")
@@ -1618,6 +4396,7 @@ with tab4:
             st.markdown("### 📋 Comparison Results")
 
             result_tabs = st.tabs([k.replace("_", " ").title() for k in results.keys()])
+            comparison_downloads = download_store(st.session_state, "comparison_downloads", results)
 
             for idx, (key, result_df) in enumerate(results.items()):
                 with result_tabs[idx]:
@@ -1627,7 +4406,7 @@ with tab4:
                     # Download buttons
                     dl_col1, dl_col2 = st.columns(2)
                     with dl_col1:
-                        excel_data = to_excel_bytes_styled(result_df)
+                        excel_data = lazy_payload(comparison_downloads, result_df, "xlsx", key)
                         st.download_button(
                             f"📗 Download {key.replace('_', ' ').title()} (Excel)",
                             data=excel_data,
@@ -1637,7 +4416,7 @@ with tab4:
                             key=f"dl_excel_{key}"
                         )
                     with dl_col2:
-                        csv_data = result_df.to_csv(index=False).encode("utf-8")
+                        csv_data = lazy_payload(comparison_downloads, result_df, "csv", key)
                         st.download_button(
                             f"📄 Download {key.replace('_', ' ').title()} (CSV)",
                             data=csv_data,
@@ -1727,6 +4506,12 @@ with tab6:
             height=400
         )
         st.caption(f"Showing first 100 of {len(df):,} records")
+
+        with st.expander("📑 Column Profile"):
+            profile_df = pd.DataFrame.from_dict(column_profile, orient="index")
+            profile_df["top_values"] = profile_df["top_values"].str.join(", ")
+            profile_df[["min", "max"]] = profile_df[["min", "max"]].astype(str).replace("None", "")
+            st.dataframe(profile_df, use_container_width=True)
     else:
         st.info("No data to preview. Apply filters and enter UDISE codes to see data.")
 
@@ -1756,32 +4541,6 @@ if generate_btn:
         st.error("❌ Please select at least one column for output (go to 'Select Output Columns' tab)")
     else:
         with st.spinner("Generating output..."):
-            # Recreate preset/class totals & user-created calculated fields
-            class_total_names = [f"Class{i}_Total" for i in range(1, 13)]
-            if any(name in st.session_state.get("extra_fields", []) for name in class_total_names):
-                build_class_totals(df)
-
-            enroll_preset_names = ["Enrollment_1_5", "Enrollment_6_8", "Enrollment_9_10", "Enrollment_11_12", "Total_Enrollment"]
-            if any(name in st.session_state.get("extra_fields", []) for name in enroll_preset_names):
-                build_enrollment_presets(df)
-
-            # Recreate user-created fields
-            for fname, meta in st.session_state["created_fields"].items():
-                if meta["type"] == "diff":
-                    a, b = meta["definition"]
-                    df[fname] = pd.to_numeric(df.get(a, pd.Series(0, index=df.index)), errors="coerce").fillna(0) - \
-                               pd.to_numeric(df.get(b, pd.Series(0, index=df.index)), errors="coerce").fillna(0)
-                elif meta["type"] == "sum":
-                    df[fname] = safe_numeric_sum(df, meta["definition"])
-                elif meta["type"] == "avg":
-                    df[fname] = safe_numeric_sum(df, meta["definition"]) / max(1, len(meta["definition"]))
-                elif meta["type"] == "custom":
-                    env = {c: pd.to_numeric(df.get(c, 0), errors="coerce").fillna(0) for c in df.columns}
-                    try:
-                        df[fname] = eval(meta["definition"], {"__builtins__": {}}, env)
-                    except Exception:
-                        df[fname] = pd.Series(0, index=df.index)
-
             # Validate and get output
             valid_selected = [c for c in st.session_state["selected_columns"] if c in df.columns]
             missing = [c for c in st.session_state["selected_columns"] if c not in df.columns]
@@ -0,0 +1,90 @@
+"""Shared fixtures for the UDISE Data Generator tests.
+
+main.py is a Streamlit script, so importing it would render the whole page.
+The ``app`` fixture instead executes only its imports, constants and
+function definitions (udise_workers.load_helpers), which is everything the
+helpers need.
+"""
+import hashlib
+import os
+import sys
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from udise_workers import load_helpers  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def app():
+    return load_helpers()
+
+
+@pytest.fixture(scope="session")
+def pool(app):
+    """Two workers for the parallel pivot and batch compare, started like the app's."""
+    with app.worker_pool(2) as executor:
+        yield executor
+
+
+class MasterServer:
+    """Local HTTP stand-in for the CDN serving MASTER_URL.
+
+    Sends ETag and Last-Modified, answers matching If-None-Match /
+    If-Modified-Since with 304 and records every request it receives.
+    """
+
+    def __init__(self):
+        self.body = b""
+        self.last_modified = formatdate(usegmt=True)
+        self.requests = []
+        self.delay = 0.0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append(dict(self.headers))
+                time.sleep(server.delay)
+                etag = f'"{hashlib.sha1(server.body).hexdigest()}"'
+                if "If-None-Match" in self.headers:
+                    not_modified = self.headers["If-None-Match"] == etag
+                else:
+                    not_modified = self.headers.get("If-Modified-Since") == server.last_modified
+                if not_modified:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/csv")
+                self.send_header("Content-Length", str(len(server.body)))
+                self.send_header("ETag", etag)
+                self.send_header("Last-Modified", server.last_modified)
+                self.end_headers()
+                self.wfile.write(server.body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/master.csv"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def publish(self, body: bytes):
+        """Replace the served master, as a new upload to the CDN would."""
+        self.body = body
+        self.last_modified = formatdate(usegmt=True)
+
+
+@pytest.fixture
+def master_server():
+    server = MasterServer()
+    server.thread.start()
+    yield server
+    server.httpd.shutdown()
+    server.httpd.server_close()
@@ -0,0 +1,222 @@
+import io
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ALL_OUTPUTS = ["Matched Records", "Not Matched (in Master)", "Not Matched (in Comparison)", "Full Comparison Report"]
+
+
+@pytest.fixture
+def master():
+    return pd.DataFrame({
+        "UDISE": ["033012345678", "33012345679", " 33012345680 ", None, "33012345681", "33012345681"],
+        "Block": ["A", "A", "B", "B", "C", "C"],
+        "Name": list("abcdef"),
+    })
+
+
+def test_normalize_keys(app):
+    keys, missing = app.normalize_keys(pd.Series(["00123", " 45 ", "67.0", "", None]))
+    assert keys.dtype == np.int64 and keys[~missing].tolist() == [123, 45, 67]
+    assert missing.tolist() == [False, False, False, True, True]
+
+    keys, missing = app.normalize_keys(pd.Series(["00123", "A-01", " 0 "]))
+    assert keys.tolist() == ["123", "A-01", "0"]
+    assert app.normalize_keys(pd.Series(["00123", "A-01"]), strip_zeros=False)[0].tolist() == ["00123", "A-01"]
+
+    keys, missing = app.normalize_keys(pd.Series([33012345678.0, np.nan]))
+    assert keys[0] == 33012345678 and missing.tolist() == [False, True]
+    assert app.normalize_keys(pd.Series([2 ** 62 + 1]))[0][0] == 2 ** 62 + 1
+
+
+def test_numeric_and_text_keys_share_one_code_space(app):
+    left, right, n_keys = app.shared_key_codes(pd.Series(["0042", "7", "X9"]), pd.Series([42, 8, None]))
+    assert left[0] == right[0] and n_keys == 4
+    assert right[2] == -1
+
+
+def test_compare_frames_selections(app, master):
+    compare = pd.DataFrame({"Code": [33012345678.0, 33012345680, 33012345680, 99, np.nan],
+                            "Name": list("VWXYZ")})
+    results, summary = app.compare_frames(master, compare, ["UDISE"], ["Code"], ALL_OUTPUTS, ["Name"])
+
+    # Repeated comparison keys don't duplicate master rows; the first one supplies extras
+    assert results["matched"]["Name"].tolist() == ["a", "c"]
+    assert results["matched"]["Name_compare"].tolist() == ["V", "W"]
+    assert results["not_matched_master"]["_match_status"].tolist() == [
+        "Not in Comparison File", "Blank Key", "Not in Comparison File", "Not in Comparison File"]
+    assert results["not_matched_compare"]["Name"].tolist() == ["Y", "Z"]
+
+    assert summary == {"master_keys": 4, "compare_keys": 3, "matched": 2, "master_only": 2, "compare_only": 1,
+                       "master_duplicates": 1, "compare_duplicates": 1, "master_blank": 1, "compare_blank": 1}
+    report = dict(zip(results["report"]["Metric"], results["report"]["Value"]))
+    assert report["Match Rate (Master)"] == "50.0%"
+    dups = results["duplicate_keys"]
+    assert dups["UDISE"].str.strip().tolist() == ["33012345680", "33012345681"]
+    assert dups["Master_Rows"].tolist() == [1, 2] and dups["Comparison_Rows"].tolist() == [2, 0]
+
+
+def test_composite_keys(app, master):
+    compare = pd.DataFrame({"Code": ["33012345681", "33012345681", "33012345679"], "Blk": ["C", "Z", "B"]})
+    results, summary = app.compare_frames(master, compare, ["UDISE", "Block"], ["Code", "Blk"], ALL_OUTPUTS)
+    assert results["matched"]["Name"].tolist() == ["e", "f"]
+    assert summary["matched"] == 1 and summary["compare_only"] == 2
+    assert "duplicate_keys" in results  # the master repeats (33012345681, C)
+
+    with pytest.raises(ValueError):
+        app.compare_frames(master, compare, ["UDISE", "Block"], ["Code"], ALL_OUTPUTS)
+
+
+def test_match_keys_agrees_with_set_semantics(app):
+    rng = np.random.default_rng(5)
+    master = pd.DataFrame({"k": rng.integers(0, 5_000, 20_000).astype(str)})
+    compare = pd.DataFrame({"k": rng.integers(2_500, 7_500, 8_000)})
+    results, summary = app.compare_frames(master, compare, ["k"], ["k"], ALL_OUTPUTS)
+
+    master_set, compare_set = set(master["k"].astype(int)), set(compare["k"])
+    assert summary["matched"] == len(master_set & compare_set)
+    assert summary["master_only"] == len(master_set - compare_set)
+    assert summary["compare_only"] == len(compare_set - master_set)
+    assert len(results["matched"]) == master["k"].astype(int).isin(compare_set).sum()
+
+
+def test_suggest_column_mapping(app):
+    mapping = app.suggest_column_mapping(["Class1_Boys", "Management", "Block"], ["CLASS 1 BOYS", "management", "Zone"])
+    assert mapping == {"Class1_Boys": "CLASS 1 BOYS", "Management": "management"}
+
+
+def test_field_diff(app, master):
+    master = master.assign(Boys=[10, 20, 30, 40, 50, 60], Mgmt=["Govt", "Aided", None, "Govt", "Pvt", "Pvt"])
+    compare = pd.DataFrame({"Code": ["33012345678", "33012345679", "33012345680", "33012345681"],
+                            "BOYS": ["10.2", "25", None, "50"],
+                            "MGMT": [" govt ", "Aided  School", "", "PVT"]})
+    results, summary = app.compare_frames(master, compare, ["UDISE"], ["Code"], ALL_OUTPUTS,
+                                          field_map={"Boys": "BOYS", "Mgmt": "MGMT"}, tolerance=0.5)
+
+    mismatches = results["field_mismatches"].set_index("Column")
+    assert mismatches.loc["Boys", "Type"] == "Numeric" and mismatches.loc["Mgmt", "Type"] == "Text"
+    # 10 ~ 10.2 within tolerance; 30 against a blank is a change, blank against blank is not
+    assert mismatches["Mismatches"].tolist() == [3, 1]
+    changed = results["changed_values"]
+    assert changed["Column"].tolist() == ["Boys", "Mgmt", "Boys", "Boys"]
+    assert changed["UDISE"].tolist() == ["33012345679", "33012345679", " 33012345680 ", "33012345681"]
+    assert changed["Difference"].iloc[0] == 5 and np.isnan(changed["Difference"].iloc[1:3]).all()
+    # Both master rows of 33012345681 pair with its one comparison row
+    assert results["matched"]["_changed_fields"].tolist() == [0, 2, 1, 0, 1]
+    assert summary["changed_records"] == 3
+    report = dict(zip(results["report"]["Metric"], results["report"]["Value"]))
+    assert report["Matched Records With Changed Values"] == 3
+
+
+def test_name_grams(app):
+    rows, grams = app.name_grams(pd.Series(["Aa", "St. Mary's", None, "அரசு பள்ளி"]))
+    per_row = np.bincount(rows, minlength=4)
+    assert per_row[0] == 2  # " aa", "aa "
+    assert per_row[2] == 0 and per_row[3] > 0  # blanks have no grams; Tamil keeps its vowel signs
+    assert len(set(zip(rows, grams))) == len(rows)
+    # Case and punctuation don't matter
+    _, left = app.name_grams(pd.Series(["St. Mary's"]))
+    _, right = app.name_grams(pd.Series(["ST MARY S"]))
+    assert set(left) == set(right)
+
+
+def test_fuzzy_candidates_are_blocked_and_ranked(app):
+    master = pd.DataFrame({"Name": ["GHSS Kodambakkam", "St Marys High School", "Govt Middle School Ayyampet"],
+                           "District": ["Chennai", "Madurai", "Thanjavur"]})
+    compare = pd.DataFrame({"School": ["G.H.S.S. KODAMBAKAM", "Saint Marys High School", "St Mary's HS",
+                                       "St Marys High School"],
+                            "Dist": ["Chennai", "Madurai", "Madurai", "Chennai"]})
+    pairs = app.fuzzy_candidates(master, compare, "Name", "School", ["District"], ["Dist"], min_score=0.3)
+    assert pairs[["Master_Row", "Comparison_Row", "Rank"]].values.tolist() == [[0, 0, 1], [1, 1, 1], [1, 2, 2]]
+    assert pairs["Score"].iloc[1] >= pairs["Score"].iloc[2] >= 0.3
+
+    unblocked = app.fuzzy_candidates(master, compare, "Name", "School", min_score=0.3, top_k=1)
+    assert unblocked.query("Master_Row == 1")["Comparison_Row"].tolist() == [3]  # the exact name, other district
+    with pytest.raises(ValueError):
+        app.fuzzy_candidates(master, compare, "Name", "School", ["District"], [])
+
+
+def test_compare_frames_fuzzy_pass_uses_leftovers(app, master):
+    compare = pd.DataFrame({"Code": ["33012345678", "99"], "School": ["a", "Namee d"]})
+    master = master.assign(Name=["Name a", "Name b", "Name c", "Name d", "Other", "Other"])
+    fuzzy = {"master_name": "Name", "compare_name": "School", "min_score": 0.5}
+    results, summary = app.compare_frames(master, compare, ["UDISE"], ["Code"], ALL_OUTPUTS, fuzzy=fuzzy)
+    candidates = results["fuzzy_candidates"]
+    # Master "Name a" is matched by key, so it is not offered again; "Name d" has a blank key
+    best = candidates[candidates["Rank"] == 1].set_index("Name")
+    assert "Name a" not in best.index and best.loc["Name d", "School"] == "Namee d"
+    assert best.loc["Name d", "Code"] == "99" and summary["fuzzy_matches"] == len(best)
+
+
+def test_master_key_index_matches_like_match_keys(app, master):
+    compare = pd.DataFrame({"Code": ["33012345681", "033012345678", "X-1", "", "X-1"], "Blk": list("CAZZB")})
+    for master_cols, compare_cols in ((["UDISE"], ["Code"]), (["UDISE", "Block"], ["Code", "Blk"])):
+        index = app.master_key_index(master, master_cols)
+        match = app.index_match(index, app.index_lookup(index, compare, compare_cols))
+        expected = app.match_keys(master, master_cols, compare, compare_cols)
+        assert app.match_summary(match) == app.match_summary(expected)
+
+    # Keys the master lacks are numbered after its own; blanks stay -1
+    index = app.master_key_index(master, ["UDISE"])
+    codes = app.index_lookup(index, compare, ["Code"])
+    assert codes[2] == codes[4] == index["n_keys"] and codes[3] == -1 and codes[1] < index["n_keys"]
+
+
+def _zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, payload in members.items():
+            archive.writestr(name, payload)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_batch_compare(app, master, request, parallel):
+    files = app.expand_batch_uploads([
+        ("returns.zip", _zip({"north/a.csv": b"UDISE,Remark\n33012345678,x\n99,y\n",
+                              "__MACOSX/north/._a.csv": b"junk", "notes.txt": b"skip me"})),
+        ("b.csv", b"udise code,Remark\n033012345679\n33012345681\n33012345681\n"),
+        ("c.csv", b"Name\nno key here\n"),
+    ])
+    assert [name for name, _ in files] == ["returns.zip/north/a.csv", "b.csv", "c.csv"]
+    executor = request.getfixturevalue("pool") if parallel else None
+    summary, per_file = app.batch_compare(master, files, ["UDISE"], ALL_OUTPUTS, executor=executor, n_workers=2)
+
+    assert summary["File"].tolist() == ["returns.zip/north/a.csv", "b.csv", "c.csv"]
+    assert summary["Status"].tolist()[:2] == ["OK", "OK"] and summary["Status"][2].startswith("Error")
+    assert summary["Key_Columns"].tolist()[:2] == ["UDISE", "udise code"]
+    assert summary["Matched"].tolist()[:2] == [1, 2] and summary["Duplicate_Keys"].tolist()[:2] == [0, 1]
+    assert summary["Match_Rate"].tolist()[:2] == ["50.0%", "100.0%"]
+    assert per_file["b.csv"]["matched"]["Name"].tolist() == ["b", "e", "f"]
+
+    with zipfile.ZipFile(io.BytesIO(app.batch_zip(summary, per_file))) as archive:
+        names = archive.namelist()
+    assert "batch_summary.xlsx" in names and "returns.zip/north/a.csv/matched.csv" in names
+    assert "b.csv/report.csv" in names
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_batch_compare_keeps_files_with_the_same_name_apart(app, master, request, parallel):
+    files = app.expand_batch_uploads([
+        ("returns.zip", _zip({"north/data.csv": b"UDISE\n33012345678\n",
+                              "south/data.csv": b"UDISE\n33012345679\n33012345680\n"})),
+        ("returns.zip", _zip({"north/data.csv": b"UDISE\n99\n"})),
+        ("data.csv", b"UDISE\n33012345681\n"),
+        ("data.xlsx", b"not a workbook"),
+    ])
+    executor = request.getfixturevalue("pool") if parallel else None
+    summary, per_file = app.batch_compare(master, files, ["UDISE"], ["Matched Records"], executor=executor, n_workers=2)
+
+    names = ["returns.zip/north/data.csv", "returns.zip/south/data.csv", "returns.zip/north/data (2).csv",
+             "data.csv", "data.xlsx"]
+    assert summary["File"].tolist() == names
+    assert list(per_file) == names[:4] and summary["Status"][4].startswith("Error")
+    assert [len(per_file[name]["matched"]) for name in names[:4]] == [1, 2, 0, 2]
+
+    with zipfile.ZipFile(io.BytesIO(app.batch_zip(summary, per_file))) as archive:
+        folders = {name.rsplit("/", 1)[0] for name in archive.namelist() if name.endswith("/matched.csv")}
+    assert folders == set(names[:4])
+    assert app.unique_names(["a.csv", "a.csv", "a (2).csv", "a.csv"]) == ["a.csv", "a (2).csv", "a (2) (2).csv",
+                                                                         "a (3).csv"]
@@ -0,0 +1,35 @@
+import pandas as pd
+
+
+def test_download_payloads_are_built_lazily_once_per_result(app, monkeypatch):
+    calls = []
+    monkeypatch.setitem(app.DOWNLOAD_BUILDERS, "csv", lambda df: calls.append(len(df)) or b"payload")
+    state = {}
+    result = pd.DataFrame({"District": ["A", "B"], "Boys_Sum": [3, 4]})
+    result.attrs["fingerprint"] = app.dataset_fingerprint(result)
+
+    store = app.download_store(state, "pivot_downloads", result)
+    build = app.lazy_payload(store, result, "csv")
+    assert calls == []  # nothing is serialized until the button is clicked
+
+    assert build() == b"payload"
+    assert build() == b"payload"
+    assert app.download_store(state, "pivot_downloads", result) is store
+    assert calls == [2]
+
+    changed = pd.DataFrame({"District": ["A"], "Boys_Sum": [3]})
+    changed.attrs["fingerprint"] = app.dataset_fingerprint(changed)
+    new_store = app.download_store(state, "pivot_downloads", changed)
+    assert new_store is not store and new_store["payloads"] == {}
+    assert app.lazy_payload(new_store, changed, "csv")() == b"payload"
+    assert calls == [2, 1]
+
+
+def test_comparison_results_share_one_store(app):
+    state = {}
+    results = {"matched": pd.DataFrame({"UDISE": ["1"]}), "master_only": pd.DataFrame({"UDISE": ["2"]})}
+    store = app.download_store(state, "comparison_downloads", results)
+
+    assert app.lazy_payload(store, results["matched"], "csv", "matched")() == b"UDISE\n1\n"
+    assert app.lazy_payload(store, results["master_only"], "csv", "master_only")() == b"UDISE\n2\n"
+    assert set(store["payloads"]) == {("matched", "csv"), ("master_only", "csv")}
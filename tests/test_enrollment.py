@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+
+def test_enrollment_tensor_reductions_match_column_sums(app):
+    df = app.create_demo_data()
+    df["Class3_Girls"] = df["Class3_Girls"].astype(str)  # text columns are coerced
+    df = df.drop(columns=["Class12_Transgen"])  # missing columns count as 0
+
+    tensor = app.build_enrollment_tensor(df)
+    assert tensor.shape == (len(df), 12, 3) and tensor.dtype == np.int32
+    assert tensor.flags["C_CONTIGUOUS"]
+    assert tensor[:, 2, 1].tolist() == df["Class3_Girls"].astype(int).tolist()
+    assert not tensor[:, 11, 2].any()
+
+    app.build_class_totals(df, tensor)
+    created = app.build_enrollment_presets(df, tensor)
+
+    expected = df[[f"Class{i}_{g}" for i in range(6, 9) for g in ("Boys", "Girls", "Transgen")]].sum(axis=1)
+    assert df["Enrollment_6_8"].tolist() == expected.tolist()
+    assert df["Class3_Total"].tolist() == (df["Class3_Boys"] + df["Class3_Girls"] + df["Class3_Transgen"]).tolist()
+    assert (df[list(app.GRADE_BANDS)].sum(axis=1) == df["Total_Enrollment"]).all()
+    boys = df[[f"Class{i}_Boys" for i in range(1, 13)]].sum(axis=1)
+    assert df["Total_Boys"].tolist() == boys.tolist()
+    assert np.allclose(df[["Boys_Share", "Girls_Share", "Transgen_Share"]].sum(axis=1), 100, atol=0.05)
+    assert set(created) == set(app.ENROLLMENT_PRESET_NAMES)
+
+
+def test_enrollment_presets_without_class_columns(app):
+    df = pd.DataFrame({"UDISE": ["1", "2"]})
+    app.build_enrollment_presets(df)
+
+    assert df["Total_Enrollment"].tolist() == [0, 0]
+    assert df["Girls_Share"].tolist() == [0.0, 0.0]
@@ -0,0 +1,42 @@
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+
+def test_excel_export_handles_all_empty_columns(app):
+    df = pd.DataFrame({
+        "UDISE": ["33010100101", "33010100102"],
+        "Remarks": [np.nan, np.nan],
+        "Teachers": pd.array([13, None], dtype="Int8"),
+    })
+
+    ws = load_workbook(BytesIO(app.to_excel_bytes_styled(df))).active
+
+    assert [c.value for c in ws[1]] == ["UDISE", "Remarks", "Teachers"]
+    assert [[c.value for c in row] for row in ws.iter_rows(min_row=2)] == [
+        ["33010100101", None, 13],
+        ["33010100102", None, None],
+    ]
+    assert ws.column_dimensions["B"].width == 10
+
+
+def test_excel_export_of_empty_frame(app):
+    ws = load_workbook(BytesIO(app.to_excel_bytes_styled(pd.DataFrame({"Remarks": []})))).active
+
+    assert [c.value for c in ws[1]] == ["Remarks"]
+    assert ws.max_row == 1
+
+
+def test_excel_export_marks_subtotal_rows(app):
+    df = pd.DataFrame({"Row_Type": ["Detail", "Subtotal", "Grand Total"], "District": ["Salem", "Salem", "All"],
+                       "Boys_Sum": [3, 3, 3]})
+
+    ws = load_workbook(BytesIO(app.to_excel_bytes_styled(df))).active
+
+    rules = [rule for cf in ws.conditional_formatting for rule in cf.rules]
+    subtotal_rule = next(rule for rule in rules if rule.formula != ["TRUE"])
+    assert subtotal_rule.formula == ['$A2<>"Detail"']
+    assert subtotal_rule.dxf.font.bold
+    assert [c.value for c in ws["A"]][1:] == ["Detail", "Subtotal", "Grand Total"]
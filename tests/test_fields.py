@@ -0,0 +1,88 @@
+import pandas as pd
+
+
+def make_master(app):
+    df = app.create_demo_data()
+    df.attrs["fingerprint"] = app.dataset_fingerprint(df)
+    return df
+
+
+def test_fields_compute_in_dependency_order_and_memoize(app):
+    master = make_master(app)
+    memo = app.make_lru_store(16)
+    created = {
+        # Defined before the field it reads: order comes from the graph, not insertion
+        "Primary_Share": {"type": "custom", "definition": "SAFE_DIV(Primary, Total_Enrollment) * 100"},
+        "Primary": {"type": "sum", "definition": [f"Class{i}_Total" for i in range(1, 6)]},
+    }
+    extra = ["Class1_Total", "Total_Enrollment", "Primary", "Primary_Share"]
+    nodes = app.field_nodes(created, extra, master.columns)
+
+    order = app.field_order(nodes)
+    assert order.index("Class totals") < order.index("Primary") < order.index("Primary_Share")
+
+    columns, errors, recomputed = app.compute_fields(master, nodes, memo)
+    assert errors == {}
+    assert set(recomputed) == set(nodes)
+    assert columns["Primary"].tolist() == master[[f"Class{i}_{g}" for i in range(1, 6)
+                                                 for g in ("Boys", "Girls", "Transgen")]].sum(axis=1).tolist()
+
+    # Adding one field recomputes only that node
+    created["Double"] = {"type": "custom", "definition": "Primary * 2"}
+    _, _, recomputed = app.compute_fields(master, app.field_nodes(created, extra + ["Double"], master.columns), memo)
+    assert recomputed == ["Double"]
+
+    # Changing a field recomputes it and its dependents only
+    created["Primary"] = {"type": "sum", "definition": [f"Class{i}_Total" for i in range(1, 4)]}
+    _, _, recomputed = app.compute_fields(master, app.field_nodes(created, extra + ["Double"], master.columns), memo)
+    assert sorted(recomputed) == ["Double", "Primary", "Primary_Share"]
+    assert memo["hits"] > 0
+
+
+def test_failed_fields_are_reported_not_zero_filled(app):
+    master = make_master(app)
+    created = {
+        "Broken": {"type": "custom", "definition": "ROUND(Class1_Boys, Class1_Girls)"},
+        "Uses_Broken": {"type": "custom", "definition": "Broken + 1"},
+        "Gone": {"type": "diff", "definition": ["Class1_Boys", "Removed_Column"]},
+    }
+    columns, errors, _ = app.compute_fields(master, app.field_nodes(created, list(created), master.columns),
+                                            app.make_lru_store(16))
+
+    assert columns == {}
+    assert "Cannot evaluate" in errors["Broken"]
+    assert errors["Uses_Broken"] == "depends on failed field(s): Broken"
+    assert errors["Gone"] == "uses missing column(s): Removed_Column"
+
+
+def test_cycles_are_reported(app):
+    nodes = {
+        "A": {"type": "custom", "definition": "B + 1", "inputs": ["B"], "outputs": ["A"]},
+        "B": {"type": "custom", "definition": "A + 1", "inputs": ["A"], "outputs": ["B"]},
+    }
+    columns, errors, _ = app.compute_fields(pd.DataFrame({"x": [1]}), nodes, app.make_lru_store(4))
+    assert columns == {} and "Circular reference" in errors["Created fields"]
+
+
+def test_attach_fields_takes_the_view_rows(app):
+    master = make_master(app)
+    columns, _, _ = app.compute_fields(
+        master, app.field_nodes({"Boys1x2": {"type": "custom", "definition": "Class1_Boys * 2"}}, [], master.columns),
+        app.make_lru_store(4))
+    view = master.take([7, 3, 11])
+
+    attached = app.attach_fields(view, master, columns)
+    assert attached["Boys1x2"].tolist() == (view["Class1_Boys"] * 2).tolist()
+    assert list(attached.index) == [7, 3, 11]
+
+
+def test_lru_store_evicts_least_recently_used(app):
+    store = app.make_lru_store(2)
+    app.lru_put(store, "a", 1)
+    app.lru_put(store, "b", 2)
+    assert app.lru_get(store, "a") == 1
+    app.lru_put(store, "c", 3)
+
+    assert list(store["entries"]) == ["a", "c"]
+    assert app.lru_get(store, "b") is None
+    assert (store["hits"], store["misses"]) == (1, 1)
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def schools():
+    rng = np.random.default_rng(7)
+    n_rows = 500
+    district = pd.Series(rng.choice(["Chennai", "Madurai", "Salem", None], n_rows), dtype=object)
+    return pd.DataFrame({
+        "District": pd.Categorical(district, categories=["Chennai", "Madurai", "Salem", "Unused"]),
+        "Management": pd.Series(rng.choice(["Govt", "Aided", "Private"], n_rows), dtype=object),
+        "Teachers": pd.array(rng.choice([1, 2, 3, None], n_rows), dtype="Int8"),
+        "Rating": rng.choice([1.5, 2.0, np.nan], n_rows),
+    })
+
+
+def test_filter_counts_skip_blanks_and_unused_categories(app, schools):
+    index = app.build_filter_index(schools, list(schools.columns))
+
+    for col in schools.columns:
+        expected = schools[col].dropna().astype(str).value_counts()
+        assert index[col]["counts"] == dict(sorted((v, int(n)) for v, n in expected.items() if n))
+    assert "Unused" not in index["District"]["counts"]
+    assert list(index["Teachers"]["counts"]) == ["1", "2", "3"]
+    assert list(index["Rating"]["counts"]) == ["1.5", "2.0"]
+
+
+def test_same_label_from_different_values_is_one_option(app):
+    df = pd.DataFrame({"Code": pd.Series([1, "1", 2, "2", "1", None], dtype=object)})
+    index = app.build_filter_index(df, ["Code"])
+
+    assert index["Code"]["counts"] == {"1": 3, "2": 2}
+    assert app.filter_index_rows(index, {"Code": ["1"]}).tolist() == [0, 1, 4]
+
+
+@pytest.mark.parametrize("selected", [
+    {"District": ["Chennai"]},
+    {"District": ["Chennai", "Salem"]},  # OR within a column
+    {"District": ["Madurai"], "Management": ["Govt", "Aided"]},  # AND across columns
+    {"District": ["Salem"], "Management": ["Private"], "Teachers": ["3"], "Rating": ["1.5"]},
+    {"District": ["Unused"]},
+    {"Management": ["Govt"], "Teachers": ["no such value"]},
+])
+def test_filter_rows_match_boolean_masks(app, schools, selected):
+    index = app.build_filter_index(schools, list(schools.columns))
+
+    rows = app.filter_index_rows(index, selected)
+    mask = np.ones(len(schools), dtype=bool)
+    for col, vals in selected.items():
+        mask &= (schools[col].notna() & schools[col].astype(str).isin(vals)).to_numpy()
+    assert rows.tolist() == np.flatnonzero(mask).tolist()
+
+
+def test_column_profile_catalog(app, schools):
+    schools["Active"] = np.arange(len(schools)) % 2 == 0
+    schools["UDISE"] = [f"3301010{i:04d}" for i in range(len(schools))]
+    profile = app.build_column_profile(schools, top_n=2)
+
+    assert list(profile) == list(schools.columns)
+    district = profile["District"]
+    assert district["dtype"] == "category" and not district["numeric"]
+    assert district["n_unique"] == 3  # the unused category does not count
+    assert district["n_null"] == int(schools["District"].isna().sum())
+    assert district["min"] is None and district["max"] is None
+    assert district["top_values"] == [str(v) for v in schools["District"].value_counts().index[:2]]
+
+    teachers = profile["Teachers"]
+    assert teachers["numeric"] and teachers["dtype"] == "Int8"
+    assert (teachers["n_unique"], teachers["min"], teachers["max"]) == (3, 1, 3)
+    assert teachers["n_null"] == int(schools["Teachers"].isna().sum())
+    assert profile["Rating"]["min"] == 1.5 and profile["Rating"]["max"] == 2.0
+    assert not profile["Active"]["numeric"]  # booleans are flags, not measures
+    assert profile["UDISE"]["n_unique"] == len(schools)
+
+    assert app.get_numeric_columns(schools, profile) == ["Teachers", "Rating"]
+    # Low-cardinality columns, fewest values first; the UDISE column is too distinct to filter on
+    assert app.get_filterable_columns(profile) == ["Rating", "Active", "District", "Management", "Teachers"]
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def schools():
+    return pd.DataFrame({
+        "School_Name": ["A", "B", "C", "D"],
+        "Boys": ["10", "20", "", "5"],
+        "Girls": [30, 0, 7, 5],
+        "School Type": [1, 2, 3, 4],
+    })
+
+
+def test_formula_touches_only_referenced_columns(app, schools, monkeypatch):
+    coerced = []
+    real = app.as_numeric
+    monkeypatch.setattr(app, "as_numeric", lambda s: coerced.append(s.name) or real(s))
+
+    compiled = app.compile_formula("Boys + Girls * 2", schools.columns)
+    result = app.evaluate_formula(compiled, schools, chunk_rows=3)
+
+    assert result.tolist() == [70, 20, 14, 15]
+    assert sorted(coerced) == ["Boys", "Girls"]
+
+
+def test_formula_helpers_and_quoted_names(app, schools):
+    def run(expression):
+        return app.evaluate_formula(app.compile_formula(expression, schools.columns), schools).tolist()
+
+    assert run("IF(Boys > Girls, 1, 0)") == [0, 1, 0, 0]
+    assert run("SAFE_DIV(Boys, Girls)") == [pytest.approx(1 / 3), 0.0, 0.0, 1.0]
+    assert run("ROUND(Boys / 3, 1)") == [3.3, 6.7, 0.0, 1.7]
+    assert run("MAX(Boys, Girls, 8) - MIN(Boys, Girls)") == [20, 20, 8, 3]
+    assert run("ABS(Boys - Girls)") == [20, 20, 7, 0]
+    assert run("`School Type` * 10") == [10, 20, 30, 40]
+    assert run("Boys >= 5 and Girls > 0") == [True, False, False, True]
+    divided = run("Girls / Boys")
+    assert divided[0] == 3 and np.isnan(divided[2])
+
+
+@pytest.mark.parametrize("expression, message", [
+    ("Boys + Teachers", "Unknown column"),
+    ("__import__('os')", "Unknown function"),
+    ("Boys.real", "Unsupported syntax"),
+    ("Boys +", "Invalid formula"),
+    ("IF(Boys, 1)", "IF takes 3"),
+    ("", "Enter a formula"),
+])
+def test_invalid_formulas_are_rejected_at_definition(app, schools, expression, message):
+    with pytest.raises(app.FormulaError, match=message):
+        app.compile_formula(expression, schools.columns)
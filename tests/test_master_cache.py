@@ -0,0 +1,67 @@
+import json
+import os
+import threading
+
+
+MASTER_CSV = b"UDISE,District,Class1_Boys\n33010100101,Chennai,12\n33010100102,Madurai,7\n"
+
+
+def test_fetch_downloads_then_serves_from_ttl_then_revalidates(app, master_server, tmp_path):
+    master_server.publish(MASTER_CSV)
+    cache_dir = str(tmp_path)
+
+    path, meta = app.fetch_master_cached(master_server.url, cache_dir=cache_dir, ttl=60)
+    assert len(master_server.requests) == 1
+    assert open(path, "rb").read() == MASTER_CSV
+    assert meta["etag"] and meta["last_modified"]
+
+    # Within the TTL the disk copy is used without any request
+    app.fetch_master_cached(master_server.url, cache_dir=cache_dir, ttl=60)
+    assert len(master_server.requests) == 1
+
+    # Past the TTL it revalidates with the stored validators and gets a 304
+    path, revalidated = app.fetch_master_cached(master_server.url, cache_dir=cache_dir, ttl=0)
+    assert len(master_server.requests) == 2
+    assert master_server.requests[-1]["If-None-Match"] == meta["etag"]
+    assert revalidated["fetched_at"] == meta["fetched_at"]
+    assert revalidated["checked_at"] >= meta["checked_at"]
+    assert open(path, "rb").read() == MASTER_CSV
+
+
+def test_fetch_replaces_body_when_master_changes(app, master_server, tmp_path):
+    master_server.publish(MASTER_CSV)
+    app.fetch_master_cached(master_server.url, cache_dir=str(tmp_path), ttl=0)
+
+    updated = MASTER_CSV + b"33010100103,Salem,4\n"
+    master_server.publish(updated)
+    path, meta = app.fetch_master_cached(master_server.url, cache_dir=str(tmp_path), ttl=0)
+
+    assert open(path, "rb").read() == updated
+    with open(os.path.splitext(path)[0] + ".json", "r", encoding="utf-8") as fh:
+        assert json.load(fh)["size"] == len(updated)
+
+
+def test_concurrent_cold_start_downloads_once(app, master_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # keep the default cache dir inside tmp_path
+    master_server.publish(MASTER_CSV)
+    master_server.delay = 0.5
+    url = master_server.url + "?cold-start"
+
+    results, errors = [], []
+
+    def load():
+        try:
+            results.append(app.load_online_master(url, ttl=60)[0])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=load) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not errors
+    assert len(master_server.requests) == 1
+    assert all(frame is results[0] for frame in results)
+    assert list(results[0]["District"]) == ["Chennai", "Madurai"]
@@ -0,0 +1,289 @@
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+AGGREGATIONS = ["Sum", "Count", "Distinct Count", "Average", "Min", "Max", "Median", "Std Dev", "First", "Last"]
+
+
+@pytest.fixture(scope="module")
+def master(app):
+    rng = np.random.default_rng(7)
+    n = 2000
+    df = pd.DataFrame({
+        "UDISE": [f"33{i:09d}" for i in range(n)],
+        "District": rng.choice(["Chennai", "Madurai", "Salem"], n),
+        "Block": rng.choice([f"Block {c}" for c in "ABCDEFG"], n),
+        "Management": rng.choice(["Government", "Aided", "Private"], n),
+        "Boys": rng.integers(0, 300, n).astype(str),
+        "Budget": rng.normal(1e5, 3e4, n).round(1).astype(str),
+        "Remarks": rng.choice(["ok", "check", ""], n),
+    })
+    df.loc[rng.choice(n, 100, replace=False), "Boys"] = np.nan
+    df.loc[rng.choice(n, 50, replace=False), "Block"] = np.nan
+    return app.prepare_master(df)
+
+
+@pytest.mark.parametrize("rows, filters", [
+    (["District"], {}),
+    (["District", "Block"], {}),
+    (["Management", "District"], {"District": ["Chennai", "Salem"]}),
+    (["Block"], {"Management": ["Aided"], "District": ["Madurai"]}),
+])
+def test_cube_matches_scan_for_every_aggregation(app, master, rows, filters):
+    cube = app.build_pivot_cube(master)
+    view = master
+    for col, vals in filters.items():
+        view = view[view[col].astype(str).isin(vals)]
+
+    for agg in AGGREGATIONS:
+        agg_map = {"Boys": agg, "Budget": "Sum" if agg in ("First", "Last") else agg}
+        if agg in app.RAW_VALUE_AGGREGATIONS:
+            agg_map["Remarks"] = agg
+        assert app.cube_covers(cube, rows, agg_map, filters)
+        from_cube, source = app.run_pivot(view, rows, agg_map, cube, filters)
+        assert source == "cube"
+        pdt.assert_frame_equal(from_cube, app.pivot_scan(view, rows, agg_map), check_dtype=False,
+                               check_categorical=False, check_exact=False, rtol=1e-9)
+
+
+def test_uncovered_requests_fall_back_to_a_scan(app, master):
+    cube = app.build_pivot_cube(master)
+    view = master.head(10)
+
+    assert app.run_pivot(view, ["District"], {"Boys": "Sum"}, cube, None)[1] == "scan"  # not a filter view
+    assert app.run_pivot(view, ["Remarks"], {"Boys": "Sum"}, cube, {})[1] == "scan"  # not a cube dimension
+    assert app.run_pivot(view, ["District"], {"Remarks": "Sum"}, cube, {})[1] == "scan"  # text measure
+    assert app.run_pivot(view, ["District"], {"Boys": "Sum"}, cube, {"UDISE": ["1"]})[1] == "scan"
+
+
+def test_drill_down_levels_add_up(app, master):
+    cube = app.build_pivot_cube(master)
+    districts = app.pivot_from_cube(cube, ["District"], {"Boys": "Sum"}, {}, with_rows=True)
+    blocks = app.pivot_from_cube(cube, ["Block"], {"Boys": "Sum"}, {"District": ["Salem"]}, with_rows=True)
+
+    salem = districts.set_index("District").loc["Salem"]
+    salem_rows = master[master["District"] == "Salem"]
+    assert salem["Schools"] == len(salem_rows)
+    # Rows without a Block drop out of the Block level, like a groupby
+    assert blocks["Schools"].sum() == salem_rows["Block"].notna().sum()
+    assert blocks["Boys_Sum"].sum() == app.as_numeric(salem_rows.loc[salem_rows["Block"].notna(), "Boys"]).sum()
+
+
+def test_empty_filter_selection(app, master):
+    cube = app.build_pivot_cube(master)
+    result = app.pivot_from_cube(cube, ["District"], {"Boys": "Distinct Count", "Budget": "Median"},
+                                 {"District": ["Nowhere"]})
+    assert result.empty and list(result.columns) == ["District", "Boys_Distinct_Count", "Budget_Median"]
+
+
+def test_pivot_cache_key_covers_the_whole_request(app):
+    key = app.pivot_cache_key("fp", {"District": ["Salem", "Chennai"], "Block": ["A"]}, ["District"], {"Boys": "Sum"})
+
+    assert key == app.pivot_cache_key("fp", {"Block": ["A"], "District": ["Chennai", "Salem"]},
+                                      ["District"], {"Boys": "Sum"})
+    assert key != app.pivot_cache_key("fp", {"District": ["Salem"]}, ["District"], {"Boys": "Sum"})
+    assert key != app.pivot_cache_key("fp", {}, ["District"], {"Boys": "Average"})
+    assert key != app.pivot_cache_key("fp2", {}, ["District"], {"Boys": "Sum"})
+    assert key != app.pivot_cache_key("fp", {}, ["District"], {"Boys": "Sum"}, view_key="rows")
+
+    # A derived value column is keyed by its definition's signature
+    nodes = app.field_nodes({"Ratio": {"type": "custom", "definition": "Boys / 2"}}, [], ["Boys"])
+    changed = app.field_nodes({"Ratio": {"type": "custom", "definition": "Boys / 3"}}, [], ["Boys"])
+    with_ratio = app.pivot_cache_key("fp", {}, ["District"], {"Ratio": "Sum"}, None, app.field_signatures(nodes))
+    assert with_ratio != app.pivot_cache_key("fp", {}, ["District"], {"Ratio": "Sum"}, None,
+                                             app.field_signatures(changed))
+
+
+def test_lru_stats(app):
+    store = app.make_lru_store(4)
+    app.lru_put(store, "k", 1)
+    app.lru_get(store, "k")
+    app.lru_get(store, "k")
+    app.lru_get(store, "other")
+
+    assert app.lru_stats(store) == {"hits": 2, "misses": 1, "entries": 1, "max_entries": 4,
+                                    "hit_rate": pytest.approx(2 / 3)}
+
+
+@pytest.mark.parametrize("use_cube", [False, True])
+def test_rollup_levels_match_separate_pivots(app, master, use_cube):
+    agg_map = {"Boys": "Sum", "Budget": "Std Dev", "UDISE": "Count", "Remarks": "Distinct Count"}
+    agg_map_cube = dict(agg_map, Budget="Average")
+    rows = ["District", "Block"]
+    cube = app.build_pivot_cube(master) if use_cube else None
+    agg = agg_map_cube if use_cube else agg_map
+
+    result = app.pivot_grouping_sets(master, rows, agg, "rollup", cube, {} if use_cube else None)
+
+    detail = result[result["Row_Type"] == "Detail"].drop(columns="Row_Type").reset_index(drop=True)
+    expected = app.pivot_scan(master, rows, agg)
+    pdt.assert_frame_equal(detail, expected.astype({"District": object, "Block": object}), check_dtype=False)
+
+    # Schools without a Block belong to no detail row, so to no subtotal or total either
+    keyed = master[master["Block"].notna()]
+    subtotals = result[result["Row_Type"] == "Subtotal"]
+    assert (subtotals["Block"] == "All").all()
+    by_district = app.pivot_scan(keyed, ["District"], agg)
+    assert subtotals["Boys_Sum"].tolist() == by_district["Boys_Sum"].tolist()
+    assert subtotals["Remarks_Distinct_Count"].tolist() == by_district["Remarks_Distinct_Count"].tolist()
+
+    grand = result[result["Row_Type"] == "Grand Total"].iloc[0]
+    assert grand["Boys_Sum"] == app.as_numeric(keyed["Boys"]).sum()
+    assert grand["UDISE_Count"] == len(keyed)
+    if not use_cube:
+        assert grand["Budget_Std_Dev"] == pytest.approx(app.as_numeric(keyed["Budget"]).std(), abs=0.01)
+
+    # Each District's subtotal follows its detail rows; the grand total comes last
+    assert result["Row_Type"].iloc[-1] == "Grand Total"
+    first_subtotal = result.index[result["Row_Type"] == "Subtotal"][0]
+    assert set(result.loc[:first_subtotal, "District"]) == {result.loc[first_subtotal, "District"]}
+
+
+@pytest.mark.parametrize("mode", ["rollup", "cube"])
+@pytest.mark.parametrize("use_cube", [False, True])
+def test_every_level_adds_up_to_the_grand_total(app, master, mode, use_cube):
+    # Blanks in both grouping columns, so that some rows lack one key and some both
+    view = master.assign(District=master["District"].astype(object))
+    view.loc[view.index[::97], "District"] = np.nan
+    agg_map = {"Boys": "Sum", "UDISE": "Count", "Budget": "Max", "Remarks": "Distinct Count"}
+    cube = app.build_pivot_cube(view) if use_cube else None
+
+    result = app.pivot_grouping_sets(view, ["District", "Block"], agg_map, mode, cube, {} if use_cube else None)
+
+    assert not result[["District", "Block"]].isna().any(axis=None)
+    grand = result[result["Row_Type"] == "Grand Total"].iloc[0]
+    keyed = view[view["District"].notna() & view["Block"].notna()]
+    assert grand["UDISE_Count"] == len(keyed) and grand["Boys_Sum"] == app.as_numeric(keyed["Boys"]).sum()
+    assert grand["Budget_Max"] == app.as_numeric(keyed["Budget"]).max()
+    assert grand["Remarks_Distinct_Count"] == keyed["Remarks"].nunique()
+    for level, rows in result.groupby(["Row_Type", result["District"] == "All", result["Block"] == "All"]):
+        if level[0] != "Grand Total":
+            assert rows["UDISE_Count"].sum() == grand["UDISE_Count"], level
+            assert rows["Boys_Sum"].sum() == grand["Boys_Sum"], level
+            assert rows["Budget_Max"].max() == grand["Budget_Max"], level
+
+
+def test_cube_mode_includes_every_combination(app, master):
+    result = app.pivot_grouping_sets(master, ["District", "Management"], {"Boys": "Sum"}, "cube")
+
+    by_management = result[(result["District"] == "All") & (result["Management"] != "All")]
+    assert by_management["Boys_Sum"].tolist() == app.pivot_scan(master, ["Management"], {"Boys": "Sum"})["Boys_Sum"].tolist()
+    assert len(result) == 3 * 3 + 3 + 3 + 1
+    assert app.grouping_sets(["a", "b"], "cube") == [["a", "b"], ["a"], ["b"], []]
+    assert app.grouping_sets(["a", "b"], "rollup") == [["a", "b"], ["a"], []]
+
+
+@pytest.mark.parametrize("rows", [["District"], ["Block", "Management"], ["Remarks", "District"], []])
+def test_kernel_matches_pandas(app, master, rows):
+    view = master.assign(Remarks=master["Remarks"].astype(object).where(master["Remarks"] != "check"))
+    agg_map = {"Boys": "Sum", "Budget": "Average", "UDISE": "Count", "Remarks": "Distinct Count",
+               "Class": "Min", "Score": "Max"}
+    view = view.assign(Class=np.arange(len(view)) % 13 - 3, Score=np.linspace(-1, 1, len(view)))
+    if "Remarks" in rows:
+        del agg_map["Remarks"]
+
+    pdt.assert_frame_equal(app.pivot_scan(view, rows, agg_map), app.pivot_scan(view, rows, agg_map, use_kernel=False))
+
+    # Mixed requests combine kernel and pandas columns in the requested order
+    mixed = dict(agg_map, Budget="Median")
+    pdt.assert_frame_equal(app.pivot_scan(view, rows, mixed), app.pivot_scan(view, rows, mixed, use_kernel=False))
+
+
+def test_kernel_handles_all_missing_keys(app):
+    df = pd.DataFrame({"District": [np.nan, np.nan], "Boys": [1, 2]})
+    assert app.pivot_scan(df, ["District"], {"Boys": "Sum"}).empty
+
+
+def test_kernel_widens_downcast_and_nullable_values(app):
+    df = pd.DataFrame({
+        "District": ["A", "B", "A", "B"],
+        "Small": np.array([120, 100, 90, -128], dtype=np.int8),
+        "Nullable": pd.array([5, None, 7, 1], dtype="Int64"),
+    })
+    agg_map = {"Small": "Sum", "Nullable": "Min"}
+    result = app.pivot_scan(df, ["District"], agg_map)
+    assert result["Small_Sum"].tolist() == [210, -28]
+    pdt.assert_frame_equal(result, app.pivot_scan(df, ["District"], agg_map, use_kernel=False))
+
+
+@pytest.mark.parametrize("agg_map", [
+    {"Boys": "Sum"},
+    {"Boys": "Average", "Budget": "Median", "Remarks": "Distinct Count", "UDISE": "Count"},
+    {"Budget": "Min", "Boys": "Max"},
+])
+def test_crosstab_matches_long_pivot(app, master, agg_map):
+    # Drop a combination so the grid has an empty cell
+    view = master[~((master["District"] == "Salem") & (master["Management"] == "Aided"))]
+    wide = app.pivot_crosstab(view, ["District", "Block"], "Management", agg_map)
+    long = app.pivot_scan(view, ["District", "Block", "Management"], agg_map)
+    names = list(app.finish_pivot(pd.DataFrame(columns=list(agg_map)), agg_map).columns)
+
+    detail = wide[wide["Row_Type"] == "Detail"]
+    for name in names:
+        label = (lambda m: m) if len(agg_map) == 1 else (lambda m, name=name: f"{name} | {m}")
+        cells = detail.melt(id_vars=["District", "Block"], value_vars=[label(m) for m in ["Aided", "Government", "Private"]],
+                            var_name="Management", value_name=name).dropna(subset=[name])
+        if len(agg_map) > 1:
+            cells["Management"] = cells["Management"].str.split(" | ", regex=False).str[-1]
+        merged = long.astype({"District": object, "Block": object, "Management": object}).merge(
+            cells, on=["District", "Block", "Management"], suffixes=("", "_wide"))
+        assert len(merged) == len(long)
+        np.testing.assert_allclose(merged[name].astype(float), merged[f"{name}_wide"].astype(float))
+
+    # Row totals, column totals and the grand total match pivots without the other dimension
+    keyed = view.dropna(subset=["Block"])
+    total_label = "Total" if len(agg_map) == 1 else f"{names[0]} | Total"
+    by_rows = app.pivot_scan(keyed, ["District", "Block"], agg_map)
+    np.testing.assert_allclose(detail[total_label].astype(float), by_rows[names[0]].astype(float))
+    grand_row = wide[wide["Row_Type"] == "Grand Total"].iloc[0]
+    by_mgmt = app.pivot_scan(keyed, ["Management"], agg_map)
+    for _, row in by_mgmt.iterrows():
+        col = row["Management"] if len(agg_map) == 1 else f"{names[0]} | {row['Management']}"
+        assert grand_row[col] == pytest.approx(row[names[0]])
+    assert grand_row[total_label] == pytest.approx(app.pivot_scan(keyed, [], agg_map)[names[0]].iloc[0])
+    assert grand_row["District"] == "Total"
+
+
+def test_crosstab_marks_empty_cells_missing(app, master):
+    view = master[~((master["District"] == "Salem") & (master["Management"] == "Aided"))]
+    wide = app.pivot_crosstab(view, ["District"], "Management", {"Boys": "Sum", "UDISE": "Count"})
+    salem = wide[wide["District"] == "Salem"].iloc[0]
+    assert pd.isna(salem["Boys_Sum | Aided"])
+    assert salem["UDISE_Count | Aided"] == 0
+
+
+def test_crosstab_rejects_high_cardinality_columns(app, master):
+    with pytest.raises(ValueError, match="at most"):
+        app.pivot_crosstab(master, ["District"], "UDISE", {"Boys": "Sum"})
+
+
+@pytest.mark.parametrize("rows", [["District"], ["Block", "Management"], []])
+def test_parallel_matches_serial(app, master, pool, rows):
+    agg_map = dict(zip(["Boys", "Budget", "UDISE", "Remarks", "Class", "Score", "Median", "First", "Last", "Std"],
+                       AGGREGATIONS))
+    view = master.assign(Class=master["Boys"], Score=master["Budget"], Median=master["Budget"],
+                         First=master["Remarks"].where(master["Remarks"] != "ok"), Last=master["Boys"],
+                         Std=master["Budget"])
+    parallel = app.pivot_parallel(view, rows, agg_map, pool, n_shards=3)
+    pdt.assert_frame_equal(parallel, app.pivot_scan(view, rows, agg_map), check_exact=True)
+    assert parallel["Boys_Sum"].dtype == np.int64
+
+
+def test_parallel_float_sums_are_bit_identical(app, pool):
+    # Row by row, each 1.0 is lost against 1e16; summed per shard first they would survive
+    ratio = np.zeros(30)
+    ratio[0], ratio[10:20], ratio[20] = 1e16, 1.0, -1e16
+    view = pd.DataFrame({"District": ["Chennai"] * 30, "Ratio": ratio})
+    for agg in ("Sum", "Average", "Std Dev"):
+        serial = app.pivot_scan(view, ["District"], {"Ratio": agg})
+        pdt.assert_frame_equal(app.pivot_parallel(view, ["District"], {"Ratio": agg}, pool, n_shards=3), serial,
+                               check_exact=True)
+
+
+def test_sparse_keys_fall_back_to_sorting(app, master, pool, monkeypatch):
+    agg_map = {"Boys": "Median", "Remarks": "Distinct Count", "Budget": "Sum"}
+    expected = app.pivot_scan(master, ["District", "Block"], agg_map)
+    monkeypatch.setattr(app, "KERNEL_DENSE_SLOTS", 0)
+    pdt.assert_frame_equal(app.pivot_scan(master, ["District", "Block"], agg_map), expected)
+    pdt.assert_frame_equal(app.pivot_parallel(master, ["District", "Block"], agg_map, pool, n_shards=2), expected)
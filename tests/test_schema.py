@@ -0,0 +1,31 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+
+def load_csv(app, text):
+    return app.prepare_master(app.read_table(io.StringIO(text), "master.csv"))
+
+
+def test_integer_columns_with_gaps_stay_integers(app):
+    df = load_csv(app, "UDISE,Teachers\n33010100101,13\n33010100102,\n33010100103,7\n")
+
+    assert str(df["Teachers"].dtype) == "Int8"
+    assert df.attrs["schema"]["Teachers"] == "int"
+    assert df.to_csv(index=False).splitlines()[1:] == ["33010100101,13", "33010100102,", "33010100103,7"]
+    assert list(app.build_filter_index(df, ["Teachers"])["Teachers"]["counts"]) == ["13", "7"]
+    assert app.as_numeric(df["Teachers"]).tolist() == [13, 0, 7]
+
+
+def test_schema_types_counts_categories_and_ids(app):
+    rows = "\n".join(f"3301010{i:04d},{'Chennai' if i % 2 else 'Salem'},{i % 90},{i * 1000}" for i in range(200))
+    df = load_csv(app, "UDISE,District,Class1_Boys,Budget\n" + rows + "\n")
+
+    assert df.attrs["schema"]["UDISE"] == "text"
+    assert not pd.api.types.is_numeric_dtype(df["UDISE"])
+    assert isinstance(df["District"].dtype, pd.CategoricalDtype)
+    assert df["Class1_Boys"].dtype == np.int8
+    assert df["Budget"].dtype == np.int32
+    # Arithmetic on the downcast storage must not wrap around
+    assert app.safe_numeric_sum(df, ["Class1_Boys", "Class1_Boys"]).max() == 2 * 89
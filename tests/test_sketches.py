@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+
+@pytest.fixture(scope="module")
+def frame():
+    rng = np.random.default_rng(3)
+    n = 60_000
+    return pd.DataFrame({
+        "District": rng.choice(["Chennai", "Madurai", "Salem", "Vellore"], n),
+        "UDISE": rng.integers(0, 20_000, n).astype(str),
+        "Boys": rng.integers(0, 400, n),
+        "Budget": np.where(rng.random(n) < 0.1, 0.0, rng.normal(5e4, 4e4, n)),
+    })
+
+
+@pytest.mark.parametrize("cardinality", [1, 50, 2_000, 200_000])
+def test_hll_estimates_within_error_bound(app, cardinality):
+    hashes, _ = app.value_hashes(pd.Series(np.arange(cardinality)))
+    registers = app.hll_registers(hashes, np.zeros(cardinality, dtype=np.int64), 1)
+    standard_error = 1.04 / np.sqrt(1 << app.HLL_PRECISION)
+    assert abs(app.hll_estimate(registers)[0] / cardinality - 1) < 3 * standard_error
+
+
+def test_sketches_merge_to_the_whole(app, frame):
+    gid = frame["District"].factorize(sort=True)[0]
+    hashes, _ = app.value_hashes(frame["UDISE"])
+    values = frame["Budget"].to_numpy()
+    halves = [slice(0, 25_000), slice(25_000, None)]
+
+    merged = np.maximum.reduce([app.hll_registers(hashes[h], gid[h], 4) for h in halves])
+    np.testing.assert_array_equal(merged, app.hll_registers(hashes, gid, 4))
+
+    whole = app.quantile_sketch(values, gid, 4)
+    parts = app.merge_quantile_sketches([app.quantile_sketch(values[h], gid[h], 4) for h in halves], 4)
+    for key in ("group", "key", "n"):
+        np.testing.assert_array_equal(parts[key], whole[key])
+
+
+def test_quantile_sketch_is_within_relative_accuracy(app):
+    values = np.array([-250.0, -3.5, 0.0, 0.0, 1e-3, 7.25, 12.0, 980.0, 1e6])
+    gid = np.zeros(len(values), dtype=np.int64)
+    sketch = app.quantile_sketch(values, gid, 2)
+    for q in (0.0, 0.25, 0.5, 0.9, 1.0):
+        expected = np.quantile(values, q)
+        estimate = app.quantile_estimate(sketch, 2, q)
+        assert estimate[0] == pytest.approx(expected, rel=app.QUANTILE_ACCURACY, abs=1e-12)
+        assert np.isnan(estimate[1])  # a group without values
+
+
+def test_sketched_pivot_keeps_exact_columns(app, frame):
+    agg_map = {"UDISE": "Distinct Count", "Boys": "Sum", "Budget": "Median"}
+    approx = app.pivot_sketched(frame, ["District"], agg_map)
+    exact = app.pivot_scan(frame, ["District"], agg_map)
+
+    assert list(approx.columns) == list(exact.columns)
+    pdt.assert_frame_equal(approx[["District", "Boys_Sum"]], exact[["District", "Boys_Sum"]])
+    assert np.allclose(approx["UDISE_Distinct_Count"], exact["UDISE_Distinct_Count"], rtol=0.1)
+    assert np.allclose(approx["Budget_Median"], exact["Budget_Median"], rtol=app.QUANTILE_ACCURACY)
+    assert set(approx.attrs["error_bounds"]) == {"UDISE_Distinct_Count", "Budget_Median"}
+
+
+def test_parallel_sketches_match_serial(app, frame, pool):
+    agg_map = {"UDISE": "Distinct Count", "Budget": "Median", "Boys": "Max"}
+    for rows in (["District"], []):
+        serial = app.pivot_sketched(frame, rows, agg_map)
+        parallel = app.pivot_parallel(frame, rows, agg_map, pool, n_shards=3, approximate=True)
+        pdt.assert_frame_equal(parallel, serial)
+        assert parallel.attrs["error_bounds"] == serial.attrs["error_bounds"]
@@ -0,0 +1,78 @@
+import json
+import os
+
+import pandas as pd
+
+
+MASTER_CSV = "UDISE,District,Class1_Boys\n33010100101,Chennai,12\n33010100102,Madurai,7\n"
+
+
+def counting(monkeypatch, app, name):
+    calls = []
+    original = getattr(app, name)
+
+    def wrapper(*args, **kwargs):
+        calls.append(args)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(app, name, wrapper)
+    return calls
+
+
+def write_master(path, text, mtime):
+    with open(path, "w", encoding="utf-8") as fh:
+        fh.write(text)
+    os.utime(path, (mtime, mtime))
+
+
+def test_snapshot_is_reused_while_the_source_is_unchanged(app, tmp_path, monkeypatch):
+    path, snapshot_dir = str(tmp_path / "master.csv"), str(tmp_path / "snapshots")
+    write_master(path, MASTER_CSV, 1000)
+    builds = counting(monkeypatch, app, "prepare_master")
+
+    first = app.load_master_snapshot(path, snapshot_dir)
+    assert len(builds) == 1
+    assert all(os.path.exists(p) for p in app.snapshot_paths(path, snapshot_dir))
+
+    hashes = counting(monkeypatch, app, "file_sha256")
+    second = app.load_master_snapshot(path, snapshot_dir)
+    assert len(builds) == 1 and not hashes  # size and mtime agree: no parse, no hash
+    pd.testing.assert_frame_equal(second, first)
+    assert second.attrs["schema"] == first.attrs["schema"]
+    assert second.attrs["fingerprint"] == first.attrs["fingerprint"]
+
+
+def test_same_size_edit_rebuilds_the_snapshot(app, tmp_path, monkeypatch):
+    path, snapshot_dir = str(tmp_path / "master.csv"), str(tmp_path / "snapshots")
+    write_master(path, MASTER_CSV, 1000)
+    app.load_master_snapshot(path, snapshot_dir)
+    builds = counting(monkeypatch, app, "prepare_master")
+
+    edited = MASTER_CSV.replace("Chennai,12", "Chennai,19")
+    assert len(edited) == len(MASTER_CSV)
+    write_master(path, edited, 2000)
+    df = app.load_master_snapshot(path, snapshot_dir)
+
+    assert len(builds) == 1
+    assert df["Class1_Boys"].tolist() == [19, 7]
+    with open(app.snapshot_paths(path, snapshot_dir)[1], "r", encoding="utf-8") as fh:
+        assert json.load(fh)["mtime"] == 2000
+    assert app.load_master_snapshot(path, snapshot_dir)["Class1_Boys"].tolist() == [19, 7]
+    assert len(builds) == 1
+
+
+def test_touch_without_edit_keeps_the_snapshot(app, tmp_path, monkeypatch):
+    path, snapshot_dir = str(tmp_path / "master.csv"), str(tmp_path / "snapshots")
+    write_master(path, MASTER_CSV, 1000)
+    app.load_master_snapshot(path, snapshot_dir)
+    builds = counting(monkeypatch, app, "prepare_master")
+    hashes = counting(monkeypatch, app, "file_sha256")
+
+    os.utime(path, (2000, 2000))
+    df = app.load_master_snapshot(path, snapshot_dir)
+    assert not builds and len(hashes) == 1  # the content hash vouches for the snapshot
+    assert df["Class1_Boys"].tolist() == [12, 7]
+
+    # The new mtime is recorded, so the next load skips the hash
+    app.load_master_snapshot(path, snapshot_dir)
+    assert not builds and len(hashes) == 1
@@ -0,0 +1,60 @@
+import os
+
+import pandas as pd
+
+
+def write_master(path, n_rows=57):
+    districts = ["Chennai", "Madurai", "Salem"]
+    rows = [f"{' ' if i % 5 == 0 else ''}3301010{i:04d},{districts[i % 3]},{'Govt' if i % 4 else 'Private'},{i % 40}"
+            for i in range(n_rows)]
+    with open(path, "w", encoding="utf-8") as fh:
+        fh.write("UDISE, District,Management,Class1_Boys\n" + "\n".join(rows) + "\n")
+
+
+def test_stream_csv_matches_a_full_read(app, tmp_path):
+    path = str(tmp_path / "master.csv")
+    write_master(path)
+    codes = [f"3301010{i:04d}" for i in (0, 1, 3, 4, 5, 10, 11, 15, 25, 56, 99)]
+    progress = []
+
+    df = app.stream_csv(path, filters={"District": ["Chennai", "Salem"], "Management": ["Govt"]},
+                        udise_col="UDISE", udise_codes=codes, usecols=["UDISE", "Class1_Boys"],
+                        chunksize=7, progress=lambda *args: progress.append(args))
+
+    full = pd.read_csv(path, dtype=str)
+    full.columns = full.columns.str.strip()
+    mask = (full["District"].isin(["Chennai", "Salem"]) & full["Management"].eq("Govt")
+            & full["UDISE"].str.strip().isin(codes))
+    expected = app.prepare_master(full.loc[mask, ["UDISE", "Class1_Boys"]].reset_index(drop=True))
+    pd.testing.assert_frame_equal(df, expected)
+    assert df["UDISE"].str.strip().tolist() == [f"3301010{i:04d}" for i in (3, 5, 11, 15)]
+
+    assert len(progress) == 9  # ceil(57 / 7) chunks
+    assert [p[1] for p in progress] == [min(7 * (i + 1), 57) for i in range(9)]
+    assert progress[-1] == (1.0, 57, len(df))
+    assert all(a[0] <= b[0] and a[2] <= b[2] for a, b in zip(progress, progress[1:]))
+
+
+def test_stream_csv_keeps_the_columns_when_nothing_matches(app, tmp_path):
+    path = str(tmp_path / "master.csv")
+    write_master(path)
+
+    df = app.stream_csv(path, filters={"District": ["Nowhere"]}, chunksize=10)
+    assert df.empty and df.columns.tolist() == ["UDISE", "District", "Management", "Class1_Boys"]
+
+
+def test_scan_csv_values_counts_one_column_and_caches_by_mtime(app, tmp_path):
+    app.scan_csv_values.clear()
+    path = str(tmp_path / "master.csv")
+    write_master(path)
+    os.utime(path, (1000, 1000))
+
+    counts = app.scan_csv_values(path, 1000.0, "District", chunksize=5)
+    assert counts == {"Chennai": 19, "Madurai": 19, "Salem": 19}
+    assert list(counts) == sorted(counts)
+
+    # Same mtime: served from the cache without reading the file again
+    write_master(path, n_rows=3)
+    assert app.scan_csv_values(path, 1000.0, "District", chunksize=5) == counts
+    # A new mtime rescans
+    assert app.scan_csv_values(path, 2000.0, "District", chunksize=5) == {"Chennai": 1, "Madurai": 1, "Salem": 1}
@@ -0,0 +1,67 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+
+class Upload(io.BytesIO):
+    def __init__(self, name, data):
+        super().__init__(data)
+        self.name = name
+
+
+MASTER_CODES = ["33010100101", "033010100102", "33010100103", "33010100101", " 33010100104 ", "33010100105"]
+
+
+def test_lookup_returns_rows_in_entered_order(app):
+    index = app.build_udise_index(pd.Series(MASTER_CODES))
+
+    rows, duplicates, unknown = app.lookup_udise(index, ["33010100103", "33010100101", "33010100104"])
+    # A code held by two master rows brings both, in master order
+    assert rows.tolist() == [2, 0, 3, 4]
+    assert duplicates == [] and unknown == []
+
+
+def test_lookup_reports_repeated_and_unknown_codes(app):
+    index = app.build_udise_index(pd.Series(MASTER_CODES))
+
+    rows, duplicates, unknown = app.lookup_udise(
+        index, ["33010100105", "99999999999", "33010100105", "33010100101", "99999999999"])
+    assert rows.tolist() == [5, 0, 3]  # a code entered twice contributes its rows once
+    assert duplicates == ["33010100105", "99999999999"]
+    assert unknown == ["99999999999"]
+
+    rows, duplicates, unknown = app.lookup_udise(index, [])
+    assert rows.tolist() == [] and duplicates == [] and unknown == []
+
+
+def test_leading_zeros_count_and_float_suffixes_do_not(app):
+    index = app.build_udise_index(pd.Series(MASTER_CODES))
+
+    rows, _, unknown = app.lookup_udise(index, ["33010100102", "033010100102", "33010100105.0", "033010100101"])
+    assert rows.tolist() == [1, 5]
+    assert unknown == ["33010100102", "033010100101"]
+
+    # A code column that was parsed as floats still matches the entered text
+    index = app.build_udise_index(pd.Series([33010100101.0, np.nan, 33010100103.0]))
+    rows, _, unknown = app.lookup_udise(index, ["33010100103", "33010100101"])
+    assert rows.tolist() == [2, 0] and unknown == []
+
+
+def test_read_code_list_from_uploads(app):
+    text = Upload("codes.txt", "\ufeff33010100103, 33010100101\r\n\n033010100102\n".encode("utf-8"))
+    assert app.read_code_list(text) == ["33010100103", "33010100101", "033010100102"]
+
+    csv = Upload("codes.csv", b"Name,UDISE Code\nA,033010100102\nB,\nC, 33010100105 \n")
+    assert app.read_code_list(csv) == ["033010100102", "33010100105"]
+
+    buffer = io.BytesIO()
+    pd.DataFrame({"School": ["A", "B"], "Value": [33010100101, 33010100103]}).to_excel(buffer, index=False)
+    codes = app.read_code_list(Upload("codes.xlsx", buffer.getvalue()))
+    assert codes == ["A", "B"]  # no UDISE column: the first column is used
+
+    buffer = io.BytesIO()
+    pd.DataFrame({"udise": [33010100101, 33010100103]}).to_excel(buffer, index=False)
+    codes = app.read_code_list(Upload("codes.xlsx", buffer.getvalue()))
+    index = app.build_udise_index(pd.Series(MASTER_CODES))
+    assert app.lookup_udise(index, codes)[0].tolist() == [0, 3, 2]
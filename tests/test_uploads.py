@@ -0,0 +1,54 @@
+import io
+import os
+
+
+class Upload(io.BytesIO):
+    def __init__(self, name, data):
+        super().__init__(data)
+        self.name = name
+
+
+def test_spooled_uploads_are_evicted_with_their_snapshots(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "UPLOAD_CACHE_MAX_FILES", 2)
+    cache_dir = str(tmp_path)
+    snapshot_dir = os.path.join(cache_dir, "snapshots")
+
+    paths = []
+    for i in range(2):
+        path = app.spool_upload(Upload("master.csv", f"UDISE,Boys\n3301,{i}\n".encode()), cache_dir)
+        app.load_master_snapshot(path, snapshot_dir)
+        os.utime(path, (1000 + i, 1000 + i))
+        paths.append(path)
+
+    # Re-using the first upload makes it the most recently used one
+    assert app.spool_upload(Upload("master.csv", b"UDISE,Boys\n3301,0\n"), cache_dir) == paths[0]
+    newest = app.spool_upload(Upload("other.csv", b"UDISE,Boys\n3302,9\n"), cache_dir)
+
+    remaining = sorted(os.listdir(os.path.join(cache_dir, "uploads")))
+    assert remaining == sorted(os.path.basename(p) for p in (paths[0], newest))
+    assert not any(os.path.exists(p) for p in app.snapshot_paths(paths[1], snapshot_dir))
+    assert all(os.path.exists(p) for p in app.snapshot_paths(paths[0], snapshot_dir))
+
+
+def test_upload_cache_respects_size_limit(app, tmp_path):
+    cache_dir = str(tmp_path)
+    kept = app.spool_upload(Upload("big.csv", b"x" * 100), cache_dir)
+    os.utime(kept, (1000, 1000))
+    newest = app.spool_upload(Upload("new.csv", b"y" * 100), cache_dir)
+
+    assert app.evict_spooled_uploads(cache_dir, keep=newest, max_bytes=150) == [kept]
+    assert os.listdir(os.path.join(cache_dir, "uploads")) == [os.path.basename(newest)]
+
+
+def test_respooling_an_upload_reuses_the_shared_master(app, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # snapshots go to the relative default cache dir
+    app._shared_master.clear()
+    data = b"UDISE,Boys\n3301,4\n3302,5\n"
+    path = app.spool_upload(Upload("master.csv", data), str(tmp_path))
+    mtime = os.path.getmtime(path)
+    first = app.load_shared_master(path)
+
+    # A rerun spools the same upload again: the file version, and so the cached frame, stay the same
+    again = app.spool_upload(Upload("master.csv", data), str(tmp_path))
+    assert again == path and os.path.getmtime(path) == mtime
+    assert app.load_shared_master(again) is first
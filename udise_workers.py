@@ -0,0 +1,82 @@
+"""Importable entry point to main.py's helpers, for worker processes and tests.
+
+main.py is a Streamlit script, so importing it would render the whole page.
+load_helpers instead executes only its imports, constants and function
+definitions, which is everything the helpers need. Worker pools start
+processes from a fork server (never by forking the multi-threaded Streamlit
+server), so their tasks must be importable: they are submitted as
+``run(helper_name, *args)``, and each worker loads the helpers once.
+"""
+import ast
+import multiprocessing
+import os
+import sys
+import threading
+import types
+
+MAIN_PY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+_helpers = None
+
+_launch_lock = threading.Lock()
+
+
+def load_helpers():
+    """Return main.py's helper functions and constants as a module object."""
+    with open(MAIN_PY, "r", encoding="utf-8") as fh:
+        tree = ast.parse(fh.read(), MAIN_PY)
+
+    keep = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom, ast.Try, ast.FunctionDef, ast.ClassDef)):
+            keep.append(node)
+        elif isinstance(node, ast.Assign) and all(
+                isinstance(t, ast.Name) and t.id.isupper() for t in node.targets):
+            keep.append(node)
+
+    module = types.ModuleType("udise_helpers")
+    exec(compile(ast.Module(body=keep, type_ignores=[]), MAIN_PY, "exec"), module.__dict__)
+    return module
+
+
+def run(name, *args):
+    """Worker task: call main.py's helper name with args (helpers are loaded on first use)."""
+    global _helpers
+    if _helpers is None:
+        _helpers = load_helpers()
+    return getattr(_helpers, name)(*args)
+
+
+
+if sys.platform != "win32":
+    from multiprocessing.context import ForkServerContext, ForkServerProcess
+
+    class WorkerProcess(ForkServerProcess):
+        """A fork-server process launched with this module standing in as ``__main__``.
+
+        Streamlit installs the page script as ``__main__``, which a new worker
+        would otherwise re-run (as ``__mp_main__``) to rebuild the parent's main
+        module.
+        """
+
+        @staticmethod
+        def _Popen(process_obj):
+            with _launch_lock:
+                main = sys.modules["__main__"]
+                sys.modules["__main__"] = sys.modules[__name__]
+                try:
+                    return ForkServerProcess._Popen(process_obj)
+                finally:
+                    sys.modules["__main__"] = main
+
+    class WorkerContext(ForkServerContext):
+        Process = WorkerProcess
+
+
+def context():
+    """A fork-server context whose workers import only this module; None where unavailable."""
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return None
+    ctx = WorkerContext()
+    ctx.set_forkserver_preload([__name__])
+    return ctx